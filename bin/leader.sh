@@ -7,15 +7,18 @@ set -Eeuo pipefail
 
 export PYTHONPATH=.
 
-# Worker just runs self play
-while true; do
-  python simulator/run.py
-  if [ -e stop_running ]; then
-    exit
-  fi
+# Leader trains continuously and publishes new weights, see lib/ml/trainer.py
+python lib/ml/trainer.py >> training.log &
+
+# Until there is enough data to train on, self play uses the trainer's
+# initial weights. Each game uses the latest published weights.
+while [ ! -e lib/ml/checkpoints/saved_othello_model.latest ]; do
+  sleep 1
+done
 
-  python lib/ml/run.py >> training.log
+while true; do
+  python simulator/run.py -t checkpoints/saved_othello_model.latest checkpoints/saved_othello_model.latest
   if [ -e stop_running ]; then
     exit
   fi
-done
\ No newline at end of file
+done
@@ -7,9 +7,17 @@ set -Eeuo pipefail
 
 export PYTHONPATH=.
 
-# Worker just runs self play
+# Worker just runs self play, once the trainer started by leader.sh has
+# published its first weights
+while [ ! -e lib/ml/checkpoints/saved_othello_model.latest ]; do
+  if [ -e stop_running ]; then
+    exit
+  fi
+  sleep 1
+done
+
 while true; do
-  python simulator/run.py
+  python simulator/run.py -t checkpoints/saved_othello_model.latest checkpoints/saved_othello_model.latest
 
   if [ -e stop_running ]; then
     exit
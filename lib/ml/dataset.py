@@ -0,0 +1,40 @@
+"""
+Training arrays built from self-play records:
+
+    boards       uint64 (N, 2): creator's bitboard, next player's bitboard
+    move_visits  float32 (N, 64)
+    winloss      float32 (N,)
+
+Input planes are unpacked from the bitboards a whole batch at a time, see
+lib.ml.encoding.
+"""
+import numpy as np
+
+BATCH_SIZE = 300
+NUM_WORKERS = 2
+
+
+def records_to_arrays(records):
+    """
+    Converts training records into training arrays.
+    :param records: list: dicts, see lib.ml.records.
+    :return: numpy arrays: boards (N,2) uint64, move_visits (N,64) float32,
+             winloss (N,) float32
+    """
+    created_by = np.array([record["created_by"] for record in records],
+                          dtype=np.int8)
+    bitboards = np.array([record["bitboards"] for record in records],
+                         dtype=np.uint64).reshape(-1, 2)
+
+    # Creator's pieces first, the next player's pieces second
+    creator_is_p1 = created_by == 1
+    boards = np.stack([
+        np.where(creator_is_p1, bitboards[:, 0], bitboards[:, 1]),
+        np.where(creator_is_p1, bitboards[:, 1], bitboards[:, 0]),
+    ], axis=1)
+
+    move_visits = np.array([record["move_visits"] for record in records],
+                           dtype=np.float32).reshape(-1, 64)
+    winloss = np.array([record["winloss"] for record in records],
+                       dtype=np.float32)
+    return boards, move_visits, winloss
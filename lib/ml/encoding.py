@@ -0,0 +1,75 @@
+"""
+Model input encoding, shared by training and inference.
+
+The model sees a position as 2 planes of 0s and 1s: the pieces of the player
+who created the position, then the pieces of the player to move. Planes are
+unpacked straight from bitboards with np.unpackbits, a whole batch at a time.
+Inference writes them into a reusable per-thread float32 buffer, which the
+input tensor then shares memory with, so encoding a batch allocates nothing.
+"""
+import threading
+
+import numpy as np
+
+
+def creator_bitboards(state):
+    """
+    :param state: GameState: represents the state of the game
+    :return: tuple: (creator's bitboard, next player's bitboard)
+    """
+    p1_bits, p2_bits = state.bitboards
+    if state.next_player == 1:
+        return p2_bits, p1_bits
+    return p1_bits, p2_bits
+
+
+def bitboards_to_planes(boards, out=None):
+    """
+    Unpacks bitboards into 0/1 input planes.
+    :param boards: numpy array: uint64 shape (..., 2)
+    :param out: numpy array: float32 shape (..., 2, 8, 8) to write the planes
+           into, or None to allocate one.
+    :return: numpy array: float32 shape (..., 2, 8, 8)
+    """
+    # Bit row * 8 + col lives in byte row, bit col of the little endian value
+    as_bytes = np.ascontiguousarray(boards, dtype="<u8").view(np.uint8)
+    bits = np.unpackbits(as_bytes, axis=-1, bitorder="little")
+    bits = bits.reshape(np.shape(boards) + (8, 8))
+    if out is None:
+        return bits.astype(np.float32)
+    out[...] = bits
+    return out
+
+
+class PlaneBuffer:
+    """
+    Reusable float32 plane arrays, one per thread.
+
+    An array returned by encode is overwritten by the next encode on the same
+    thread, so it must be consumed (evaluated, copied or sent) first.
+    """
+    def __init__(self):
+        self.local = threading.local()
+
+    def get(self, count):
+        """
+        :param count: int: number of positions.
+        :return: numpy array: float32 shape (count,2,8,8), contents undefined.
+        """
+        planes = getattr(self.local, "planes", None)
+        if planes is None or len(planes) < count:
+            # Grow to the next power of 2 so sizes settle quickly
+            planes = np.empty((1 << max(count - 1, 0).bit_length(), 2, 8, 8),
+                              dtype=np.float32)
+            self.local.planes = planes
+        return planes[:count]
+
+    def encode(self, boards):
+        """
+        Encode bitboards into this thread's buffer.
+        :param boards: numpy array or list: uint64 shape (N,2), creator's
+               bitboard first.
+        :return: numpy array: float32 shape (N,2,8,8)
+        """
+        boards = np.asarray(boards, dtype=np.uint64)
+        return bitboards_to_planes(boards, self.get(len(boards)))
@@ -0,0 +1,107 @@
+"""Process-wide cache of model evaluations, shared between symmetric positions."""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from lib.ml.symmetry import inverse, transform
+from lib.montecarlo.bitboard import symmetries
+
+MAX_ENTRIES = 100000
+
+
+def canonical_form(state):
+    """
+    Get the canonical orientation of a state: of the 8 rotations and
+    reflections of its board, the one with the smallest bitboards.
+    :param state: GameState: represents the state of the game
+    :return: tuple: (p1 bitboard, p2 bitboard) in canonical orientation,
+             int: the symmetry that takes the state to it, see
+             lib.ml.symmetry.transform.
+    """
+    p1_bits, p2_bits = state.bitboards
+    boards = list(zip(symmetries(p1_bits), symmetries(p2_bits)))
+    k = min(range(len(boards)), key=boards.__getitem__)
+    return boards[k], k
+
+
+class EvaluationCache:
+    """
+    Bounded cache of network evaluations keyed by model and canonical
+    position.
+
+    Positions that are rotations or reflections of each other share one
+    entry. The policy is stored in the canonical orientation and mapped back
+    to the orientation of the position being looked up. When the cache is
+    full the least recently used entry is replaced.
+    """
+    def __init__(self, max_entries=MAX_ENTRIES):
+        """
+        Initialize the cache.
+        :param max_entries: int: maximum number of cached positions.
+        """
+        self.max_entries = max_entries
+        # (model, next_player, canonical bitboards) -> (value, policy)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Search threads share one cache
+        self.lock = threading.Lock()
+
+    def lookup(self, model, state, form=None):
+        """
+        Get the cached evaluation of a state.
+        :param model: hashable: identifies the model and checkpoint version.
+        :param state: GameState: represents the state of the game
+        :param form: tuple: canonical_form(state), computed if not given.
+        :return: (value, policy) with policy an 8x8 array in the state's own
+                 orientation, or None if the position isn't cached.
+        """
+        boards, k = form if form is not None else canonical_form(state)
+        key = (model, state.next_player, boards)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+        value, policy = entry
+        return value, transform(policy, inverse(k))
+
+    def store(self, model, state, value, policy, form=None):
+        """
+        Cache the evaluation of a state.
+        :param model: hashable: identifies the model and checkpoint version.
+        :param state: GameState: represents the state of the game
+        :param value: float: model value at this state.
+        :param policy: 2D array: 8x8 model policy at this state.
+        :param form: tuple: canonical_form(state), computed if not given.
+        """
+        boards, k = form if form is not None else canonical_form(state)
+        key = (model, state.next_player, boards)
+        entry = (value, np.ascontiguousarray(transform(policy, k)))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        """
+        Fraction of lookups answered from the cache.
+        :return: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        """Drop every cached evaluation and reset the counters."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,194 @@
+"""
+Fast CPU inference for OthelloModel.
+
+optimize_for_inference turns a trained OthelloModel into an InferenceModel
+that computes the same values and policies for search, faster:
+
+    - BatchNorm is folded into the preceding convolution
+    - activations use the channels-last memory format
+    - optionally, the fully connected layers use int8 dynamic quantization and
+      the network runs in bfloat16
+    - the forward pass is traced and frozen with torch.jit
+
+Compare accuracy and speed of the variants against the float32 model:
+
+    $ PYTHONPATH=. python lib/ml/fast_inference.py saved_othello_model.10
+"""
+import copy
+import time
+import warnings
+import statistics
+
+import click
+import numpy as np
+import torch
+import torch.nn as nn
+
+BATCH_SIZES = (1, 8, 32, 128)
+REPEATS = 20
+
+
+def fold_batchnorm(conv, norm):
+    """
+    Fold an eval mode BatchNorm2d into the convolution before it.
+    :param conv: nn.Conv2d
+    :param norm: nn.BatchNorm2d: applied to conv's output.
+    :return: nn.Conv2d: computes norm(conv(x)).
+    """
+    scale = norm.weight / torch.sqrt(norm.running_var + norm.eps)
+    bias = conv.bias if conv.bias is not None \
+        else torch.zeros_like(norm.running_mean)
+
+    folded = copy.deepcopy(conv)
+    folded.weight = nn.Parameter(
+        (conv.weight * scale.reshape(-1, 1, 1, 1)).detach())
+    folded.bias = nn.Parameter(
+        ((bias - norm.running_mean) * scale + norm.bias).detach())
+    return folded
+
+
+class InferenceModel(nn.Module):
+    """
+    An evaluation mode copy of OthelloModel: BatchNorm uses its running
+    statistics and the value head has no dropout. Runs OthelloModel's own
+    forward pass on the copy, so outputs are float32 whatever the precision
+    used inside.
+    """
+    def __init__(self, model, fold=True, dtype=torch.float32,
+                 channels_last=True):
+        """
+        Copy a model for inference. The model itself is not changed.
+        :param model: OthelloModel
+        :param fold: bool: fold BatchNorm into the convolutions.
+        :param dtype: torch dtype: torch.float32 or torch.bfloat16.
+        :param channels_last: bool: use the channels-last memory format.
+        """
+        super(InferenceModel, self).__init__()
+        self.model = copy.deepcopy(model).eval()
+        if fold:
+            for block in self.model.residual_blocks:
+                block.conv1 = fold_batchnorm(block.conv1, block.norm1)
+                block.conv2 = fold_batchnorm(block.conv2, block.norm2)
+                block.norm1 = nn.Identity()
+                block.norm2 = nn.Identity()
+
+        self.dtype = dtype
+        self.memory_format = torch.channels_last if channels_last \
+            else torch.contiguous_format
+        self.to(dtype=dtype, memory_format=self.memory_format)
+        self.eval()
+
+    def forward(self, x):
+        return self.model(x.to(dtype=self.dtype,
+                               memory_format=self.memory_format))
+
+
+def optimize_for_inference(model, fold=True, dtype=torch.float32,
+                           channels_last=True, quantize=False, jit=True):
+    """
+    Make a fast evaluation-only copy of a model.
+    :param model: OthelloModel
+    :param fold: bool: fold BatchNorm into the convolutions.
+    :param dtype: torch dtype: torch.float32 or torch.bfloat16.
+    :param channels_last: bool: use the channels-last memory format.
+    :param quantize: bool: int8 dynamic quantization of the fully connected
+           layers. Only with float32.
+    :param jit: bool: trace and freeze the forward pass.
+    :return: module: called like OthelloModel, returns float32 values (N,)
+             and log policies (N,64).
+    """
+    inference_model = InferenceModel(model, fold, dtype, channels_last)
+    if quantize:
+        inference_model = torch.ao.quantization.quantize_dynamic(
+            inference_model, {nn.Linear}, dtype=torch.qint8)
+    if jit:
+        # torch.jit is deprecated in favour of torch.compile, which needs a
+        # compiler toolchain at run time. Tracing still works everywhere.
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            example = torch.zeros(1, 2, 8, 8)
+            inference_model = torch.jit.freeze(
+                torch.jit.trace(inference_model, example))
+    return inference_model
+
+
+# Variants measured by compare. The baseline is the first entry.
+VARIANTS = {
+    "float32": dict(fold=False, channels_last=False, jit=False),
+    "folded": dict(jit=False),
+    "folded+jit": dict(),
+    "folded+jit+int8": dict(quantize=True),
+    "bfloat16+jit": dict(dtype=torch.bfloat16),
+}
+
+
+def compare(model, planes, variants=VARIANTS, batch_sizes=BATCH_SIZES,
+            repeats=REPEATS):
+    """
+    Measure the accuracy and forward pass latency of inference variants.
+    :param model: OthelloModel
+    :param planes: numpy array: (N,2,8,8) positions to compare outputs on.
+           N must be at least the largest batch size.
+    :param variants: dict: name -> optimize_for_inference keyword arguments.
+           The first variant is the baseline.
+    :param batch_sizes: list: batch sizes to time.
+    :param repeats: int: timed forward passes per batch size.
+    :return: dict: name -> max absolute value error, max absolute policy
+             probability error, batch size -> median seconds per pass.
+    """
+    x_input = torch.as_tensor(planes, dtype=torch.float)
+    results = {}
+    baseline = None
+    for name, options in variants.items():
+        inference_model = optimize_for_inference(model, **options)
+        with torch.no_grad():
+            value, log_policy = inference_model(x_input)
+            if baseline is None:
+                baseline = value, log_policy.exp()
+
+            latency = {}
+            for batch_size in batch_sizes:
+                batch = x_input[:batch_size]
+                # Warm up, the first passes allocate and optimize the graph
+                for _ in range(3):
+                    inference_model(batch)
+                seconds = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    inference_model(batch)
+                    seconds.append(time.perf_counter() - start)
+                latency[batch_size] = statistics.median(seconds)
+
+        results[name] = {
+            "value_error": (value - baseline[0]).abs().max().item(),
+            "policy_error": (log_policy.exp() - baseline[1]).abs().max().item(),
+            "latency": latency,
+        }
+    return results
+
+
+@click.command()
+@click.option("-n", "--positions", default=512, show_default=True,
+              help="Random positions to compare outputs on.")
+@click.argument("model")
+def main(positions, model):
+    # lib.ml.run imports this module
+    from lib.ml.run import load_model
+
+    rng = np.random.RandomState(0)
+    # Random positions with no square occupied twice
+    squares = rng.randint(0, 3, size=(positions, 8, 8))
+    planes = np.stack([squares == 1, squares == 2], axis=1)
+    results = compare(load_model(model), planes)
+
+    print("variant            value err  policy err  " + "  ".join(
+        "batch {:<4d}".format(size) for size in BATCH_SIZES))
+    for name, result in results.items():
+        print("{:17s}  {:9.2e}  {:10.2e}  ".format(
+            name, result["value_error"], result["policy_error"]) + "  ".join(
+            "{:8.2f}ms".format(result["latency"][size] * 1000)
+            for size in BATCH_SIZES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+Inference server shared by self-play workers.
+
+One process owns the model. Workers connect over a Unix socket and send
+encoded positions. The server pools requests from every connected worker
+into batches of up to max_batch positions, waiting at most max_latency
+seconds after the first request of a batch for more to arrive, then runs a
+single forward pass and sends each worker its slice of the results. A request
+that is malformed, or whose batch fails to evaluate, gets an InferenceError
+back instead, raised by the client, and the server keeps serving.
+
+Start a server:
+
+    $ python lib/ml/inference_server.py saved_othello_model.10 --socket /tmp/othello.sock
+
+Use it as a player type with the simulator:
+
+    $ simulator/run.py -t unix:/tmp/othello.sock unix:/tmp/othello.sock
+
+Requests are pickled, so connections are authenticated: server and clients
+share the key in $OTHELLO_INFERENCE_KEY, or else in a key file only its owner
+can read, created by whichever side needs it first.
+"""
+import os
+import time
+import queue
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import click
+import numpy as np
+
+from lib.ml.run import evaluate_planes, get_model
+
+SOCKET_PREFIX = "unix:"
+MAX_BATCH = 256
+MAX_LATENCY = 0.002
+AUTHKEY_ENV = "OTHELLO_INFERENCE_KEY"
+AUTHKEY_PATH = os.path.join(os.path.expanduser("~"), ".othello_inference_key")
+AUTHKEY_BYTES = 32
+
+# Clients opened by connect, keyed by process id and socket path
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class InferenceError(RuntimeError):
+    """A request the server couldn't evaluate. Sent back in place of a result."""
+
+
+def get_authkey(path=AUTHKEY_PATH):
+    """
+    Get the key that authenticates connections to inference servers.
+    :param path: string: key file, created readable by its owner only if it
+           doesn't exist. Not used if $OTHELLO_INFERENCE_KEY is set.
+    :return: bytes
+    """
+    if os.environ.get(AUTHKEY_ENV):
+        return os.environ[AUTHKEY_ENV].encode()
+    if not os.path.exists(path):
+        # Write the key under a temporary name and link it into place, so a
+        # process racing to create it never reads a partial key
+        tmp_path = "{}.{}".format(path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as outfile:
+            outfile.write(os.urandom(AUTHKEY_BYTES))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(path, "rb") as infile:
+        return infile.read()
+
+
+class InferenceServer:
+    def __init__(self, model, address, max_batch=MAX_BATCH,
+                 max_latency=MAX_LATENCY, authkey=None):
+        """
+        Initialize the server.
+        :param model: string: model filename, see lib.ml.run.get_model.
+               Rewritten checkpoints are picked up by the model cache.
+        :param address: string: path of the Unix socket to listen on.
+        :param max_batch: int: maximum positions per forward pass.
+        :param max_latency: float: seconds to wait for more requests after
+               the first request of a batch arrives.
+        :param authkey: bytes: key clients must prove they have, see
+               get_authkey by default.
+        """
+        self.model = model
+        self.address = address
+        self.authkey = authkey if authkey is not None else get_authkey()
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+
+        # (connection, planes) for every pending request
+        self.requests = queue.Queue()
+        self.listener = None
+        self.running = False
+        self.ready = threading.Event()
+
+        self.batches = 0
+        self.positions = 0
+
+    def serve_forever(self):
+        """Accept worker connections until close is called."""
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # Load the model before the first request
+        get_model(self.model)
+
+        self.listener = Listener(self.address, family="AF_UNIX",
+                                 authkey=self.authkey)
+        self.running = True
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        self.ready.set()
+
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                # Not one of our workers, nothing it sent is unpickled
+                continue
+            except OSError:
+                break
+            if not self.running:
+                conn.close()
+                break
+            threading.Thread(target=self._read_loop, args=(conn,),
+                             daemon=True).start()
+
+    def close(self):
+        """Stop accepting connections and stop the batching thread."""
+        if not self.running:
+            return
+        self.running = False
+        # Wake the accept call up so serve_forever can return
+        try:
+            Client(self.address, family="AF_UNIX",
+                   authkey=self.authkey).close()
+        except (OSError, AuthenticationError):
+            pass
+        self.listener.close()
+
+    def mean_batch_size(self):
+        """
+        Average number of positions per forward pass so far.
+        :return: float
+        """
+        return self.positions / self.batches if self.batches else 0.0
+
+    def _read_loop(self, conn):
+        """Queue every request sent by one worker."""
+        while self.running:
+            try:
+                planes = conn.recv()
+            except (EOFError, OSError):
+                break
+            error = check_planes(planes)
+            if error is not None:
+                # Clients wait for each reply before sending another
+                # request, so the batching thread isn't sending on conn
+                self._reply(conn, InferenceError(error))
+                continue
+            self.requests.put((conn, planes))
+        conn.close()
+
+    def _reply(self, conn, reply):
+        try:
+            conn.send(reply)
+        except OSError:
+            # The worker went away, nobody is waiting for this result
+            pass
+
+    def _batch_loop(self):
+        """Pool queued requests into batches and evaluate them."""
+        while self.running:
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            count = len(batch[0][1])
+
+            deadline = time.monotonic() + self.max_latency
+            while count < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                count += len(request[1])
+
+            try:
+                values, policies = evaluate_planes(
+                    np.concatenate([planes for _, planes in batch]), self.model
+                )
+            except Exception as error:
+                # e.g. a checkpoint read while it is rewritten. Fail this
+                # batch's requests and keep serving.
+                print("Batch of {} positions failed: {!r}".format(count, error))
+                for conn, _ in batch:
+                    self._reply(conn, InferenceError(repr(error)))
+                continue
+            self.batches += 1
+            self.positions += count
+
+            offset = 0
+            for conn, planes in batch:
+                end = offset + len(planes)
+                self._reply(conn, (values[offset:end], policies[offset:end]))
+                offset = end
+
+
+class InferenceClient:
+    """
+    Connection to an InferenceServer. Can be passed anywhere a model filename
+    is accepted by the search, see lib.ml.run.evaluate_model_at_gamestates.
+    Threads can share a client, each request waits for the one before it.
+    """
+    def __init__(self, address, authkey=None):
+        """
+        Connect to a server.
+        :param address: string: path of the server's Unix socket.
+        :param authkey: bytes: the server's key, see get_authkey by default.
+        """
+        self.address = address
+        self.conn = Client(address, family="AF_UNIX",
+                           authkey=authkey if authkey is not None
+                           else get_authkey())
+        self.lock = threading.Lock()
+
+    def evaluate(self, planes):
+        """
+        Evaluates the server's model at a batch of encoded positions.
+        :param planes: numpy array: shape (N,2,8,8) of 0s and 1s
+        :return: numpy array: values shape (N,), numpy array: policies shape (N,8,8)
+        :raises InferenceError: the server couldn't evaluate the request.
+        """
+        planes = np.asarray(planes, dtype=np.uint8)
+        # Keep each request and its reply together on the connection
+        with self.lock:
+            self.conn.send(planes)
+            reply = self.conn.recv()
+        if isinstance(reply, InferenceError):
+            raise reply
+        return reply
+
+    def close(self):
+        self.conn.close()
+
+
+def check_planes(planes):
+    """
+    Check a request before it is queued, so one bad request can't fail the
+    batch it would be evaluated in.
+    :param planes: object received from a client.
+    :return: string: what is wrong with the request, or None if it is valid.
+    """
+    if not isinstance(planes, np.ndarray):
+        return "expected a numpy array, got {}".format(type(planes).__name__)
+    if planes.dtype != np.uint8:
+        return "expected uint8 planes, got {}".format(planes.dtype)
+    if planes.ndim != 4 or planes.shape[1:] != (2, 8, 8) or not len(planes):
+        return "expected planes of shape (N,2,8,8), got {}".format(planes.shape)
+    return None
+
+
+def is_server_address(player_type):
+    """
+    Check if a simulator player type names an inference server.
+    :param player_type: string: player type, e.g. "unix:/tmp/othello.sock"
+    :return: bool
+    """
+    return player_type.startswith(SOCKET_PREFIX)
+
+
+def connect(player_type):
+    """
+    Connect to the inference server named by a simulator player type. Each
+    process opens one connection per server and reuses it for every game.
+    :param player_type: string: "unix:" followed by the socket path.
+    :return: InferenceClient
+    """
+    address = player_type[len(SOCKET_PREFIX):]
+    # Connections inherited from a parent process aren't reused
+    key = (os.getpid(), address)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = InferenceClient(address)
+        return _clients[key]
+
+
+@click.command()
+@click.option("-s", "--socket", "address", default="/tmp/othello.sock",
+              show_default=True, help="Unix socket to listen on.")
+@click.option("-b", "--max-batch", default=MAX_BATCH, show_default=True,
+              help="Maximum positions per forward pass.")
+@click.option("-l", "--max-latency-ms", default=MAX_LATENCY * 1000,
+              show_default=True,
+              help="Milliseconds to wait for more requests before evaluating a batch.")
+@click.argument("model")
+def main(address, max_batch, max_latency_ms, model):
+    server = InferenceServer(model, address, max_batch, max_latency_ms / 1000)
+    print("Serving {} on {}".format(model, address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
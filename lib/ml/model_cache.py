@@ -0,0 +1,72 @@
+"""Process-wide cache of loaded Othello models."""
+import os
+import threading
+from collections import OrderedDict
+
+MAX_RESIDENT_MODELS = 4
+
+
+class ModelCache:
+    """
+    Keeps loaded models in memory, keyed by checkpoint path.
+
+    A cached model is reused for as long as the checkpoint's modification time
+    is unchanged. When the leader overwrites a checkpoint the next lookup
+    reloads it. At most max_models models are resident at once, the least
+    recently used model is evicted first.
+    """
+    def __init__(self, loader, max_models=MAX_RESIDENT_MODELS):
+        """
+        Initialize the cache.
+        :param loader: function: takes a checkpoint path, returns a model in
+               eval mode.
+        :param max_models: int: maximum number of resident models.
+        """
+        self.loader = loader
+        self.max_models = max_models
+        # path -> (mtime, model), ordered from least to most recently used
+        self.models = OrderedDict()
+        self.loads = 0
+        # Search threads share one cache. Held while loading, so threads
+        # asking for the same checkpoint load it once.
+        self.lock = threading.Lock()
+
+    def get(self, path, mtime=None):
+        """
+        Get the model stored at path, loading it if it is not cached or the
+        checkpoint changed on disk.
+        :param path: string: path to the checkpoint.
+        :param mtime: float: the checkpoint's modification time, if the caller
+               has already read it. Read from disk if not given.
+        :return: OthelloModel
+        """
+        path = os.path.abspath(path)
+        if mtime is None:
+            mtime = os.path.getmtime(path)
+
+        with self.lock:
+            entry = self.models.get(path)
+            if entry is not None and entry[0] == mtime:
+                self.models.move_to_end(path)
+                return entry[1]
+
+            model = self.loader(path)
+            self.loads += 1
+            self.models[path] = (mtime, model)
+            self.models.move_to_end(path)
+
+            while len(self.models) > self.max_models:
+                self.models.popitem(last=False)
+
+        return model
+
+    def clear(self):
+        """Drop every cached model."""
+        with self.lock:
+            self.models.clear()
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.models
@@ -39,8 +39,9 @@ class OthelloModel(nn.Module):
         # Perform policy convolution to get weights for each move
         policy_output = self.policy_conv(x)
         # Flatten from 4D tensor (BATCH_SIZE * 1 * 8 * 8)
-        # to 2D tensor (BATCH_SIZE * 64)
-        flattened = torch.flatten(policy_output, start_dim=1)
+        # to 2D tensor (BATCH_SIZE * 64). Outputs are float32 whatever
+        # precision the layers run in, see lib.ml.fast_inference.
+        flattened = torch.flatten(policy_output, start_dim=1).float()
         # Extract log(policy probability distribution)
         # This will be an input to loss function.
         # To use to predict probs, must exponentiate
@@ -50,11 +51,13 @@ class OthelloModel(nn.Module):
         # Dropout will sample a subset of neurons to use and drop connections
         # so we arent't overfitting. Can't rely exclusively on one set of weights.
         # http://jmlr.org/papers/volume15/srivastava14a/srivastava14a.pdf
+        # Only while training: in eval mode every neuron is used, so the same
+        # position always gets the same value.
         value = self.fc1(torch.flatten(x, start_dim=1))
-        value = F.dropout(F.relu(value), 0.5)
+        value = F.dropout(F.relu(value), 0.5, self.training)
         value = self.fc2(value)
-        value = F.dropout(F.relu(value), 0.5)
+        value = F.dropout(F.relu(value), 0.5, self.training)
         value = self.fc3(value)
-        value = torch.flatten((torch.tanh(value) + 1) / 2)
+        value = torch.flatten((torch.tanh(value.float()) + 1) / 2)
 
         return value, policy
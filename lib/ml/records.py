@@ -0,0 +1,92 @@
+"""
+Append-only training data records.
+
+Self-play writes one JSON object per line, one line per position:
+
+    {"created_by": 1, "bitboards": [<player 1>, <player 2>],
+     "move_visits": [<64 ints>], "winloss": 1}
+
+Appending a game only writes that game's lines, so the cost of an export does
+not grow with the file. A process killed mid-write leaves at most one partial
+line at the end of the file, which readers skip.
+"""
+import os
+import json
+
+from lib.montecarlo.bitboard import bitboards_from_board
+
+
+def append_records(path, records):
+    """
+    Appends training records to a JSON lines file.
+    :param path: string: path to .jsonl file. Created if it doesn't exist.
+    :param records: list: dicts with created_by, bitboards, move_visits and
+           winloss keys.
+    """
+    lines = "".join(json.dumps(record) + "\n" for record in records)
+    with open(path, "a") as outfile:
+        outfile.write(lines)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+
+def read_records(path):
+    """
+    Reads training records from a JSON lines file or a legacy JSON file.
+    Legacy records store a 2D list board and are converted to bitboards.
+    :param path: string: path to .jsonl or .json file.
+    :return: list: dicts with created_by, bitboards, move_visits and winloss keys.
+    """
+    if path.endswith(".json"):
+        with open(path) as infile:
+            data = json.load(infile)
+        return [
+            {
+                "created_by": example["created_by"],
+                "bitboards": list(bitboards_from_board(example["board"])),
+                "move_visits": example["move_visits"],
+                "winloss": example["winloss"]
+            }
+            for example in data
+        ]
+
+    with open(path) as infile:
+        lines = infile.read().split("\n")
+
+    records = []
+    for i, line in enumerate(lines):
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # A partial last line is left behind if a writer was killed.
+            if i == len(lines) - 1:
+                break
+            raise
+    return records
+
+
+def read_new_records(path, offset=0):
+    """
+    Reads the complete records appended to a JSON lines file since offset.
+    A partial last line is left for the next read. Legacy JSON files are read
+    whole the first time and never again.
+    :param path: string: path to .jsonl or .json file.
+    :param offset: int: bytes of the file already read.
+    :return: list: new records, see read_records. int: offset to read from
+             next time.
+    """
+    if path.endswith(".json"):
+        if offset:
+            return [], offset
+        return read_records(path), os.path.getsize(path)
+
+    with open(path, "rb") as infile:
+        infile.seek(offset)
+        data = infile.read()
+
+    # Only read up to the end of the last complete line
+    end = data.rfind(b"\n") + 1
+    records = [json.loads(line) for line in data[:end].split(b"\n") if line]
+    return records, offset + end
@@ -0,0 +1,244 @@
+"""
+Persistent replay buffer of training positions.
+
+The buffer is a fixed-capacity ring of positions on disk. Every ingest adds
+the records appended to the self-play files since the last ingest as a new
+generation, overwriting the oldest positions once the ring is full:
+
+    boards.npy       uint64 (capacity, 2): creator's bitboard, next player's
+    move_visits.npy  float32 (capacity, 64)
+    winloss.npy      float32 (capacity,)
+    generation.npy   int64 (capacity,): generation each position was added in
+    state.json       size, cursor, generation and bytes read from each file
+
+Files are memory-mapped, so ingesting only writes the new rows and sampling
+only reads the sampled rows. A training cycle costs time proportional to the
+new data plus the number of samples, whatever the capacity.
+"""
+import os
+import glob
+import json
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from lib.ml.dataset import BATCH_SIZE, NUM_WORKERS, records_to_arrays
+from lib.ml.encoding import bitboards_to_planes
+from lib.ml.records import read_new_records
+from lib.ml.symmetry import random_symmetries
+
+REPLAY_DIR = os.path.join(os.path.dirname(__file__), "replay")
+TRAINING_DIR = os.path.join(os.path.dirname(__file__), "training")
+# About 80 training files of 20 games
+REPLAY_CAPACITY = 100000
+# Positions sampled per pass over the buffer
+REPLAY_SAMPLES = 30000
+# Columns of one position, the arrays of lib.ml.dataset plus generation
+REPLAY_FILES = (("boards", np.uint64, (2,)),
+                ("move_visits", np.float32, (64,)),
+                ("winloss", np.float32, ()),
+                ("generation", np.int64, ()))
+
+
+class ReplayBuffer(Dataset):
+    """
+    Fixed-capacity ring of training positions on disk.
+
+    Indexed by a list of indices rather than a single index, so a batch is built
+    with vectorized operations. Use replay_loader to iterate over sampled batches.
+    """
+    def __init__(self, directory=REPLAY_DIR, capacity=REPLAY_CAPACITY,
+                 augment=False):
+        """
+        Open the buffer in directory, creating it if it doesn't exist.
+        :param directory: string: where the buffer is stored.
+        :param capacity: int: positions kept. Ignored when opening an
+               existing buffer.
+        :param augment: bool: show each position in a random rotation or
+               reflection every time it is looked up.
+        """
+        self.directory = directory
+        self.augment = augment
+        state_path = os.path.join(directory, "state.json")
+
+        if os.path.exists(state_path):
+            with open(state_path) as infile:
+                self.state = json.load(infile)
+            mode = "r+"
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.state = {"capacity": capacity, "size": 0, "cursor": 0,
+                          "generation": 0, "files": {}}
+            mode = "w+"
+
+        self.columns = {
+            name: np.lib.format.open_memmap(
+                os.path.join(directory, name + ".npy"), mode=mode,
+                dtype=dtype, shape=(self.capacity,) + shape)
+            for name, dtype, shape in REPLAY_FILES
+        }
+        if mode == "w+":
+            self._save_state()
+
+    @property
+    def capacity(self):
+        return self.state["capacity"]
+
+    @property
+    def generation(self):
+        """
+        :return: int: number of ingests that added positions.
+        """
+        return self.state["generation"]
+
+    def __len__(self):
+        return self.state["size"]
+
+    def _save_state(self):
+        # Write and rename, so the state on disk is always a complete one
+        path = os.path.join(self.directory, "state.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(self.state, outfile)
+        os.replace(tmp_path, path)
+
+    def add(self, records):
+        """
+        Add records to the ring as a new generation.
+        :param records: list: dicts, see lib.ml.records.
+        :return: int: number of positions added.
+        """
+        if not records:
+            return 0
+        boards, move_visits, winloss = records_to_arrays(records)
+        # Only the newest `capacity` positions would survive anyway
+        boards = boards[-self.capacity:]
+        move_visits = move_visits[-self.capacity:]
+        winloss = winloss[-self.capacity:]
+
+        count = len(winloss)
+        rows = (self.state["cursor"] + np.arange(count)) % self.capacity
+        generation = self.state["generation"] + 1
+        self.columns["boards"][rows] = boards
+        self.columns["move_visits"][rows] = move_visits
+        self.columns["winloss"][rows] = winloss
+        self.columns["generation"][rows] = generation
+        for column in self.columns.values():
+            column.flush()
+
+        self.state["cursor"] = int(rows[-1] + 1) % self.capacity
+        self.state["size"] = min(self.state["size"] + count, self.capacity)
+        self.state["generation"] = generation
+        return count
+
+    def ingest(self, paths):
+        """
+        Add the records appended to training files since they were last
+        ingested. Files that haven't changed size aren't opened.
+        :param paths: list: training data files, oldest first.
+        :return: int: number of positions added.
+        """
+        files = self.state["files"]
+        records = []
+        for path in paths:
+            name = os.path.basename(path)
+            offset = files.get(name, 0)
+            if os.path.getsize(path) == offset:
+                continue
+            new_records, files[name] = read_new_records(path, offset)
+            records.extend(new_records)
+
+        count = self.add(records)
+        self._save_state()
+        return count
+
+    def ingest_directory(self, directory=TRAINING_DIR):
+        """
+        Ingest every training file in a directory, oldest first.
+        :param directory: string: self-play output directory.
+        :return: int: number of positions added.
+        """
+        paths = glob.glob(os.path.join(directory, "*"))
+        return self.ingest(sorted(paths, key=os.path.getctime))
+
+    def sample(self, count, recency=None, rng=np.random):
+        """
+        Draw positions with replacement.
+        :param count: int: number of positions.
+        :param recency: float: weight positions by recency ** (generations
+               since they were added), so 0.5 halves the weight of each older
+               generation. None samples uniformly.
+        :param rng: numpy RandomState.
+        :return: numpy array: int64 indices into the buffer.
+        """
+        size = len(self)
+        if not recency:
+            return rng.randint(0, size, size=count).astype(np.int64)
+
+        age = self.generation - self.columns["generation"][:size]
+        weights = np.power(recency, age, dtype=np.float64)
+        return rng.choice(size, size=count, p=weights / weights.sum())
+
+    def __getitem__(self, indices):
+        """
+        Builds a batch of positions.
+        :param indices: list: buffer indices.
+        :return: numpy array: inputs (N,2,8,8), tuple: numpy arrays of
+                 values (N,) and policies (N,64).
+        """
+        # Sorted reads touch each page of the memory-mapped files once
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        planes = bitboards_to_planes(self.columns["boards"][indices])
+        move_visits = self.columns["move_visits"][indices]
+        winloss = self.columns["winloss"][indices]
+        if self.augment:
+            planes, move_visits = random_symmetries(planes, move_visits)
+        return planes, (winloss, move_visits)
+
+
+class ReplaySampler(Sampler):
+    """
+    Batches of buffer indices, freshly sampled on every pass.
+    """
+    def __init__(self, buffer, num_samples, batch_size, recency=None):
+        """
+        :param buffer: ReplayBuffer
+        :param num_samples: int: positions per pass, rounded down to whole
+               batches.
+        :param batch_size: int: positions per batch.
+        :param recency: float: see ReplayBuffer.sample.
+        """
+        self.buffer = buffer
+        self.num_batches = num_samples // batch_size
+        self.batch_size = batch_size
+        self.recency = recency
+
+    def __len__(self):
+        return self.num_batches
+
+    def __iter__(self):
+        indices = self.buffer.sample(self.num_batches * self.batch_size,
+                                     self.recency)
+        return iter(indices.reshape(self.num_batches, self.batch_size))
+
+
+def replay_loader(buffer, num_samples=REPLAY_SAMPLES, batch_size=BATCH_SIZE,
+                  recency=None, num_workers=NUM_WORKERS):
+    """
+    Iterates over batches sampled from a ReplayBuffer. Every pass draws new
+    samples.
+    :param buffer: ReplayBuffer
+    :param num_samples: int: positions per pass.
+    :param batch_size: int: positions per batch.
+    :param recency: float: see ReplayBuffer.sample.
+    :param num_workers: int: worker processes building batches ahead of
+           training. 0 builds batches in the training process.
+    :return: DataLoader: yields (inputs, (values, policies)) tensors.
+    """
+    return DataLoader(buffer,
+                      batch_size=None,
+                      sampler=ReplaySampler(buffer, num_samples, batch_size,
+                                            recency),
+                      num_workers=num_workers,
+                      pin_memory=torch.cuda.is_available())
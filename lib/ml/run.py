@@ -1,15 +1,16 @@
 """Functions to train and test the Othello model."""
 import os
-import glob
-import click
 import numpy as np
 import torch
 import torch.optim as optim
 import torch.nn.functional as F
 
-from lib.montecarlo.util import other_player
 from lib.ml.othello_model import OthelloModel
-from lib.ml.consumer import consume_json_training
+from lib.ml.encoding import PlaneBuffer
+from lib.ml.eval_cache import EvaluationCache, canonical_form
+from lib.ml.fast_inference import optimize_for_inference
+from lib.ml.model_cache import ModelCache
+from lib.ml.symmetry import inverse, symmetric_evaluate, transform
 
 
 # Run on GPU not CPU - uncomment this and add .to(DEVICE) to models when
@@ -22,114 +23,183 @@ NUM_BLOCKS = 6
 BATCH_SIZE = 300
 LEARNING_RATE = 0.0003
 WEIGHT_DECAY = 0.0001
+# Number of random board orientations averaged per evaluation during search.
+# 1 evaluates positions as they are.
+INFERENCE_SYMMETRIES = 1
+# Search evaluates with BatchNorm folded, channels-last and a traced graph.
+# bfloat16 is much faster on CPUs with native support and within about 1e-3 of
+# float32, compare on the target machine with lib/ml/fast_inference.py.
+FAST_INFERENCE = True
+INFERENCE_DTYPE = torch.float32
 
 
 def to_tensor(x):
-    return torch.tensor(x).to(dtype=torch.float)  # Add DEVICE here when running remotely
+    # as_tensor shares memory with numpy arrays and tensors from a DataLoader
+    return torch.as_tensor(x, dtype=torch.float)  # Add DEVICE here when running remotely
 
 
-def train(traning_batches, verbose, model_filename=None):
-    # If we have a saved model, load the model
-    if model_filename:
-        model = load_model(model_filename, train=True)  # Add DEVICE here when running remotely
-    else:
-        model = OthelloModel(NUM_FILTERS, NUM_BLOCKS)  # Add DEVICE here when running remotely
-        # Put this model in train mode
-        model.train()
+def make_optimizer(model):
+    return optim.AdamW(model.parameters(),
+                       lr=LEARNING_RATE,
+                       weight_decay=WEIGHT_DECAY)
 
-    optimizer = optim.AdamW(model.parameters(),
-                            lr=LEARNING_RATE,
-                            weight_decay=WEIGHT_DECAY)
-
-    # 10 passes over the training data
-    epoch = 0
-    while epoch < 10:
-        first = True
-        for board, targets in traning_batches:
-            x_input = to_tensor(board)
-            y_value = to_tensor(targets[0])
-            y_policy = to_tensor(targets[1])
-
-            # Zero the gradients.
-            # Pytorch accumulates these across batches by default, we don't want them
-            optimizer.zero_grad()
-            # Compute model output value and policy
-            yhat_value, yhat_log_policy = model(x_input)
-            # combine value and policy losses. use mean squared error for value prediction; use kl divergence
-            # for policy prediction.
-            # Compute loss for value and policy. Mean squared error for value
-            # prediction, kl divergence for polidy prediction.
-            # note: kl_div() expects log(predictions) but actual probabilities for targets
-            loss1 = F.mse_loss(yhat_value, y_value)
-            loss2 = F.kl_div(yhat_log_policy, y_policy, reduction='batchmean')
-            loss = loss1 + loss2
-            # Print the first batch so we can use it as testing-ish data.
-            if first:
-                if verbose:
-                    print(loss)
-                first = False
-            # Compute gradients: partial derivatives of the loss
-            # with respect to all model weights.
-            loss.backward()
-            # Nudge all weights in the direction of the gradient.
-            optimizer.step()
-
-        epoch += 1
-        if epoch % 10 == 0:
-            filename = "saved_othello_model.{}".format(epoch)
-            torch.save(model.state_dict(), filename)
-            print("saved %s" % filename)
+
+def train_step(model, optimizer, board, targets):
+    """
+    Takes one optimizer step on a batch.
+    :param model: OthelloModel: in train mode.
+    :param optimizer: torch optimizer over the model's parameters.
+    :param board: numpy array or tensor: inputs (N,2,8,8)
+    :param targets: tuple: values (N,) and policies (N,64)
+    :return: tensor: loss before the step
+    """
+    x_input = to_tensor(board)
+    y_value = to_tensor(targets[0])
+    y_policy = to_tensor(targets[1])
+
+    # Zero the gradients.
+    # Pytorch accumulates these across batches by default, we don't want them
+    optimizer.zero_grad()
+    # Compute model output value and policy
+    yhat_value, yhat_log_policy = model(x_input)
+    # combine value and policy losses. use mean squared error for value prediction; use kl divergence
+    # for policy prediction.
+    # Compute loss for value and policy. Mean squared error for value
+    # prediction, kl divergence for polidy prediction.
+    # note: kl_div() expects log(predictions) but actual probabilities for targets
+    loss1 = F.mse_loss(yhat_value, y_value)
+    loss2 = F.kl_div(yhat_log_policy, y_policy, reduction='batchmean')
+    loss = loss1 + loss2
+    # Compute gradients: partial derivatives of the loss
+    # with respect to all model weights.
+    loss.backward()
+    # Nudge all weights in the direction of the gradient.
+    optimizer.step()
+    return loss
 
 
 def _evaluate(x_input, model):
     """
-    Finds weights for a single batch of single batch of size 1.
-    :param x_input: numpy array: shape (1,2,8,8)
-    :return: tensor 1D length 1 [<expected value>], tensor 2D 1x64 [[<log probabilities>]]
+    Finds weights for a single batch of positions.
+    :param x_input: numpy array: shape (N,2,8,8)
+    :return: tensor 1D length N [<expected value>], tensor 2D Nx64 [[<log probabilities>]]
     """
     x_input = to_tensor(x_input)
 
-    # Compute model output value and policy
-    yhat_value, yhat_log_policy = model(x_input)
+    # Compute model output value and policy. No gradients are needed when
+    # evaluating, so skip building the autograd graph.
+    with torch.no_grad():
+        yhat_value, yhat_log_policy = model(x_input)
     return yhat_value, yhat_log_policy
 
 
-def evaluate_model_at_gamestate(gamestate, model):
+def evaluate_planes(x_input, model, mtime=None):
     """
-    Evaluates the model at a given GameState
-    :param gamestate: GameState: represents the state of the game
-    :return: int: value, list: policy
+    Evaluates the model at a batch of encoded positions.
+    :param x_input: numpy array: shape (N,2,8,8), see lib.ml.encoding.
+    :param model: string: model filename
+    :param mtime: float: the checkpoint's modification time, see get_model.
+    :return: numpy array: values shape (N,), numpy array: policies shape (N,8,8)
+    """
+    value, policy = _evaluate(x_input, get_model(model, mtime))
+    value_np = value.detach().numpy()  # value.cpu().detach().numpy() when running remotely
+    policy_np = policy.detach().numpy()  # policy.cpu().detach().numpy() when running remotely
+
+    return value_np, np.exp(policy_np.reshape(-1, 8, 8))
+
+
+def evaluate_canonical(gamestates, evaluate, symmetries, forms=None):
+    """
+    Evaluates each distinct position once, in its canonical orientation, so
+    symmetric positions get the same evaluation whether they are evaluated
+    together, separately or from the cache.
+    :param gamestates: list: GameState objects
+    :param evaluate: function: takes planes (M,2,8,8), returns values (M,) and
+           policies (M,8,8).
+    :param symmetries: int: see symmetric_evaluate.
+    :param forms: list: canonical_form of each state, computed if not given.
+    :return: numpy array: values shape (N,), numpy array: policies shape
+             (N,8,8) in the orientation of each state.
     """
-    # Transform full board into 2 boards of 0s and 1s
-    board = gamestate.board
-    player1_board = np.array([
-        [
-            0 if val == 0 or val == 2 else 1
-            for val in row
-        ]
-        for row in board
+    if forms is None:
+        forms = [canonical_form(state) for state in gamestates]
+    # (next player, canonical bitboards) -> row of the evaluated batch
+    rows = {}
+    positions = []
+    index = []
+    for i, (state, (boards, _)) in enumerate(zip(gamestates, forms)):
+        key = (state.next_player, boards)
+        if key not in rows:
+            rows[key] = len(positions)
+            positions.append(i)
+        index.append(rows[key])
+
+    # Canonical bitboards, creator's first, are the canonical orientation
+    # of the planes
+    x_train = PLANES.encode([
+        forms[i][0][::-1] if gamestates[i].next_player == 1 else forms[i][0]
+        for i in positions
     ])
-    player2_board = np.array([
-        [
-            0 if val == 0 or val == 1 else 1
-            for val in row
-        ]
-        for row in board
+    values, policies = symmetric_evaluate(x_train, evaluate, symmetries)
+    return np.asarray(values)[index], np.stack([
+        transform(policies[row], inverse(k))
+        for row, (_, k) in zip(index, forms)
     ])
 
-    # Player is the player who created this state (NOT next)
-    if other_player(gamestate.next_player) == 1:
-        channels = [player1_board, player2_board]
-    else:
-        channels = [player2_board, player1_board]
 
-    x_train = np.stack(channels).reshape(1, 2, 8, 8)
+def evaluate_model_at_gamestates(gamestates, model, symmetries=None):
+    """
+    Evaluates the model at several GameStates with a single forward pass.
+    :param gamestates: list: GameState objects
+    :param model: string: model filename, or an InferenceClient connected
+           to an inference server.
+    :param symmetries: int: number of random orientations to average each
+           prediction over, evaluated in the same forward pass. Defaults to
+           INFERENCE_SYMMETRIES.
+    :return: numpy array: values shape (N,), numpy array: policies shape (N,8,8)
+    """
+    if symmetries is None:
+        symmetries = INFERENCE_SYMMETRIES
+
+    # Remote models evaluate on the inference server
+    if hasattr(model, "evaluate"):
+        return evaluate_canonical(gamestates, model.evaluate, symmetries)
+
+    # Only positions that aren't cached, or symmetric to a cached position,
+    # go through the model. Rewritten checkpoints get fresh entries. The
+    # checkpoint is read once, for both the cache entries and the model.
+    mtime = os.path.getmtime(os.path.join(os.path.dirname(__file__), model))
+    version = (model, mtime)
+
+    def evaluate(planes):
+        return evaluate_planes(planes, model, mtime)
+
+    # Each state is canonicalized once, for the lookup, the model and the store
+    forms = [canonical_form(state) for state in gamestates]
+    results = [EVALUATION_CACHE.lookup(version, state, form)
+               for state, form in zip(gamestates, forms)]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        values, policies = evaluate_canonical(
+            [gamestates[i] for i in missing], evaluate, symmetries,
+            [forms[i] for i in missing])
+        for i, value, policy in zip(missing, values, policies):
+            EVALUATION_CACHE.store(version, gamestates[i], value, policy,
+                                   forms[i])
+            results[i] = (value, policy)
+
+    return np.array([value for value, _ in results]), \
+        np.stack([policy for _, policy in results])
 
-    value, policy = _evaluate(x_train, load_model(model))
-    value_np = value.detach().numpy()  # value.cpu().detach().numpy() when running remotely
-    policy_np = policy.detach().numpy()  # policy.cpu().detach().numpy() when running remotely
 
-    return value_np[0], np.exp(policy_np.flatten().reshape(8, 8))
+def evaluate_model_at_gamestate(gamestate, model):
+    """
+    Evaluates the model at a given GameState
+    :param gamestate: GameState: represents the state of the game
+    :return: int: value, list: policy
+    """
+    values, policies = evaluate_model_at_gamestates([gamestate], model)
+    return values[0], policies[0]
 
 
 def load_model(filename, train=False):
@@ -146,35 +216,34 @@ def load_model(filename, train=False):
     return model
 
 
-def train_from_json(paths, model_filename, verbose):
-    batches = []
-    for path in paths:
-        batches.extend(consume_json_training(path))
-
-    train(batches, verbose, model_filename)
-
-
-@click.command()
-@click.option("-v", "--verbose", is_flag=True, help="Print more output.")
-@click.argument("model", )
-def main(verbose, model):
-    all_training_files = glob.glob(os.path.join(os.path.dirname(__file__), "training", "*"))
-
-    latest_train_files = sorted(
-        all_training_files, key=os.path.getctime, reverse=True
-    )[0:50]
+def load_inference_model(filename):
+    """
+    Load a model for evaluation only, optimized if FAST_INFERENCE is set.
+    :param filename: string: checkpoint filename, relative to lib/ml.
+    :return: module: called like OthelloModel.
+    """
+    model = load_model(filename)
+    if FAST_INFERENCE:
+        return optimize_for_inference(model, dtype=INFERENCE_DTYPE)
+    return model
 
-    if model is None:
-        cont = input("By not specifying a model, you may be overwriting an existing model. "
-                     "Would you like to continue? (yes/no) ")
-        if cont == "yes":
-            train_from_json(latest_train_files, None)
-        else:
-            return
 
-    # Train the given model
-    train_from_json(latest_train_files, model, verbose)
+# Reused input planes of each thread's evaluations.
+PLANES = PlaneBuffer()
+# Models loaded for evaluation, shared by every search in this process.
+MODEL_CACHE = ModelCache(load_inference_model)
+# Evaluations of local models, shared by every search in this process.
+EVALUATION_CACHE = EvaluationCache()
 
 
-if __name__ == '__main__':
-    main()
+def get_model(filename, mtime=None):
+    """
+    Get a model for evaluation, loading it from disk only if it is not cached
+    or the checkpoint has been rewritten since it was loaded.
+    :param filename: string: checkpoint filename, relative to lib/ml.
+    :param mtime: float: the checkpoint's modification time, if the caller
+           has already read it, see ModelCache.get.
+    :return: module: see load_inference_model.
+    """
+    return MODEL_CACHE.get(os.path.join(os.path.dirname(__file__), filename),
+                           mtime)
@@ -0,0 +1,116 @@
+"""
+Symmetries of the Othello board.
+
+An Othello position plays the same after any of the 8 rotations and
+reflections of the square, so a training example can be used in all 8
+orientations, and the model can be evaluated in several orientations and the
+predictions averaged. Symmetry k rotates the board k % 4 quarter turns and
+then, for k >= 4, mirrors it left to right.
+"""
+import numpy as np
+
+SYMMETRIES = 8
+
+
+def transform(boards, k):
+    """
+    Apply symmetry k to a stack of boards.
+    :param boards: numpy array: shape (..., 8, 8)
+    :param k: int: symmetry, 0 to 7. 0 is the identity.
+    :return: numpy array: same shape as boards
+    """
+    boards = np.rot90(boards, k % 4, axes=(-2, -1))
+    if k >= 4:
+        boards = np.flip(boards, axis=-1)
+    return boards
+
+
+def inverse(k):
+    """
+    Get the symmetry that undoes symmetry k.
+    :param k: int: symmetry, 0 to 7.
+    :return: int
+    """
+    # Reflections undo themselves, rotations are undone by the opposite turn
+    if k >= 4:
+        return k
+    return (4 - k) % 4
+
+
+def transform_examples(boards, policies, ks):
+    """
+    Apply a different symmetry to each training example.
+    :param boards: numpy array: shape (N,2,8,8)
+    :param policies: numpy array: shape (N,64) move visits
+    :param ks: numpy array: shape (N,) symmetry for each example.
+    :return: numpy array: boards (N,2,8,8), numpy array: policies (N,64)
+    """
+    policies = policies.reshape(-1, 8, 8)
+    out_boards = np.empty_like(boards)
+    out_policies = np.empty_like(policies)
+    for k in range(SYMMETRIES):
+        selected = ks == k
+        if selected.any():
+            out_boards[selected] = transform(boards[selected], k)
+            out_policies[selected] = transform(policies[selected], k)
+    return out_boards, out_policies.reshape(-1, 64)
+
+
+def random_symmetries(boards, policies, rng=np.random):
+    """
+    Apply a random symmetry to each training example.
+    :param boards: numpy array: shape (N,2,8,8)
+    :param policies: numpy array: shape (N,64) move visits
+    :param rng: numpy RandomState or Generator-like with randint.
+    :return: numpy array: boards (N,2,8,8), numpy array: policies (N,64)
+    """
+    ks = rng.randint(0, SYMMETRIES, size=len(boards))
+    return transform_examples(boards, policies, ks)
+
+
+def all_symmetries(boards, values, policies):
+    """
+    Expand training examples into all 8 orientations.
+    :param boards: numpy array: shape (N,2,8,8)
+    :param values: numpy array: shape (N,)
+    :param policies: numpy array: shape (N,64) move visits
+    :return: numpy arrays: boards (8N,2,8,8), values (8N,), policies (8N,64)
+    """
+    policies = policies.reshape(-1, 8, 8)
+    return (
+        np.concatenate([transform(boards, k) for k in range(SYMMETRIES)]),
+        np.tile(values, SYMMETRIES),
+        np.concatenate([
+            transform(policies, k) for k in range(SYMMETRIES)
+        ]).reshape(-1, 64),
+    )
+
+
+def symmetric_evaluate(planes, evaluate, samples, rng=np.random):
+    """
+    Evaluate positions in several random orientations with a single call to
+    evaluate, and average the predictions.
+    :param planes: numpy array: shape (N,2,8,8)
+    :param evaluate: function: takes planes (M,2,8,8), returns values (M,) and
+           policies (M,8,8).
+    :param samples: int: number of orientations, 1 to 8. 1 evaluates the
+           positions as they are.
+    :param rng: numpy RandomState or Generator-like with choice.
+    :return: numpy array: values (N,), numpy array: policies (N,8,8)
+    """
+    if samples <= 1:
+        return evaluate(planes)
+
+    ks = rng.choice(SYMMETRIES, min(samples, SYMMETRIES), replace=False)
+    values, policies = evaluate(
+        np.concatenate([transform(planes, k) for k in ks])
+    )
+
+    count = len(planes)
+    values = np.asarray(values).reshape(len(ks), count).mean(axis=0)
+    # Map each policy back to the original orientation before averaging
+    policies = np.stack([
+        transform(policies[i * count:(i + 1) * count], inverse(k))
+        for i, k in enumerate(ks)
+    ]).mean(axis=0)
+    return values, policies
@@ -0,0 +1,219 @@
+"""
+Long-running trainer.
+
+Trains one model continuously against the replay buffer, instead of starting a
+new process and optimizer every leader cycle. Training is counted in optimizer
+steps. Every publish_every steps the trainer ingests new self-play data and
+writes, in lib/ml/checkpoints/:
+
+    trainer.pt                   model and optimizer state, and the step, to
+                                 resume from
+    saved_othello_model.<step>   the model weights at that step
+    saved_othello_model.latest   a copy of the newest weights
+
+Every file is written under a temporary name and renamed into place, so a
+reader never sees a partial checkpoint. Self-play workers playing with
+checkpoints/saved_othello_model.latest pick up new weights without
+restarting, see lib.ml.model_cache.
+
+    $ PYTHONPATH=. python lib/ml/trainer.py --publish-every 500
+"""
+import os
+import time
+
+import click
+import torch
+
+from lib.ml.othello_model import OthelloModel
+from lib.ml.replay_buffer import ReplayBuffer, replay_loader
+from lib.ml.run import BATCH_SIZE, NUM_BLOCKS, NUM_FILTERS, make_optimizer, \
+    train_step
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), "checkpoints")
+TRAINER_CHECKPOINT = "trainer.pt"
+MODEL_PREFIX = "saved_othello_model."
+LATEST_MODEL = MODEL_PREFIX + "latest"
+PUBLISH_EVERY = 1000
+# Published versions kept on disk, older ones are deleted
+KEEP_VERSIONS = 5
+# Positions the replay buffer must hold before training starts
+MIN_POSITIONS = 5000
+# Seconds to wait for self-play data when the buffer is too small
+POLL_SECONDS = 30
+# Created by bin/stop.sh
+STOP_FILE = "stop_running"
+
+
+def atomic_save(obj, path):
+    """
+    torch.save to a temporary file and rename it into place.
+    :param obj: object to save.
+    :param path: string: destination path.
+    """
+    tmp_path = path + ".tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class Trainer:
+    """
+    A model and its optimizer, trained by step count and checkpointed
+    together.
+    """
+    def __init__(self, checkpoint_dir=CHECKPOINT_DIR, model_filename=None):
+        """
+        Resume from the trainer checkpoint in checkpoint_dir if there is one,
+        otherwise start from model_filename or from a new model.
+        :param checkpoint_dir: string: where checkpoints are written.
+        :param model_filename: string: weights to start from, relative to
+               lib/ml. Ignored when resuming.
+        """
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+        # Add DEVICE here when running remotely
+        self.model = OthelloModel(NUM_FILTERS, NUM_BLOCKS)
+        self.optimizer = make_optimizer(self.model)
+        self.step = 0
+
+        path = os.path.join(checkpoint_dir, TRAINER_CHECKPOINT)
+        if os.path.exists(path):
+            # Remove map_location="cpu" when running remotely.
+            checkpoint = torch.load(path, map_location="cpu")
+            self.model.load_state_dict(checkpoint["model"])
+            self.optimizer.load_state_dict(checkpoint["optimizer"])
+            self.step = checkpoint["step"]
+        elif model_filename:
+            path = os.path.join(os.path.dirname(__file__), model_filename)
+            self.model.load_state_dict(torch.load(path, map_location="cpu"))
+        self.model.train()
+
+    def model_path(self, version):
+        """
+        :param version: int or string: step, or "latest".
+        :return: string: path of a published model.
+        """
+        return os.path.join(self.checkpoint_dir, MODEL_PREFIX + str(version))
+
+    def train_steps(self, batches, steps):
+        """
+        Take optimizer steps, cycling over batches as often as needed.
+        :param batches: iterable: (inputs, (values, policies)) batches. Every
+               pass over it may yield different batches, see replay_loader.
+        :param steps: int: number of steps.
+        :return: float: mean loss over the steps.
+        """
+        total = 0.0
+        done = 0
+        while done < steps:
+            passed = done
+            for board, targets in batches:
+                total += train_step(self.model, self.optimizer, board,
+                                    targets).item()
+                done += 1
+                if done == steps:
+                    break
+            # Cycling over batches again would never take a step
+            if done == passed:
+                raise ValueError("No batches to train on.")
+        self.step += done
+        return total / max(done, 1)
+
+    def save(self):
+        """Write the model, optimizer and step to resume from."""
+        atomic_save({
+            "step": self.step,
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+        }, os.path.join(self.checkpoint_dir, TRAINER_CHECKPOINT))
+
+    def publish(self):
+        """
+        Publish the current weights as version self.step and as the latest
+        model, and delete all but the newest KEEP_VERSIONS versions.
+        :return: string: path of the published version.
+        """
+        state_dict = self.model.state_dict()
+        path = self.model_path(self.step)
+        atomic_save(state_dict, path)
+        atomic_save(state_dict, self.model_path("latest"))
+
+        versions = sorted(
+            int(name[len(MODEL_PREFIX):])
+            for name in os.listdir(self.checkpoint_dir)
+            if name.startswith(MODEL_PREFIX)
+            and name[len(MODEL_PREFIX):].isdigit()
+        )
+        for version in versions[:-KEEP_VERSIONS]:
+            os.remove(self.model_path(version))
+        return path
+
+    def run(self, buffer, total_steps=None, publish_every=PUBLISH_EVERY,
+            recency=None, min_positions=MIN_POSITIONS, verbose=False):
+        """
+        Train until total_steps, or until STOP_FILE exists.
+        :param buffer: ReplayBuffer
+        :param total_steps: int: step to stop at, None to run until stopped.
+        :param publish_every: int: steps between ingesting new data and
+               publishing.
+        :param recency: float: favour newer positions, see
+               ReplayBuffer.sample.
+        :param min_positions: int: positions needed before training starts.
+        :param verbose: bool: prints more output.
+        """
+        if publish_every < 1:
+            raise ValueError("Publish every 1 step or more.")
+
+        # Workers always have a model to play with
+        if not os.path.exists(self.model_path("latest")):
+            self.publish()
+
+        # Every pass over the loader is one publish interval of new samples
+        batches = replay_loader(buffer, publish_every * BATCH_SIZE,
+                                recency=recency)
+        while total_steps is None or self.step < total_steps:
+            if os.path.exists(STOP_FILE):
+                break
+
+            added = buffer.ingest_directory()
+            if len(buffer) < min_positions:
+                if verbose:
+                    print("waiting for self-play data, buffer holds {}".format(
+                        len(buffer)))
+                time.sleep(POLL_SECONDS)
+                continue
+
+            steps = publish_every
+            if total_steps is not None:
+                steps = min(steps, total_steps - self.step)
+            start = time.monotonic()
+            loss = self.train_steps(batches, steps)
+            path = self.publish()
+            self.save()
+            print("step {} loss {:.4f} ingested {} {:.0f}s published {}".format(
+                self.step, loss, added, time.monotonic() - start,
+                os.path.basename(path)))
+
+
+@click.command()
+@click.option("-v", "--verbose", is_flag=True, help="Print more output.")
+@click.option("--symmetries/--no-symmetries", default=True, show_default=True,
+              help="Train on random rotations and reflections of each position.")
+@click.option("-s", "--steps", type=int, default=None,
+              help="Step to stop at. Runs until bin/stop.sh by default.")
+@click.option("-p", "--publish-every", default=PUBLISH_EVERY, show_default=True,
+              type=click.IntRange(min=1),
+              help="Steps between publishing new weights.")
+@click.option("-r", "--recency", type=float, default=None,
+              help="Weight each older generation of positions by this factor. "
+                   "Samples uniformly by default.")
+@click.option("-m", "--model", default=None,
+              help="Weights to start from when there is no trainer checkpoint.")
+def main(verbose, symmetries, steps, publish_every, recency, model):
+    trainer = Trainer(model_filename=model)
+    trainer.run(ReplayBuffer(augment=symmetries), steps, publish_every,
+                recency, verbose=verbose)
+
+
+if __name__ == '__main__':
+    main()
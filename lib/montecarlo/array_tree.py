@@ -0,0 +1,396 @@
+"""
+The mcts used to identify promising moves, stored as a struct of arrays.
+
+Tree builds one Node object per position. ArrayTree keeps the same statistics
+in flat NumPy arrays indexed by node id, with the children of a node stored in
+one contiguous slice, so selecting a child is a single vectorized PUCT step
+over that slice. A node's GameState is only built when the node is expanded,
+from its parent's state and the move that leads to it.
+"""
+import random
+
+import numpy as np
+
+from lib.ml.run import evaluate_model_at_gamestates
+from lib.montecarlo.budget import SearchBudget
+from lib.montecarlo.game import GameState, Move
+from lib.montecarlo.util import other_player
+from lib.montecarlo.rollout import random_rollout
+from lib.montecarlo.nodes import EXPLORATION
+from lib.montecarlo.tree import VIRTUAL_LOSS
+
+INITIAL_CAPACITY = 1024
+NO_MOVE = -1
+
+
+class ArrayTree:
+    def __init__(self, state, table=None, capacity=INITIAL_CAPACITY,
+                 c=EXPLORATION, fpu=None):
+        """
+        Initialize the tree with a root state.
+        :param state: GameState: root of this tree. Usually the initial board.
+        :param table: TranspositionTable: cached model evaluations shared
+               between transpositions, or None.
+        :param capacity: int: number of nodes allocated up front. Arrays
+               double in size when full.
+        :param c: double: exploration parameter used during selection.
+        :param fpu: double: first play urgency, the value assumed for
+               unvisited children during selection. None scores them as 0.
+        """
+        self.table = table
+        self.c = c
+        self.fpu = fpu
+        self.size = 0
+        self._allocate(capacity)
+
+        root = self._add_nodes(1)
+        self.parent[root] = NO_MOVE
+        self.creator[root] = other_player(state.next_player)
+        self._set_state(root, state)
+
+    def _allocate(self, capacity):
+        self.visit_count = np.zeros(capacity, dtype=np.int32)
+        self.virtual_loss = np.zeros(capacity, dtype=np.int32)
+        self.win_score = np.zeros(capacity, dtype=np.float32)
+        self.prior = np.zeros(capacity, dtype=np.float32)
+        self.parent = np.full(capacity, NO_MOVE, dtype=np.int32)
+        self.first_child = np.full(capacity, NO_MOVE, dtype=np.int32)
+        self.child_count = np.zeros(capacity, dtype=np.int16)
+        # Square (row * 8 + col) of the move that led to this node
+        self.move = np.full(capacity, NO_MOVE, dtype=np.int8)
+        # Player who made that move, i.e. the player who created this state
+        self.creator = np.zeros(capacity, dtype=np.int8)
+        # States are filled in lazily, see state()
+        self.has_state = np.zeros(capacity, dtype=bool)
+        self.p1_bits = np.zeros(capacity, dtype=np.uint64)
+        self.p2_bits = np.zeros(capacity, dtype=np.uint64)
+        self.zobrist = np.zeros(capacity, dtype=np.uint64)
+
+    def _arrays(self):
+        return ("visit_count", "virtual_loss", "win_score", "prior", "parent",
+                "first_child", "child_count", "move", "creator", "has_state",
+                "p1_bits", "p2_bits", "zobrist")
+
+    def _add_nodes(self, count):
+        """
+        Reserve count consecutive node ids, growing the arrays if needed.
+        :return: int: first new node id
+        """
+        first = self.size
+        capacity = len(self.visit_count)
+        if first + count > capacity:
+            new_capacity = max(capacity * 2, first + count)
+            for name in self._arrays():
+                old = getattr(self, name)
+                new = np.zeros(new_capacity, dtype=old.dtype)
+                new[:capacity] = old
+                if name in ("parent", "first_child", "move"):
+                    new[capacity:] = NO_MOVE
+                setattr(self, name, new)
+        self.size += count
+        return first
+
+    def _set_state(self, node, state):
+        self.p1_bits[node] = state.bitboards[0]
+        self.p2_bits[node] = state.bitboards[1]
+        self.zobrist[node] = state.zobrist
+        self.has_state[node] = True
+
+    def state(self, node):
+        """
+        Get the GameState of a node, computing it from the parent's state and
+        the transition move if it hasn't been stored yet.
+        :param node: int: node id
+        :return: GameState
+        """
+        if self.has_state[node]:
+            return GameState(other_player(int(self.creator[node])),
+                             bitboards=(int(self.p1_bits[node]),
+                                        int(self.p2_bits[node])),
+                             zobrist=int(self.zobrist[node]))
+
+        state = self.state(int(self.parent[node])).move(self.transition_move(node))
+        self._set_state(node, state)
+        return state
+
+    def transition_move(self, node):
+        """
+        Get the move that transitioned the parent's state to this node's.
+        :param node: int: node id
+        :return: Move, or None for the root.
+        """
+        square = int(self.move[node])
+        if square == NO_MOVE:
+            return None
+        return Move(square >> 3, square & 7, int(self.creator[node]))
+
+    def children(self, node):
+        """
+        Get the ids of a node's children.
+        :param node: int: node id
+        :return: range
+        """
+        start = int(self.first_child[node])
+        return range(start, start + int(self.child_count[node]))
+
+    def expand(self, node, policy=None):
+        """
+        Attach children for every legal move of a leaf node.
+        :param node: int: node id
+        :param policy: 2D array: 8x8 move probabilities from the model, or None
+               for vanilla mcts (all priors 0).
+        """
+        if self.child_count[node]:
+            raise Exception("Cannot expand an expanded node.")
+
+        state = self.state(node)
+        moves = state.get_legal_moves()
+        if not moves:
+            return
+
+        squares = np.array([move.row * 8 + move.col for move in moves],
+                           dtype=np.int8)
+        first = self._add_nodes(len(moves))
+        children = slice(first, first + len(moves))
+        self.parent[children] = node
+        self.move[children] = squares
+        self.creator[children] = state.next_player
+        if policy is not None:
+            self.prior[children] = np.asarray(policy).reshape(64)[squares]
+
+        self.first_child[node] = first
+        self.child_count[node] = len(moves)
+
+    def promising_child(self, node, c=EXPLORATION, fpu=None):
+        """
+        Use upper confidence bound (UTC) to choose next node to explore, over
+        all of a node's children at once.
+        :param node: int: node id
+        :param c: double: exploration parameter
+        :param fpu: double: first play urgency, see Node.promising_child.
+        :return: int: id of the next node to explore/expand.
+        """
+        start = int(self.first_child[node])
+        children = slice(start, start + int(self.child_count[node]))
+
+        # Virtual losses count as visits that didn't win
+        visits = self.visit_count[children] + self.virtual_loss[children]
+        parent_visits = self.visit_count[node] + self.virtual_loss[node]
+        values = self.win_score[children] / np.maximum(visits, 1)
+        if fpu is not None:
+            values = np.where(visits == 0, fpu, values)
+        # Add 1 to denominator to avoid division by zero
+        weights = values + \
+            c * self.prior[children] * np.sqrt(parent_visits) / (visits + 1)
+        return start + int(np.argmax(weights))
+
+    def select(self):
+        """
+        Select node to expand.
+        :return: int: id of the leaf node to expand.
+        """
+        node = 0
+        # Select promising children using UCB until we reach a leaf node.
+        while self.child_count[node]:
+            node = self.promising_child(node, self.c, self.fpu)
+        return node
+
+    def backpropagate(self, node, game_result):
+        """
+        Updates visit and win values for all nodes in path.
+        :param node: int: node id the simulation ended at.
+        :param game_result: int: result of the game after rollout.
+        """
+        while node != NO_MOVE:
+            self.visit_count[node] += 1
+            # Add to the wins of the player who created this state
+            if game_result == self.creator[node]:
+                self.win_score[node] += 1
+            # Game ended in a Draw
+            elif game_result == 0:
+                self.win_score[node] += 0.5
+            node = int(self.parent[node])
+
+    def add_virtual_loss(self, node, amount):
+        """
+        Adds virtual loss to every node in the path from the root to node.
+        :param node: int: node id
+        :param amount: int: number of virtual visits to add.
+        """
+        while node != NO_MOVE:
+            self.virtual_loss[node] += amount
+            node = int(self.parent[node])
+
+    def best_move(self, num_simulations, model, batch_size=1,
+                  time_budget=None):
+        """
+        Selects the best move.
+        :param num_simulations: int: the maximum number of mcts simulations to
+               run, or None to search until time_budget runs out.
+        :param model: string: model filename, or None to use vanilla mcts
+        :param batch_size: int: number of leaves evaluated per forward pass
+               when searching with a model.
+        :param time_budget: float: maximum seconds to search, or None.
+        :return: int, list: id of the best child of the root, the number of
+                 mcts visits to each square on the board (all possible moves
+                 including illegal). None, None when there is no legal move.
+        """
+        moves = self.state(0).get_legal_moves()
+        # TODO: In future iterations, handle a "pass" move.
+        if not moves:
+            return None, None
+
+        # A forced move doesn't need a search
+        if len(moves) == 1:
+            if not self.child_count[0]:
+                self.expand(0)
+            child = int(self.first_child[0])
+            all_move_visits = [0] * 64
+            all_move_visits[int(self.move[child])] = \
+                max(int(self.visit_count[child]), 1)
+            return child, all_move_visits
+
+        budget = SearchBudget(num_simulations, time_budget)
+        while not budget.exhausted():
+            # Stop once the most visited move can't change
+            children = self.children(0)
+            if children and budget.decided(
+                    self.visit_count[children.start:children.stop]):
+                break
+            if model is None:
+                self._simulate_rollout()
+                budget.add(1)
+            else:
+                budget.add(self._simulate_model_batch(
+                    model, int(min(max(batch_size, 1),
+                                   max(budget.remaining(), 1)))
+                ))
+
+        if not self.child_count[0]:
+            return None, None
+
+        children = self.children(0)
+        visits = self.visit_count[children.start:children.stop]
+
+        # List of size 64, filled with zeros. Represents visits to squares on
+        # the board. Used as part of model training data.
+        all_move_visits = [0] * 64
+        for square, count in zip(self.move[children.start:children.stop], visits):
+            all_move_visits[int(square)] = int(count)
+
+        # Create probability distribution to avoid overfitting
+        dist = visits.astype(float)
+        dist = dist / dist.sum()
+        dist = dist ** 5
+        dist = dist / dist.sum()
+        # Randomly choose a node given probabilities.
+        # Allows us to explore more branches of the tree
+        return children.start + np.random.choice(len(children), p=dist), \
+            all_move_visits
+
+    def _simulate_rollout(self):
+        # Expand this node and choose a random child
+        leaf = self.select()
+        self.expand(leaf)
+        if not self.child_count[leaf]:
+            return
+
+        child = random.choice(self.children(leaf))
+        state = self.state(child)
+        result = random_rollout(state.bitboards[0], state.bitboards[1],
+                                state.next_player)
+        self.backpropagate(child, result)
+
+    def _simulate_model_batch(self, model, batch_size):
+        """
+        Runs up to batch_size simulations with one forward pass.
+        :return: int: number of simulations completed.
+        """
+        completed = 0
+        leaves = []
+        states = []
+        while len(leaves) + completed < batch_size:
+            leaf = self.select()
+            # Virtual loss doesn't guarantee a new leaf. Evaluate what we
+            # have rather than expanding the same leaf twice.
+            if leaf in leaves:
+                break
+            state = self.state(leaf)
+            # Transpositions already in the table don't need the model
+            cached = self.table.lookup(state) \
+                if self.table is not None else None
+            if cached is not None:
+                self.expand(leaf, cached[1])
+                self.backpropagate(leaf, cached[0])
+                completed += 1
+                continue
+            self.add_virtual_loss(leaf, VIRTUAL_LOSS)
+            leaves.append(leaf)
+            states.append(state)
+
+        if not leaves:
+            return completed
+
+        values, policies = evaluate_model_at_gamestates(states, model)
+        for leaf, state, value, policy in zip(leaves, states, values, policies):
+            self.add_virtual_loss(leaf, -VIRTUAL_LOSS)
+            if self.table is not None:
+                self.table.store(state, value, policy)
+            self.expand(leaf, policy)
+            self.backpropagate(leaf, value)
+
+        return completed + len(leaves)
+
+    def find_child(self, node, state):
+        """
+        Find the child of a node that has the given state.
+        :param node: int: node id
+        :param state: GameState: state to look for.
+        :return: int: child id, or None if the state wasn't explored.
+        """
+        for child in self.children(node):
+            if self.state(child) == state:
+                return child
+        return None
+
+    def subtree(self, node):
+        """
+        Copy the subtree under a node into a new, compact ArrayTree.
+        :param node: int: id of the new root.
+        :return: ArrayTree
+        """
+        # Breadth first order keeps each node's children contiguous
+        order = [node]
+        i = 0
+        while i < len(order):
+            count = int(self.child_count[order[i]])
+            if count:
+                start = int(self.first_child[order[i]])
+                order.extend(range(start, start + count))
+            i += 1
+        order = np.array(order, dtype=np.int64)
+
+        tree = ArrayTree.__new__(ArrayTree)
+        tree.table = self.table
+        tree.c = self.c
+        tree.fpu = self.fpu
+        tree.size = len(order)
+        for name in self._arrays():
+            setattr(tree, name, getattr(self, name)[order].copy())
+
+        # Map old ids to new ids
+        new_ids = np.full(self.size, NO_MOVE, dtype=np.int64)
+        new_ids[order] = np.arange(len(order))
+        tree.parent[1:] = new_ids[tree.parent[1:]]
+        tree.parent[0] = NO_MOVE
+        tree.move[0] = NO_MOVE
+        expanded = tree.child_count > 0
+        tree.first_child[expanded] = new_ids[tree.first_child[expanded]]
+        return tree
+
+    def nbytes(self):
+        """
+        Memory used by the node arrays.
+        :return: int: bytes
+        """
+        return sum(getattr(self, name).nbytes for name in self._arrays())
@@ -0,0 +1,134 @@
+"""
+Random playouts of many games at once.
+
+batch_rollout plays K random games in lockstep. Each game's bitboards are an
+entry of a NumPy uint64 array, and every step generates moves, picks a random
+legal move and flips pieces for all K games with array operations, the same
+shift-and-mask algorithm lib.montecarlo.bitboard runs on single integers.
+"""
+import numpy as np
+
+from lib.montecarlo.bitboard import DIRECTIONS
+
+# (shift, mask) pairs from bitboard.DIRECTIONS as uint64 scalars
+_DIRECTIONS = tuple(
+    (np.uint64(abs(shift)), shift > 0, np.uint64(mask))
+    for shift, mask in DIRECTIONS
+)
+_ZERO = np.uint64(0)
+_ONE = np.uint64(1)
+
+
+def _shift(bits, amount, left):
+    return bits << amount if left else bits >> amount
+
+
+def unpack(bits):
+    """
+    Unpack bitboards into one 0/1 entry per square.
+    :param bits: numpy array: uint64 shape (K,)
+    :return: numpy array: uint8 shape (K,64), entry [k, square]
+    """
+    as_bytes = np.ascontiguousarray(bits, dtype="<u8").view(np.uint8)
+    return np.unpackbits(as_bytes.reshape(-1, 8), axis=1, bitorder="little")
+
+
+def batch_popcount(bits):
+    """
+    Count the squares set in each bitboard.
+    :param bits: numpy array: uint64 shape (K,)
+    :return: numpy array: int shape (K,)
+    """
+    return unpack(bits).sum(axis=1, dtype=np.int64)
+
+
+def batch_legal_moves(own, opp):
+    """
+    Vectorized bitboard.legal_moves.
+    :param own: numpy array: uint64 bitboards of the players to move
+    :param opp: numpy array: uint64 bitboards of their opponents
+    :return: numpy array: uint64 bitboards of legal moves
+    """
+    empty = ~(own | opp)
+    moves = np.zeros_like(own)
+    for amount, left, mask in _DIRECTIONS:
+        run_mask = opp & mask
+        x = _shift(own, amount, left) & run_mask
+        # A line holds at most six flippable pieces
+        for _ in range(5):
+            x |= _shift(x, amount, left) & run_mask
+        moves |= _shift(x, amount, left) & mask & empty
+    return moves
+
+
+def batch_flips(own, opp, placed):
+    """
+    Vectorized bitboard.flips.
+    :param own: numpy array: uint64 bitboards of the players to move
+    :param opp: numpy array: uint64 bitboards of their opponents
+    :param placed: numpy array: uint64 bitboards with only the played square
+           set, or 0 for games that don't move.
+    :return: numpy array: uint64 bitboards of flipped pieces
+    """
+    flipped = np.zeros_like(own)
+    for amount, left, mask in _DIRECTIONS:
+        run_mask = opp & mask
+        run = _shift(placed, amount, left) & run_mask
+        for _ in range(5):
+            run |= _shift(run, amount, left) & run_mask
+        # The run only flips if it is closed off by one of our own pieces
+        closed = (_shift(run, amount, left) & mask & own) != _ZERO
+        flipped |= np.where(closed, run, _ZERO)
+    return flipped
+
+
+def batch_rollout(p1_bits, p2_bits, next_player, count, rng=np.random):
+    """
+    Play `count` random games from one position, or one random game from each
+    of several positions, until they all end.
+    :param p1_bits: int or numpy array: player 1 bitboard(s)
+    :param p2_bits: int or numpy array: player 2 bitboard(s)
+    :param next_player: int or numpy array: player(s) to move
+    :param count: int: number of games.
+    :param rng: numpy RandomState or Generator-like with random.
+    :return: numpy array: int8 shape (count,) game results. 1, 2, or 0 for
+             a draw.
+    """
+    p1 = np.empty(count, dtype=np.uint64)
+    p2 = np.empty(count, dtype=np.uint64)
+    p1[:] = p1_bits
+    p2[:] = p2_bits
+    player = np.empty(count, dtype=np.int8)
+    player[:] = next_player
+
+    # Always play from the perspective of the player to move
+    own = np.where(player == 1, p1, p2)
+    opp = np.where(player == 1, p2, p1)
+    passed = np.zeros(count, dtype=bool)
+    active = np.ones(count, dtype=bool)
+
+    while active.any():
+        moves = batch_legal_moves(own, opp) * active
+        has_move = moves != _ZERO
+        # Neither player can make legal moves
+        active &= has_move | ~passed
+        passed = ~has_move
+
+        # Random legal square per game: the best of random scores over the
+        # legal squares
+        scores = unpack(moves) * rng.random((count, 64))
+        square = np.argmax(scores, axis=1).astype(np.uint64)
+        placed = np.where(has_move, _ONE << square, _ZERO)
+
+        flipped = batch_flips(own, opp, placed)
+        own, opp = opp ^ flipped, own | placed | flipped
+        player = np.where(active, 3 - player, player)
+        # Finished games keep the player whose pieces are in own
+        own, opp = np.where(active, own, opp), np.where(active, opp, own)
+
+    # own belongs to player, opp to the other player
+    own_count = batch_popcount(own)
+    opp_count = batch_popcount(opp)
+    return np.where(own_count > opp_count, player,
+                    np.where(opp_count > own_count, 3 - player, 0)
+                    ).astype(np.int8)
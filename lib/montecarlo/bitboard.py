@@ -0,0 +1,235 @@
+"""
+Bitboard primitives for the Othello engine.
+
+A bitboard is a 64 bit integer with one bit per square. Square (row, col)
+maps to bit ``row * 8 + col``, so bit 0 is the top left corner and bit 63 is
+the bottom right corner. Move generation and flipping are done by shifting
+whole bitboards in each of the eight directions and masking off the squares
+that would wrap around the edge of the board.
+"""
+import random
+
+FULL = 0xFFFFFFFFFFFFFFFF
+# Every square except column 0. Used after shifts that move pieces east.
+NOT_COL_0 = 0xFEFEFEFEFEFEFEFE
+# Every square except column 7. Used after shifts that move pieces west.
+NOT_COL_7 = 0x7F7F7F7F7F7F7F7F
+
+# (shift, mask) pairs. Positive shifts move towards higher bits (south/east),
+# negative shifts move towards lower bits (north/west).
+DIRECTIONS = (
+    (-8, FULL),        # N
+    (8, FULL),         # S
+    (1, NOT_COL_0),    # E
+    (-1, NOT_COL_7),   # W
+    (-7, NOT_COL_0),   # NE
+    (-9, NOT_COL_7),   # NW
+    (9, NOT_COL_0),    # SE
+    (7, NOT_COL_7),    # SW
+)
+
+
+# Zobrist keys. A position's hash is the XOR of the key for every occupied
+# (player, square) pair, plus ZOBRIST_SIDE when player 2 is to move. A fixed
+# seed keeps hashes stable across processes.
+_zobrist_rng = random.Random(0x07E110)
+ZOBRIST = (
+    None,
+    tuple(_zobrist_rng.getrandbits(64) for _ in range(64)),
+    tuple(_zobrist_rng.getrandbits(64) for _ in range(64)),
+)
+# Flipping a piece swaps its owner, so both players' keys change together
+ZOBRIST_FLIP = tuple(ZOBRIST[1][i] ^ ZOBRIST[2][i] for i in range(64))
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+
+def zobrist_hash(p1_bits, p2_bits, next_player):
+    """
+    Compute a position's Zobrist hash from scratch.
+    :param p1_bits: int: player 1 bitboard
+    :param p2_bits: int: player 2 bitboard
+    :param next_player: int: player to move
+    :return: int: 64 bit hash
+    """
+    key = ZOBRIST_SIDE if next_player == 2 else 0
+    for square in iter_squares(p1_bits):
+        key ^= ZOBRIST[1][square]
+    for square in iter_squares(p2_bits):
+        key ^= ZOBRIST[2][square]
+    return key
+
+
+def square_bit(row, col):
+    """
+    Get the bit for a square.
+    :param row: int: Represents the row index
+    :param col: int: Represents the column index
+    :return: int: bitboard with only this square set
+    """
+    return 1 << (row * 8 + col)
+
+
+def popcount(bits):
+    """
+    Count the squares set in a bitboard.
+    :param bits: int: bitboard
+    :return: int
+    """
+    return bin(bits).count("1")
+
+
+def iter_squares(bits):
+    """
+    Yield the index of every set square, lowest index first.
+    :param bits: int: bitboard
+    :return: generator of int: square indexes (row * 8 + col)
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def legal_moves(own, opp):
+    """
+    Get every square the owner of `own` can legally play on.
+    :param own: int: bitboard of the player to move
+    :param opp: int: bitboard of the opponent
+    :return: int: bitboard of legal moves
+    """
+    empty = ~(own | opp) & FULL
+    moves = 0
+    for shift, mask in DIRECTIONS:
+        # Opponent pieces that can be part of a run in this direction
+        run_mask = opp & mask
+        if shift > 0:
+            x = (own << shift) & run_mask
+            # A line holds at most six flippable pieces
+            x |= (x << shift) & run_mask
+            x |= (x << shift) & run_mask
+            x |= (x << shift) & run_mask
+            x |= (x << shift) & run_mask
+            x |= (x << shift) & run_mask
+            moves |= (x << shift) & mask & empty
+        else:
+            shift = -shift
+            x = (own >> shift) & run_mask
+            x |= (x >> shift) & run_mask
+            x |= (x >> shift) & run_mask
+            x |= (x >> shift) & run_mask
+            x |= (x >> shift) & run_mask
+            x |= (x >> shift) & run_mask
+            moves |= (x >> shift) & mask & empty
+    return moves
+
+
+def flips(own, opp, move):
+    """
+    Get the opponent pieces flipped by playing `move`.
+    :param own: int: bitboard of the player to move
+    :param opp: int: bitboard of the opponent
+    :param move: int: bitboard with only the played square set
+    :return: int: bitboard of flipped pieces
+    """
+    flipped = 0
+    for shift, mask in DIRECTIONS:
+        run = 0
+        if shift > 0:
+            cursor = (move << shift) & mask
+            while cursor & opp:
+                run |= cursor
+                cursor = (cursor << shift) & mask
+        else:
+            shift = -shift
+            cursor = (move >> shift) & mask
+            while cursor & opp:
+                run |= cursor
+                cursor = (cursor >> shift) & mask
+        # The run only flips if it is closed off by one of our own pieces
+        if cursor & own:
+            flipped |= run
+    return flipped
+
+
+def bitboards_from_board(board):
+    """
+    Convert a 2D list board into player bitboards.
+    :param board: 2D list: Represents the board. Includes 0, 1, 2.
+    :return: int, int: player 1 bitboard, player 2 bitboard
+    """
+    p1_bits = 0
+    p2_bits = 0
+    for row, values in enumerate(board):
+        for col, val in enumerate(values):
+            if val == 1:
+                p1_bits |= 1 << (row * 8 + col)
+            elif val == 2:
+                p2_bits |= 1 << (row * 8 + col)
+    return p1_bits, p2_bits
+
+
+def board_from_bitboards(p1_bits, p2_bits):
+    """
+    Convert player bitboards into a 2D list board.
+    :param p1_bits: int: player 1 bitboard
+    :param p2_bits: int: player 2 bitboard
+    :return: 2D list: Represents the board. Includes 0, 1, 2.
+    """
+    board = [[0] * 8 for _ in range(8)]
+    for square in iter_squares(p1_bits):
+        board[square >> 3][square & 7] = 1
+    for square in iter_squares(p2_bits):
+        board[square >> 3][square & 7] = 2
+    return board
+
+
+def flip_vertical(bits):
+    """
+    Mirror a bitboard top to bottom (row r becomes row 7 - r).
+    :param bits: int: bitboard
+    :return: int: bitboard
+    """
+    # Each row is one byte
+    return int.from_bytes(bits.to_bytes(8, "little"), "big")
+
+
+def mirror_horizontal(bits):
+    """
+    Mirror a bitboard left to right (column c becomes column 7 - c).
+    :param bits: int: bitboard
+    :return: int: bitboard
+    """
+    # Reverse the bits of every byte
+    bits = ((bits >> 1) & 0x5555555555555555) | ((bits & 0x5555555555555555) << 1)
+    bits = ((bits >> 2) & 0x3333333333333333) | ((bits & 0x3333333333333333) << 2)
+    return ((bits >> 4) & 0x0F0F0F0F0F0F0F0F) | ((bits & 0x0F0F0F0F0F0F0F0F) << 4)
+
+
+def transpose(bits):
+    """
+    Mirror a bitboard in its main diagonal (square (r, c) becomes (c, r)).
+    :param bits: int: bitboard
+    :return: int: bitboard
+    """
+    # Swap 4x4, then 2x2, then 1x1 blocks across the diagonal
+    t = 0x0F0F0F0F00000000 & (bits ^ (bits << 28))
+    bits ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (bits ^ (bits << 14))
+    bits ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (bits ^ (bits << 7))
+    bits ^= t ^ (t >> 7)
+    return bits
+
+
+def symmetries(bits):
+    """
+    Get a bitboard in all 8 orientations of the board.
+    :param bits: int: bitboard
+    :return: list of int: entry k matches lib.ml.symmetry.transform(board, k):
+             k % 4 counterclockwise quarter turns, mirrored left to right
+             for k >= 4.
+    """
+    rotations = [bits]
+    for _ in range(3):
+        rotations.append(flip_vertical(transpose(rotations[-1])))
+    return rotations + [mirror_horizontal(rotated) for rotated in rotations]
@@ -0,0 +1,120 @@
+"""Search budgets and time management."""
+import time
+
+import numpy as np
+
+from lib.montecarlo.endgame import empties
+
+# Thinking time is split as if at least this many moves were left to play.
+MIN_MOVES_LEFT = 10
+# Seconds of the game clock never handed out, to absorb overhead.
+RESERVE = 0.5
+
+
+class SearchBudget:
+    """
+    Limits a search by a number of simulations, a wall-clock time, or both.
+    The search stops at whichever limit is reached first, or earlier once the
+    most visited root child can't be overtaken in the simulations left.
+    """
+    def __init__(self, num_simulations=None, time_budget=None,
+                 early_stop=True):
+        """
+        Initialize the budget. The clock starts now.
+        :param num_simulations: int: maximum simulations, or None for no limit.
+        :param time_budget: float: maximum seconds, or None for no limit.
+        :param early_stop: bool: stop once the leading move is decided. False
+               always spends the whole budget.
+        """
+        if num_simulations is None and time_budget is None:
+            raise ValueError("A search needs a simulation or time budget.")
+        self.num_simulations = num_simulations
+        self.time_budget = time_budget
+        self.early_stop = early_stop
+        self.start = time.monotonic()
+        self.completed = 0
+
+    def add(self, simulations):
+        """
+        Record finished simulations.
+        :param simulations: int
+        """
+        self.completed += simulations
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def remaining(self):
+        """
+        Estimate how many more simulations fit in the budget. Time budgets
+        are converted using the rate of simulations so far.
+        :return: float: simulations, inf when unlimited.
+        """
+        remaining = float("inf")
+        if self.num_simulations is not None:
+            remaining = self.num_simulations - self.completed
+        if self.time_budget is not None:
+            elapsed = self.elapsed()
+            time_left = self.time_budget - elapsed
+            if time_left <= 0:
+                return 0
+            if self.completed:
+                remaining = min(remaining,
+                                self.completed * time_left / elapsed)
+        return max(remaining, 0)
+
+    def exhausted(self):
+        # Always allow one simulation, so there is a move to choose
+        return self.completed > 0 and self.remaining() <= 0
+
+    def decided(self, visits):
+        """
+        Check if the most visited child can no longer be overtaken. A search
+        is never decided before its first simulation, even when it continues
+        from a reused subtree that already has visits.
+        :param visits: numpy array: visit counts of the root's children.
+        :return: bool
+        """
+        if not self.early_stop or not self.completed or len(visits) < 2:
+            return False
+        second, first = np.partition(visits, -2)[-2:]
+        return first - second > self.remaining()
+
+
+class TimeManager:
+    """
+    Splits a game clock between the moves of a game. Each move gets an equal
+    share of the remaining time over the moves the player still has to make,
+    estimated from the number of empty squares, plus the increment.
+    """
+    def __init__(self, total_time, increment=0.0,
+                 min_moves_left=MIN_MOVES_LEFT, reserve=RESERVE):
+        """
+        Initialize the clock.
+        :param total_time: float: seconds for the whole game.
+        :param increment: float: seconds added to the clock after each move.
+        :param min_moves_left: int: see MIN_MOVES_LEFT.
+        :param reserve: float: see RESERVE.
+        """
+        self.remaining = total_time
+        self.increment = increment
+        self.min_moves_left = min_moves_left
+        self.reserve = reserve
+
+    def budget(self, state):
+        """
+        Get the thinking time for the next move.
+        :param state: GameState: represents the state of the game
+        :return: float: seconds
+        """
+        # Each player makes about half of the remaining moves
+        moves_left = max(empties(state) // 2, self.min_moves_left)
+        return max(self.remaining - self.reserve, 0) / moves_left + \
+            self.increment
+
+    def spend(self, seconds):
+        """
+        Charge a move's thinking time to the clock.
+        :param seconds: float
+        """
+        self.remaining += self.increment - seconds
@@ -0,0 +1,189 @@
+"""
+Exact endgame solver.
+
+Once few squares are empty the game tree is small enough to search to the
+end. EndgameSolver runs a negamax alpha-beta search over the bitboards of a
+GameState and returns the final disc difference under perfect play.
+
+Moves are ordered so the search finds cutoffs early:
+    - corners first,
+    - then moves leaving the opponent the fewest replies (fastest first),
+    - ties broken by parity: moves into a quadrant with an odd number of
+      empty squares first, so we tend to get the last move in each region.
+Close to the leaves only the cheaper parity ordering is used.
+"""
+from lib.montecarlo.bitboard import FULL, flips, legal_moves, popcount
+from lib.montecarlo.game import Move
+
+# Solve positions with at most this many empty squares.
+ENDGAME_EMPTIES = 12
+# Below this many empties moves are ordered by parity only.
+FASTEST_FIRST_EMPTIES = 5
+MAX_ENTRIES = 1000000
+
+CORNERS = 0x8100000000000081
+QUADRANTS = (
+    0x000000000F0F0F0F,
+    0x00000000F0F0F0F0,
+    0x0F0F0F0F00000000,
+    0xF0F0F0F000000000,
+)
+
+# Transposition table bound types
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+def empties(state):
+    """
+    Count the empty squares of a state.
+    :param state: GameState: represents the state of the game
+    :return: int
+    """
+    return 64 - popcount(state.bitboards[0] | state.bitboards[1])
+
+
+def score_to_winloss(score):
+    """
+    Convert a solved score into a training value for the player who created
+    the solved state, see Simulator.store_game_result.
+    :param score: int: final disc difference for the player to move.
+    :return: float: 1 if the creator wins, 0 if it loses, 0.5 for a draw.
+    """
+    if score > 0:
+        return 0
+    if score < 0:
+        return 1
+    return 0.5
+
+
+class EndgameSolver:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        """
+        Initialize the solver.
+        :param max_entries: int: the transposition table is emptied when it
+               grows past this many positions.
+        """
+        self.max_entries = max_entries
+        # (own, opp) -> (bound type, score)
+        self.table = {}
+        self.nodes = 0
+
+    def solve(self, state, exact=True):
+        """
+        Solve a position.
+        :param state: GameState: represents the state of the game
+        :param exact: bool: find the exact final disc difference. When False
+               only win, loss or draw is decided, which is much faster.
+        :return: Move, int: a best move for the player to move (None if it
+                 has to pass or the game is over), final disc difference for
+                 the player to move under perfect play. When not exact only
+                 the sign of the difference is meaningful.
+        """
+        if len(self.table) > self.max_entries:
+            self.table.clear()
+
+        p1_bits, p2_bits = state.bitboards
+        if state.next_player == 1:
+            own, opp = p1_bits, p2_bits
+        else:
+            own, opp = p2_bits, p1_bits
+
+        lower, upper = (-65, 65) if exact else (-1, 1)
+        moves = legal_moves(own, opp)
+        if not moves:
+            return None, self._negamax(own, opp, lower, upper, False)
+
+        best = -65
+        best_square = None
+        alpha = lower
+        for square in self._ordered_moves(own, opp, moves):
+            move = 1 << square
+            flipped = flips(own, opp, move)
+            score = -self._negamax(opp ^ flipped, own | move | flipped,
+                                   -upper, -alpha, False)
+            if score > best:
+                best = score
+                best_square = square
+                alpha = max(alpha, score)
+                if alpha >= upper:
+                    break
+
+        return Move(best_square >> 3, best_square & 7, state.next_player), best
+
+    def _negamax(self, own, opp, alpha, beta, passed):
+        """
+        Final disc difference for the owner of `own`, who is to move.
+        Exact if it lies strictly between alpha and beta, otherwise a bound.
+        :param passed: bool: the previous player passed.
+        :return: int
+        """
+        self.nodes += 1
+        moves = legal_moves(own, opp)
+        if not moves:
+            if passed:
+                # Neither player can move
+                return popcount(own) - popcount(opp)
+            return -self._negamax(opp, own, -beta, -alpha, True)
+
+        key = (own, opp)
+        entry = self.table.get(key)
+        if entry is not None:
+            bound, score = entry
+            if bound == EXACT:
+                return score
+            if bound == LOWER and score >= beta:
+                return score
+            if bound == UPPER and score <= alpha:
+                return score
+
+        original_alpha = alpha
+        best = -65
+        for square in self._ordered_moves(own, opp, moves):
+            move = 1 << square
+            flipped = flips(own, opp, move)
+            score = -self._negamax(opp ^ flipped, own | move | flipped,
+                                   -beta, -alpha, False)
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if best <= original_alpha:
+            self.table[key] = (UPPER, best)
+        elif best >= beta:
+            self.table[key] = (LOWER, best)
+        else:
+            self.table[key] = (EXACT, best)
+        return best
+
+    def _ordered_moves(self, own, opp, moves):
+        """
+        Order moves for the search, see the module docstring.
+        :param moves: int: bitboard of legal moves.
+        :return: list of int: squares
+        """
+        empty = ~(own | opp) & FULL
+        odd = 0
+        for quadrant in QUADRANTS:
+            if popcount(empty & quadrant) & 1:
+                odd |= quadrant
+
+        fastest_first = popcount(empty) > FASTEST_FIRST_EMPTIES
+        ordered = []
+        while moves:
+            move = moves & -moves
+            moves ^= move
+            priority = 0 if move & odd else 1
+            if move & CORNERS:
+                priority -= 100
+            if fastest_first:
+                flipped = flips(own, opp, move)
+                replies = legal_moves(opp ^ flipped, own | move | flipped)
+                priority += 2 * popcount(replies)
+            ordered.append((priority, move.bit_length() - 1))
+        ordered.sort()
+        return [square for _, square in ordered]
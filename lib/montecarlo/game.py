@@ -1,7 +1,10 @@
 """Othello game representation."""
-import copy
-
-from lib.montecarlo.util import in_bounds, other_player, increment_row_col
+from lib.montecarlo.bitboard import (
+    ZOBRIST, ZOBRIST_FLIP, ZOBRIST_SIDE, bitboards_from_board,
+    board_from_bitboards, flips, iter_squares, legal_moves, popcount,
+    square_bit, zobrist_hash
+)
+from lib.montecarlo.util import in_bounds, other_player
 
 
 class Move:
@@ -29,30 +32,80 @@ class Move:
 
 
 class GameState:
-    def __init__(self, next_player, board_state):
+    def __init__(self, next_player, board_state=None, bitboards=None,
+                 zobrist=None):
         """
         Initialize the game.
         :param next_player: int: next player to play. (i.e. This player is
                presented with and must consider this board state.)
         :param board_state: 2D list: Represents the board. Includes 0, 1, 2.
+        :param bitboards: tuple: (player 1 bitboard, player 2 bitboard). Used
+               instead of board_state when states are created by the engine.
+        :param zobrist: int: Zobrist hash of this state, if already known.
         """
         self.next_player = next_player
-        self.board = board_state
+        if bitboards is None:
+            bitboards = bitboards_from_board(board_state)
+        self.bitboards = bitboards
+        if zobrist is None:
+            zobrist = zobrist_hash(bitboards[0], bitboards[1], next_player)
+        self.zobrist = zobrist
+
+        # Built on demand, see the board property
+        self._board = None
+        # Legal move bitboards, keyed by player
+        self._legal = {}
+
+    # __eq__ and __hash__ used to match states when reusing search trees
+    def __eq__(self, other):
+        return isinstance(other, GameState) and \
+               self.next_player == other.next_player and \
+               self.bitboards == other.bitboards
+
+    def __hash__(self):
+        return self.zobrist
+
+    @property
+    def board(self):
+        """
+        2D list view of the board, built lazily from the bitboards.
+        :return: 2D list: Represents the board. Includes 0, 1, 2.
+        """
+        if self._board is None:
+            self._board = board_from_bitboards(*self.bitboards)
+        return self._board
+
+    def legal_moves_mask(self, player):
+        """
+        Gets the legal moves of a given player as a bitboard.
+        :param player: int: player to get moves for.
+        :return: int: bitboard of legal moves
+        """
+        mask = self._legal.get(player)
+        if mask is None:
+            own = self.bitboards[player - 1]
+            opp = self.bitboards[2 - player]
+            mask = legal_moves(own, opp)
+            self._legal[player] = mask
+        return mask
+
+    def count(self, player):
+        """
+        Count the discs of a player.
+        :param player: int: player whose discs to count.
+        :return: int
+        """
+        return popcount(self.bitboards[player - 1])
 
     def game_result(self):
         """
         Returns player who won (1 or 2) or None if winner is unknown.
         :return: int: winning player
         """
-        next_player_legal_moves = self.get_player_legal_moves(self.next_player)
-        other_legal_moves = self.get_player_legal_moves(
-            other_player(self.next_player)
-        )
-
         # Neither player can make legal moves
-        if not next_player_legal_moves and not other_legal_moves:
-            total_next = sum(row.count(self.next_player) for row in self.board)
-            total_other = sum(row.count(other_player(self.next_player)) for row in self.board)
+        if not self.legal_moves_mask(1) and not self.legal_moves_mask(2):
+            total_next = self.count(self.next_player)
+            total_other = self.count(other_player(self.next_player))
 
             if total_next > total_other:
                 return self.next_player
@@ -82,56 +135,37 @@ class GameState:
         #  doesn't backpropogate a pass. This could affect the model's loss
         #  significantly if players are passing often and this information is
         #  not being reflected.
+        next_player = other_player(action.player)
+        # The side to move is part of the hash
+        zobrist = self.zobrist
+        if next_player != self.next_player:
+            zobrist ^= ZOBRIST_SIDE
+
         if action.row is None and action.col is None:
-            new_state = copy.deepcopy(self.board)
-            return GameState(other_player(action.player), new_state)
+            return GameState(next_player, bitboards=self.bitboards,
+                             zobrist=zobrist)
 
         if not self.move_is_legal(action):
             raise Exception("Illegal move")
-            return None
-        new_state = copy.deepcopy(self.board)
-        new_state[action.row][action.col] = action.player
-
-        # Checks that piece was placed by opponent
-        def promising(r, c):
-            """
-            Check that piece at row r and column c was played by opponent.
-            :param r: int: Represents the row.
-            :param c: int: Represents the column.
-            :return: bool. True if piece was placed by opponent, False otherwise.
-            """
-            if in_bounds(r, c) and \
-                    self.board[r][c] == other_player(action.player):
-                return True
-            return False
 
-        def flip_in_direction(direction):
-            """
-            Flip opponent's pieces in all valid directions.
-            :param direction: string: Represents the direction.
-                   One of: ["N", "S", "E", "W", "NE", "NW", "SE", "SW"]
-            :return: GameState: Represents the updated GameState after flips.
-            """
-            row, col = increment_row_col(action.row, action.col, direction)
-            if promising(row, col):
-                flips = []
-                while promising(row, col):
-                    flips.append([row, col])
-                    row, col = increment_row_col(row, col, direction)
-                if in_bounds(row, col) and self.board[row][col] == action.player:
-                    for location in flips:
-                        new_state[location[0]][location[1]] = action.player
-
-        flip_in_direction("N")
-        flip_in_direction("S")
-        flip_in_direction("E")
-        flip_in_direction("W")
-        flip_in_direction("NE")
-        flip_in_direction("NW")
-        flip_in_direction("SE")
-        flip_in_direction("SW")
-
-        return GameState(other_player(action.player), new_state)
+        own = self.bitboards[action.player - 1]
+        opp = self.bitboards[2 - action.player]
+        placed = square_bit(action.row, action.col)
+        flipped = flips(own, opp, placed)
+
+        own |= placed | flipped
+        opp ^= flipped
+        if action.player == 1:
+            bitboards = (own, opp)
+        else:
+            bitboards = (opp, own)
+
+        # Update the hash with the placed piece and every flipped piece
+        zobrist ^= ZOBRIST[action.player][action.row * 8 + action.col]
+        for square in iter_squares(flipped):
+            zobrist ^= ZOBRIST_FLIP[square]
+
+        return GameState(next_player, bitboards=bitboards, zobrist=zobrist)
 
     def move_is_legal(self, action):
         """
@@ -139,73 +173,38 @@ class GameState:
         :param action: Move: represents a move
         :return: bool
         """
-        # Check that action is in bounds and empty square
+        # Check that action is in bounds
         if not in_bounds(action.row, action.col):
             return False
-        if self.board[action.row][action.col] != 0:
-            return False
 
-        # Checks that piece was placed by opponent
-        def promising(r, c):
-            """
-            Check that piece at row r and column c was played by opponent.
-            :param r: int: Represents the row.
-            :param c: int: Represents the column.
-            :return: bool. True if piece was placed by opponent, False otherwise.
-            """
-            if in_bounds(r, c) and \
-                    self.board[r][c] == other_player(action.player):
-                return True
-            return False
-
-        def legal_move_in_direction(direction):
-            """
-            Check that a move is legal in a certain direction.
-            :param direction: string: Represents the direction.
-                   One of: ["N", "S", "E", "W", "NE", "NW", "SE", "SW"]
-            :return: bool: True if move is legal in given direction, False otherwise.
-            """
-            row, col = increment_row_col(action.row, action.col, direction)
-            if promising(row, col):
-                while promising(row, col):
-                    row, col = increment_row_col(row, col, direction)
-                if not in_bounds(row, col) or self.board[row][col] != action.player:
-                    return False
-                # We have followed a path of opponent pieces and arrived an another of our pieces
-                return True
-            return False
-
-        if legal_move_in_direction("N") or \
-                legal_move_in_direction("S") or \
-                legal_move_in_direction("E") or \
-                legal_move_in_direction("W") or \
-                legal_move_in_direction("NE") or \
-                legal_move_in_direction("NW") or \
-                legal_move_in_direction("SE") or \
-                legal_move_in_direction("SW"):
-            return True
-        else:
-            return False
+        return bool(self.legal_moves_mask(action.player) &
+                    square_bit(action.row, action.col))
 
     def get_player_legal_moves(self, player):
         """
         Gets legal moves of a given player from this state.
         :return: list: Move objects
         """
-        valid_moves = []
-
-        for row in range(len(self.board)):
-            for col in range(8):
-                move = Move(row, col, player)
-                if self.move_is_legal(move):
-                    valid_moves.append(move)
-
-        return valid_moves
+        return [
+            Move(square >> 3, square & 7, player)
+            for square in iter_squares(self.legal_moves_mask(player))
+        ]
 
-    def get_legal_moves(self):
+    def get_legal_moves(self, player=None):
         """
-        Get legal moves for self.next_player.
+        Get legal moves for self.next_player, or for player if given.
         :return: list: Move objects
         """
-        return self.get_player_legal_moves(self.next_player)
+        if player is None:
+            player = self.next_player
+        return self.get_player_legal_moves(player)
 
+
+def initial_state():
+    """
+    :return: GameState: the standard start position, player 1 to move.
+    """
+    board = [[0] * 8 for _ in range(8)]
+    board[3][3] = board[4][4] = 1
+    board[3][4] = board[4][3] = 2
+    return GameState(1, board)
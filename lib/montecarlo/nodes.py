@@ -1,60 +1,161 @@
 import random
 
 import numpy as np
-from lib.montecarlo.game import Move
+from lib.montecarlo.rollout import random_rollout
 from lib.montecarlo.util import other_player
 from lib.ml.run import evaluate_model_at_gamestate
 
+# Default exploration parameter for promising_child
+EXPLORATION = 1.4
+
+
+class ChildStat:
+    """
+    A node statistic stored in its parent's child arrays.
+
+    Expanded nodes keep the statistics of all their children in contiguous
+    arrays (child_visit_count, child_win_score, ...) so that promising_child
+    scores every child in one vectorized step. Nodes created outside of an
+    expansion, such as a root, have no index and keep their own value.
+    """
+    def __init__(self, name):
+        self.array = "child_" + name
+        self.scalar = "_" + name
+
+    def __get__(self, node, owner):
+        if node is None:
+            return self
+        if node.index is None:
+            return getattr(node, self.scalar)
+        return getattr(node.parent, self.array)[node.index]
+
+    def __set__(self, node, value):
+        if node.index is None:
+            setattr(node, self.scalar, value)
+        else:
+            getattr(node.parent, self.array)[node.index] = value
+
 
 class Node:
-    def __init__(self, state, prior=0, parent=None, transition_move=None):
+    visit_count = ChildStat("visit_count")
+    win_score = ChildStat("win_score")
+    prior = ChildStat("prior")
+    # Pending visits from simulations that have selected this node but
+    # not yet backpropagated. Steers batched selection to other leaves.
+    virtual_loss = ChildStat("virtual_loss")
+
+    def __init__(self, state, prior=0, parent=None, transition_move=None,
+                 index=None):
         """
         Initialize the node.
         :param state: NodeState object. Represents the state of the node.
         :param parent: Node object. This node's parent.
         :param transition_move: Move object. Represents the move that
                transitioned parent state to this state.
+        :param index: int: position of this node in the parent's child
+               arrays, or None to store statistics on the node itself.
         """
         self.state = state
         self.parent = parent
         self.children = []
+        self.index = index
 
         self.transition_move = transition_move
-        self.visit_count = 0
-        self.win_score = 0
-        self.prior = prior
+        self._visit_count = 0
+        self._win_score = 0
+        self._prior = prior
+        self._virtual_loss = 0
 
-    def expand(self, model):
-        """Expand a leaf node and attach children."""
+    def expand(self, model, table=None):
+        """
+        Expand a leaf node and attach children.
+        :param model: string: model filename
+        :param table: TranspositionTable: cached evaluations to consult before
+               running the model, or None.
+        """
         if self.children:
             raise Exception("Cannot expand an expanded node.")
 
-        # Evaluate the board at this state using ml model
-        value, policy = evaluate_model_at_gamestate(self.state, model)
-
-        for move in self.state.get_legal_moves():
-            # Create a child node with updated state after move was made,
-            # valid parent, and transition move
-            child = Node(self.state.move(move),
-                         parent=self,
-                         transition_move=move,
-                         prior=policy[move.row][move.col])
-            self.children.append(child)
+        cached = table.lookup(self.state) if table is not None else None
+        if cached is not None:
+            value, policy = cached
+        else:
+            # Evaluate the board at this state using ml model
+            value, policy = evaluate_model_at_gamestate(self.state, model)
+            if table is not None:
+                table.store(self.state, value, policy)
+        self.expand_with_policy(policy)
 
         # Returns value to backpropagate up the tree
         return value
 
+    def expand_with_policy(self, policy):
+        """
+        Attach children to a leaf node using an already evaluated policy.
+        :param policy: 2D array: 8x8 move probabilities from the model.
+        """
+        if self.children:
+            raise Exception("Cannot expand an expanded node.")
+
+        moves = self.state.get_legal_moves()
+        self._attach_children(moves, [policy[move.row][move.col] for move in moves])
+
     def expand_mcts(self):
         if self.children:
             raise Exception("Cannot expand an expanded node.")
 
-        for move in self.state.get_legal_moves():
-            # Create a child node with updated state after move was made,
-            # valid parent, and transition move
-            child = Node(self.state.move(move),
-                         parent=self,
-                         transition_move=move)
-            self.children.append(child)
+        moves = self.state.get_legal_moves()
+        self._attach_children(moves, [0] * len(moves))
+
+    def _attach_children(self, moves, priors):
+        """
+        Create a child for every move, with its statistics in this node's
+        child arrays.
+        :param moves: list: Move objects
+        :param priors: list: prior probability of each move
+        """
+        self.child_visit_count = np.zeros(len(moves), dtype=np.int64)
+        self.child_win_score = np.zeros(len(moves))
+        self.child_prior = np.array(priors, dtype=float)
+        self.child_virtual_loss = np.zeros(len(moves), dtype=np.int64)
+
+        # Create a child node with updated state after move was made,
+        # valid parent, and transition move
+        self.children = [
+            Node(self.state.move(move),
+                 parent=self,
+                 transition_move=move,
+                 index=i)
+            for i, move in enumerate(moves)
+        ]
+
+    def detach(self):
+        """
+        Make this node the root of its own tree, keeping its statistics.
+        """
+        if self.index is not None:
+            self._visit_count = int(self.visit_count)
+            self._win_score = float(self.win_score)
+            self._prior = float(self.prior)
+            self._virtual_loss = int(self.virtual_loss)
+            self.index = None
+        self.parent = None
+        self.transition_move = None
+
+    def find_descendant(self, state, max_depth=2):
+        """
+        Find the node for a state among this node's descendants.
+        :param state: GameState: state to look for.
+        :param max_depth: int: how many levels below this node to search.
+        :return: Node, or None if the state wasn't explored.
+        """
+        level = [self]
+        for _ in range(max_depth):
+            level = [child for node in level for child in node.children]
+            for node in level:
+                if node.state == state:
+                    return node
+        return None
 
     def random_child(self):
         """
@@ -72,51 +173,80 @@ class Node:
         Updates visit and win values for all nodes in path.
         :param game_result: int: result of the game after rollout.
         """
-        self.visit_count += 1
-        # other_player would have created this state
-        # Add to other player's wins
-        if game_result == other_player(self.state.next_player):
-            self.win_score += 1
-        # Game ended in a Draw
-        elif game_result == 0:
-            self.win_score += 0.5
+        node = self
+        # Walk up the parent chain rather than recursing
+        while node:
+            node.visit_count += 1
+            # other_player would have created this state
+            # Add to other player's wins
+            if game_result == other_player(node.state.next_player):
+                node.win_score += 1
+            # Game ended in a Draw
+            elif game_result == 0:
+                node.win_score += 0.5
+            node = node.parent
+
+    def backpropagate_results(self, game_results):
+        """
+        Updates visit and win values for all nodes in path with the results
+        of several rollouts at once.
+        :param game_results: numpy array: results of the games after rollout.
+        """
+        counts = np.bincount(game_results, minlength=3)
+        games = int(counts.sum())
+        node = self
+        while node:
+            node.visit_count += games
+            # Wins of the player who created this state, draws count half
+            node.win_score += counts[other_player(node.state.next_player)] + \
+                0.5 * counts[0]
+            node = node.parent
+
+    def add_virtual_loss(self, amount):
+        """
+        Adds virtual loss to every node in the path from the root to this node.
+        Virtual visits lower a node's score until they are reverted.
+        :param amount: int: number of virtual visits to add.
+        """
+        node = self
+        while node:
+            node.virtual_loss += amount
+            node = node.parent
 
-        # Backpropogate from parent node
-        if self.parent:
-            self.parent.backpropagate(game_result)
+    def revert_virtual_loss(self, amount):
+        """
+        Removes virtual loss previously added with add_virtual_loss.
+        :param amount: int: number of virtual visits to remove.
+        """
+        self.add_virtual_loss(-amount)
 
-    def promising_child(self, c=1.4):
+    def promising_child(self, c=EXPLORATION, fpu=None):
         """
         Use upper confidence bound (UTC) to choose next node to explore.
+        All children are scored at once from this node's child arrays.
         Source: https://en.wikipedia.org/wiki/Monte_Carlo_tree_search
 
         :param c: double: exploration parameter
+        :param fpu: double: first play urgency, the value assumed for
+               children that have not been visited. None scores them as 0.
         :return: Node: next node to explore/expand.
         """
-        # Add 1 to denominator to avoid division by zero
-        weights = [
-            child.win_score / max(child.visit_count, 1) + \
-            c * child.prior * np.sqrt(
-                self.visit_count
-            ) / (child.visit_count + 1)
-            for child in self.children
-        ]
-        return self.children[np.argmax(weights)]
+        # Virtual losses count as visits that didn't win.
+        visits = self.child_visit_count + self.child_virtual_loss
+        parent_visits = self.visit_count + self.virtual_loss
+
+        values = self.child_win_score / np.maximum(visits, 1)
+        if fpu is not None:
+            values = np.where(visits == 0, fpu, values)
+        # Add 1 to denominator to avoid division by zero.
+        weights = values + \
+            c * self.child_prior * np.sqrt(parent_visits) / (visits + 1)
+        return self.children[int(np.argmax(weights))]
 
     def rollout(self):
         """
         Rollout from this node to find game result.
-        :return: int: Represents the game result. 1, 2, or None
+        :return: int: Represents the game result. 1, 2, or 0 for a draw
         """
-        if self.state.game_over():
-            return self.state.game_result()
-
-        legal_moves = self.state.get_legal_moves()
-        if not legal_moves:
-            random_move = Move(None, None, self.state.next_player)
-        else:
-            random_move = random.choice(legal_moves)
-        node = Node(self.state.move(random_move))
-        return node.rollout()
-
-
+        return random_rollout(self.state.bitboards[0], self.state.bitboards[1],
+                              self.state.next_player)
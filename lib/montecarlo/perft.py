@@ -0,0 +1,186 @@
+"""
+Perft: count the leaf nodes of the game tree to a fixed depth.
+
+Two move generators that agree on every perft count from a set of positions
+agree on the rules, so perft checks a fast engine against the reference one,
+and the time it takes is a measure of engine throughput.
+
+A pass is a move: when the player to move has no legal move but the
+opponent does, the only child is the position with the opponent to move. A
+finished game is a leaf wherever it occurs, it counts as 1 at any remaining
+depth.
+
+    $ PYTHONPATH=. python lib/montecarlo/perft.py -d 6
+    $ PYTHONPATH=. python lib/montecarlo/perft.py -d 4 --plies 30 --seed 3 --engine all
+"""
+import time
+import random
+
+import click
+
+from lib.montecarlo.bitboard import flips, legal_moves
+from lib.montecarlo.game import GameState, Move, initial_state
+from lib.montecarlo.reference import ReferenceGameState
+
+# Perft counts from the standard start position, indexed by depth. No game
+# can end or pass within the first 8 moves.
+START_PERFT = (1, 4, 12, 56, 244, 1396, 8200, 55092, 390216)
+ENGINES = ("reference", "gamestate", "bitboard")
+
+
+def perft_state(state, depth):
+    """
+    Perft through the GameState interface: get_legal_moves and move. Works
+    for GameState and ReferenceGameState.
+    :param state: GameState or ReferenceGameState
+    :param depth: int: number of moves (including passes) to search.
+    :return: int: leaf nodes
+    """
+    if depth == 0:
+        return 1
+    moves = state.get_legal_moves()
+    if not moves:
+        passed = state.move(Move(None, None, state.next_player))
+        if not passed.get_legal_moves():
+            # Neither player can move, the game is over
+            return 1
+        return perft_state(passed, depth - 1)
+    return sum(perft_state(state.move(move), depth - 1) for move in moves)
+
+
+def perft_bitboards(own, opp, depth, passed=False):
+    """
+    Perft directly on bitboards, without creating any objects.
+    :param own: int: bitboard of the player to move
+    :param opp: int: bitboard of the opponent
+    :param depth: int: number of moves (including passes) to search.
+    :param passed: bool: the previous move was a pass.
+    :return: int: leaf nodes
+    """
+    if depth == 0:
+        return 1
+    moves = legal_moves(own, opp)
+    if not moves:
+        if passed:
+            return 1
+        if not legal_moves(opp, own):
+            return 1
+        return perft_bitboards(opp, own, depth - 1, True)
+
+    nodes = 0
+    while moves:
+        move = moves & -moves
+        moves ^= move
+        flipped = flips(own, opp, move)
+        if depth == 1:
+            nodes += 1
+        else:
+            nodes += perft_bitboards(opp ^ flipped, own | move | flipped,
+                                     depth - 1)
+    return nodes
+
+
+def perft(board, next_player, depth, engine="bitboard"):
+    """
+    Run perft with one of the engines.
+    :param board: 2D list: Represents the board. Includes 0, 1, 2.
+    :param next_player: int: player to move.
+    :param depth: int: number of moves (including passes) to search.
+    :param engine: string: one of ENGINES.
+    :return: int: leaf nodes
+    """
+    if engine == "reference":
+        return perft_state(ReferenceGameState(next_player,
+                                              [row[:] for row in board]), depth)
+    state = GameState(next_player, board)
+    if engine == "gamestate":
+        return perft_state(state, depth)
+    own = state.bitboards[next_player - 1]
+    opp = state.bitboards[2 - next_player]
+    return perft_bitboards(own, opp, depth)
+
+
+def divide(board, next_player, depth, engine="bitboard"):
+    """
+    Perft split by the first move, to find where two engines disagree.
+    :return: dict: (row, col) of the first move, (None, None) for a pass
+             -> leaf nodes below it.
+    """
+    state = GameState(next_player, board)
+    moves = state.get_legal_moves() or [Move(None, None, next_player)]
+    counts = {}
+    for move in moves:
+        child = state.move(move)
+        counts[move.row, move.col] = perft(child.board, child.next_player,
+                                           depth - 1, engine)
+    return counts
+
+
+def random_position(plies, seed):
+    """
+    Play random moves from the start position.
+    :param plies: int: number of moves to play.
+    :param seed: int: RNG seed.
+    :return: 2D list, int: board and player to move
+    """
+    rng = random.Random(seed)
+    state = initial_state()
+    for _ in range(plies):
+        if state.game_over():
+            break
+        moves = state.get_legal_moves()
+        state = state.move(rng.choice(moves) if moves
+                           else Move(None, None, state.next_player))
+    return state.board, state.next_player
+
+
+def timed_perft(board, next_player, depth, engine):
+    """
+    :return: int, float: leaf nodes, seconds
+    """
+    start = time.perf_counter()
+    nodes = perft(board, next_player, depth, engine)
+    return nodes, time.perf_counter() - start
+
+
+@click.command()
+@click.option("-d", "--depth", default=5, show_default=True,
+              help="Moves to search, passes included.")
+@click.option("-e", "--engine", type=click.Choice(ENGINES + ("all",)),
+              default="all", show_default=True,
+              help="Engine to run. all cross-checks every engine.")
+@click.option("--plies", default=0, show_default=True,
+              help="Random moves played from the start position first.")
+@click.option("--seed", default=0, show_default=True,
+              help="Seed for the random moves.")
+def main(depth, engine, plies, seed):
+    board, next_player = random_position(plies, seed)
+    engines = ENGINES if engine == "all" else (engine,)
+
+    counts = {}
+    print("engine     depth  nodes       seconds  nodes/s")
+    for name in engines:
+        for d in range(1, depth + 1):
+            nodes, seconds = timed_perft(board, next_player, d, name)
+            counts[name, d] = nodes
+            print("{:9s}  {:5d}  {:10d}  {:7.2f}  {:8.0f}".format(
+                name, d, nodes, seconds, nodes / max(seconds, 1e-9)))
+
+    if plies == 0:
+        for (name, d), nodes in counts.items():
+            if d < len(START_PERFT) and nodes != START_PERFT[d]:
+                print("MISMATCH: {} perft({}) = {}, expected {}".format(
+                    name, d, nodes, START_PERFT[d]))
+
+    for d in range(1, depth + 1):
+        found = {counts[name, d] for name in engines}
+        if len(found) > 1:
+            print("MISMATCH at depth {}: {}".format(
+                d, {name: counts[name, d] for name in engines}))
+            for name in engines:
+                print(name, divide(board, next_player, d, name))
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
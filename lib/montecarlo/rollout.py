@@ -0,0 +1,89 @@
+"""Random playouts used by vanilla Monte Carlo Tree Search."""
+import random
+import time
+
+from lib.montecarlo.bitboard import flips, iter_squares, legal_moves, popcount
+from lib.montecarlo.game import Move
+
+
+def random_rollout(p1_bits, p2_bits, next_player, rng=random):
+    """
+    Play random moves until the game ends. Runs on a pair of bitboards in a
+    single loop, without creating GameState or Node objects.
+    :param p1_bits: int: player 1 bitboard
+    :param p2_bits: int: player 2 bitboard
+    :param next_player: int: player to move
+    :param rng: random.Random: source of random moves.
+    :return: int: Represents the game result. 1, 2, or 0 for a draw
+    """
+    # Always play from the perspective of the player to move
+    if next_player == 1:
+        own, opp = p1_bits, p2_bits
+    else:
+        own, opp = p2_bits, p1_bits
+    player = next_player
+
+    passed = False
+    while True:
+        moves = legal_moves(own, opp)
+        if moves:
+            square = rng.choice(list(iter_squares(moves)))
+            placed = 1 << square
+            flipped = flips(own, opp, placed)
+            own |= placed | flipped
+            opp ^= flipped
+            passed = False
+        elif passed:
+            # Neither player can make legal moves
+            break
+        else:
+            passed = True
+        own, opp = opp, own
+        player = 3 - player
+
+    # own belongs to player, opp to the other player
+    own_count = popcount(own)
+    opp_count = popcount(opp)
+    if own_count > opp_count:
+        return player
+    elif opp_count > own_count:
+        return 3 - player
+    return 0
+
+
+def gamestate_rollout(state, rng=random):
+    """
+    Play random moves until the game ends using GameState.move. This is the
+    object-based path that random_rollout replaces, kept for comparison.
+    :param state: GameState: represents the state of the game
+    :param rng: random.Random: source of random moves.
+    :return: int: Represents the game result. 1, 2, or 0 for a draw
+    """
+    while not state.game_over():
+        legal = state.get_legal_moves()
+        if not legal:
+            move = Move(None, None, state.next_player)
+        else:
+            move = rng.choice(legal)
+        state = state.move(move)
+    return state.game_result()
+
+
+def rollouts_per_second(state, num_rollouts=1000, rollout=None, seed=0):
+    """
+    Measure rollout throughput from a state.
+    :param state: GameState: state to play out from.
+    :param num_rollouts: int: number of rollouts to time.
+    :param rollout: function: gamestate_rollout, or None to time random_rollout.
+    :param seed: int: RNG seed, so runs are comparable.
+    :return: float: rollouts per second
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(num_rollouts):
+        if rollout is None:
+            random_rollout(state.bitboards[0], state.bitboards[1],
+                           state.next_player, rng)
+        else:
+            rollout(state, rng)
+    return num_rollouts / (time.perf_counter() - start)
@@ -0,0 +1,97 @@
+"""
+Measures how tree-parallel search scales with the number of threads.
+
+    $ python lib/montecarlo/scaling.py -n 800 -t 1 -t 2 -t 4 saved_othello_model.10
+    $ python lib/montecarlo/scaling.py -n 2000 -t 1 -t 2 -t 4 mcts
+    $ python lib/montecarlo/scaling.py -n 20000 -t 1 -t 2 -t 4 -b 16 -r 64 mcts
+"""
+import time
+
+import click
+import torch
+
+from lib.ml.run import EVALUATION_CACHE
+from lib.montecarlo.budget import SearchBudget
+from lib.montecarlo.game import initial_state
+from lib.montecarlo.nodes import Node
+from lib.montecarlo.tree import Tree
+
+THREAD_COUNTS = (1, 2, 4, 8)
+
+
+def thread_scaling(model, num_simulations, thread_counts=THREAD_COUNTS,
+                   batch_size=1, state=None, rollouts_per_leaf=1):
+    """
+    Time a fixed number of simulations from one position for each thread
+    count. Searches don't stop early, so every run does the same work.
+    :param model: string: model filename, or None to use vanilla mcts
+    :param num_simulations: int: simulations per search.
+    :param thread_counts: list: thread counts to measure.
+    :param batch_size: int: leaves per forward pass, or per batch of
+           rollouts, per thread.
+    :param state: GameState: position to search, the initial board if None.
+    :param rollouts_per_leaf: int: random games played from each leaf by
+           vanilla mcts.
+    :return: list: (threads, seconds, simulations per second, speedup over
+             the first thread count)
+    """
+    if state is None:
+        state = initial_state()
+
+    results = []
+    for threads in thread_counts:
+        # Every run starts from a cold evaluation cache
+        EVALUATION_CACHE.clear()
+        tree = Tree(Node(state), threads=threads,
+                    rollouts_per_leaf=rollouts_per_leaf)
+        budget = SearchBudget(num_simulations, early_stop=False)
+
+        start = time.monotonic()
+        if threads > 1:
+            tree.run_parallel_simulations(budget, model, batch_size)
+        else:
+            while not budget.exhausted():
+                if model is not None and batch_size > 1:
+                    budget.add(tree.simulate_batch(model, batch_size))
+                elif model is None and \
+                        (batch_size > 1 or rollouts_per_leaf > 1):
+                    budget.add(tree.simulate_rollout_batch(
+                        *tree._rollout_batch_size(budget, batch_size)))
+                else:
+                    tree.simulate(model)
+                    budget.add(1)
+        seconds = time.monotonic() - start
+
+        rate = budget.completed / seconds
+        speedup = rate / results[0][2] if results else 1.0
+        results.append((threads, seconds, rate, speedup))
+    return results
+
+
+@click.command()
+@click.option("-n", "--num-simulations", default=800, show_default=True,
+              help="Simulations per search.")
+@click.option("-t", "--threads", "thread_counts", multiple=True, type=int,
+              default=THREAD_COUNTS, show_default=True,
+              help="Thread counts to measure.")
+@click.option("-b", "--batch-size", default=1, show_default=True,
+              help="Leaves per forward pass, or per batch of rollouts, per "
+                   "thread.")
+@click.option("-r", "--rollouts-per-leaf", default=1, show_default=True,
+              help="Random games played from each leaf by vanilla mcts.")
+@click.argument("model")
+def main(num_simulations, thread_counts, batch_size, rollouts_per_leaf, model):
+    # Threads supply the parallelism, keep torch from competing with them
+    torch.set_num_threads(1)
+    model = None if model == "mcts" else model
+
+    print("threads  seconds  sims/s  speedup")
+    for threads, seconds, rate, speedup in thread_scaling(
+            model, num_simulations, thread_counts, batch_size,
+            rollouts_per_leaf=rollouts_per_leaf):
+        print("{:7d}  {:7.2f}  {:6.0f}  {:6.2f}x".format(
+            threads, seconds, rate, speedup))
+
+
+if __name__ == '__main__':
+    main()
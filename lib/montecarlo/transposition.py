@@ -0,0 +1,71 @@
+"""Transposition table shared by searches over the same positions."""
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES = 50000
+
+
+class TranspositionTable:
+    """
+    Bounded cache of network evaluations keyed by a state's Zobrist hash.
+
+    Othello reaches the same position through different move orders, so
+    nodes for the same position can share one forward pass. When the table is
+    full the least recently used entry is replaced.
+    """
+    def __init__(self, max_entries=MAX_ENTRIES):
+        """
+        Initialize the table.
+        :param max_entries: int: maximum number of cached positions.
+        """
+        self.max_entries = max_entries
+        # zobrist -> (next_player, bitboards, value, policy)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Search threads share one table
+        self.lock = threading.Lock()
+
+    def lookup(self, state):
+        """
+        Get the cached evaluation of a state.
+        :param state: GameState: represents the state of the game
+        :return: (value, policy) or None if the state isn't cached.
+        """
+        with self.lock:
+            entry = self.entries.get(state.zobrist)
+            # Compare the full position so hash collisions are treated as
+            # misses
+            if entry is None or entry[0] != state.next_player or \
+                    entry[1] != state.bitboards:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(state.zobrist)
+            return entry[2], entry[3]
+
+    def store(self, state, value, policy):
+        """
+        Cache the evaluation of a state.
+        :param state: GameState: represents the state of the game
+        :param value: float: model value at this state.
+        :param policy: 2D array: 8x8 model policy at this state.
+        """
+        with self.lock:
+            self.entries[state.zobrist] = (state.next_player, state.bitboards,
+                                           value, policy)
+            self.entries.move_to_end(state.zobrist)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        """
+        Fraction of lookups answered from the table.
+        :return: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,49 +1,100 @@
 """The mcts used to identify promising moves."""
+import threading
+
 import numpy as np
 
+from lib.ml.run import evaluate_model_at_gamestates
+from lib.montecarlo.batch_rollout import batch_rollout
+from lib.montecarlo.budget import SearchBudget
+from lib.montecarlo.nodes import EXPLORATION
+
+# Virtual visits added to each node on a selected path while its leaf waits
+# for a batched evaluation.
+VIRTUAL_LOSS = 1
+# Seconds a search thread waits for other threads' evaluations when it
+# has no leaf to select.
+PENDING_WAIT = 0.01
+
+
 class Tree:
-    def __init__(self, root_node):
+    def __init__(self, root_node, table=None, c=EXPLORATION, fpu=None,
+                 threads=1, rollouts_per_leaf=1):
         """
         Initialize the tree with a root node.
         :param root_node: Node: root of this tree. Usually the initial board.
+        :param table: TranspositionTable: cached model evaluations shared
+               between transpositions, or None.
+        :param c: double: exploration parameter used during selection.
+        :param fpu: double: first play urgency, the value assumed for
+               unvisited children during selection. None scores them as 0.
+        :param threads: int: worker threads searching the tree together,
+               see run_parallel_simulations.
+        :param rollouts_per_leaf: int: random games played from each leaf by
+               vanilla mcts. Each game counts as one simulation.
         """
         self.root = root_node
+        self.table = table
+        self.c = c
+        self.fpu = fpu
+        self.threads = threads
+        self.rollouts_per_leaf = rollouts_per_leaf
 
-    def best_move(self, num_simulations, model):
+        # Guards the tree statistics when searching with several threads.
+        # Workers wait on updated when every leaf they could select is
+        # already being evaluated by another worker.
+        self.lock = threading.Lock()
+        self.updated = threading.Condition(self.lock)
+        # Leaves selected by a thread and waiting for their evaluation
+        self.pending = set()
+
+    def best_move(self, num_simulations, model, batch_size=1,
+                  time_budget=None):
         """
         Selects the best move.
-        :param num_simulations: int: the number of mcts simulations to run
+        :param num_simulations: int: the maximum number of mcts simulations to
+               run, or None to search until time_budget runs out.
+        :param model: string: model filename, or None to use vanilla mcts
+        :param batch_size: int: number of leaves evaluated per forward pass
+               when searching with a model.
+        :param time_budget: float: maximum seconds to search, or None.
         :return: Node, list: the best move at this game state, the number of
                  mcts visits to each square on the board (all possible moves
                  including illegal).
         """
-        for _ in range(0, num_simulations):
-            # Select leaf node to run a simulation on using UCB
-            leaf = self.select()
-
-            # Use vanilla monte carlo tree search
-            if model is None:
-                # Expand this node and choose a random child
-                leaf.expand_mcts()
-                child_node = leaf.random_child()
+        moves = self.root.state.get_legal_moves()
+        # TODO: In future iterations, handle a "pass" move.
+        if not moves:
+            return None, None
 
-                # Child node will be none if this leaf node results
-                # in no valid moves
-                if child_node:
-                    # Rollout
-                    simulation_result = child_node.rollout()
-                    # Backpropogate
-                    child_node.backpropagate(simulation_result)
+        # A forced move doesn't need a search
+        if len(moves) == 1:
+            if not self.root.children:
+                self.root.expand_mcts()
+            child = self.root.children[0]
+            all_move_visits = [0] * 64
+            all_move_visits[moves[0].row * 8 + moves[0].col] = \
+                max(int(child.visit_count), 1)
+            return child, all_move_visits
 
-            # Use specified machine learning model
+        budget = SearchBudget(num_simulations, time_budget)
+        if self.threads > 1:
+            self.run_parallel_simulations(budget, model, batch_size)
+        while not budget.exhausted():
+            # Stop once the most visited move can't change
+            if self.root.children and \
+                    budget.decided(self.root.child_visit_count):
+                break
+            if model is not None and batch_size > 1:
+                budget.add(self.simulate_batch(
+                    model, int(min(batch_size, max(budget.remaining(), 1)))
+                ))
+            elif model is None and (batch_size > 1 or self.rollouts_per_leaf > 1):
+                budget.add(self.simulate_rollout_batch(
+                    *self._rollout_batch_size(budget, batch_size)))
             else:
-                # Expand this leaf node using the model, get the expected value
-                # of a win/loss, and assign priors to this node's children.
-                value = leaf.expand(model)
-                # Backpropagate the expected value from this node.
-                leaf.backpropagate(value)
+                self.simulate(model)
+                budget.add(1)
 
-        # TODO: In future iterations, handle a "pass" move.
         if not self.root.children:
             return None, None
         #
@@ -58,7 +109,7 @@ class Tree:
         for child in self.root.children:
             # Sets visit_count at 1D index of move.
             idx = child.transition_move.row * 8 + child.transition_move.col
-            all_move_visits[idx] = child.visit_count
+            all_move_visits[idx] = int(child.visit_count)
 
         # Create probability distribution to avoid overfitting
         dist = np.array([
@@ -74,6 +125,246 @@ class Tree:
                    np.random.choice(len(self.root.children), p=dist)
                ], all_move_visits
 
+    def simulate(self, model):
+        """
+        Runs a single simulation.
+        :param model: string: model filename, or None to use vanilla mcts
+        """
+        # Select leaf node to run a simulation on using UCB
+        leaf = self.select()
+
+        # Use vanilla monte carlo tree search
+        if model is None:
+            # Expand this node and choose a random child
+            leaf.expand_mcts()
+            child_node = leaf.random_child()
+
+            # Child node will be none if this leaf node results
+            # in no valid moves
+            if child_node:
+                # Rollout
+                simulation_result = child_node.rollout()
+                # Backpropogate
+                child_node.backpropagate(simulation_result)
+
+        # Use specified machine learning model
+        else:
+            # Expand this leaf node using the model, get the expected value
+            # of a win/loss, and assign priors to this node's children.
+            value = leaf.expand(model, self.table)
+            # Backpropagate the expected value from this node.
+            leaf.backpropagate(value)
+
+    def simulate_rollout_batch(self, batch_size, rollouts=None):
+        """
+        Runs vanilla mcts simulations for up to batch_size leaves, playing
+        rollouts_per_leaf random games from each. All games are played
+        together by batch_rollout. Virtual loss steers the selections in a
+        batch to different leaves.
+        :param batch_size: int: maximum number of leaves.
+        :param rollouts: int: games per leaf, rollouts_per_leaf if None.
+        :return: int: number of simulations (games) completed.
+        """
+        if rollouts is None:
+            rollouts = self.rollouts_per_leaf
+        children, completed = self._select_rollout_children(batch_size,
+                                                            rollouts)
+        if not children:
+            return completed
+
+        results = self._play_rollouts(children, rollouts)
+        self._backup_rollouts(children, results)
+        return completed + len(children) * rollouts
+
+    def _rollout_batch_size(self, budget, batch_size):
+        """
+        Size the next batch of rollouts to play at most the simulations left
+        in the budget, so the last batch doesn't overshoot it.
+        :param budget: SearchBudget
+        :param batch_size: int: maximum number of leaves.
+        :return: int, int: leaves, games per leaf.
+        """
+        remaining = max(budget.remaining(), 1)
+        rollouts = int(min(self.rollouts_per_leaf, remaining))
+        return int(min(batch_size, max(remaining // rollouts, 1))), rollouts
+
+    def _select_rollout_children(self, batch_size, rollouts):
+        """
+        Select up to batch_size leaves for rollouts, expand them and pick a
+        random child of each, applying virtual loss to the child's path.
+        :param rollouts: int: games that will be played from each child.
+        :return: list, int: children to play rollouts from, simulations
+                 already completed.
+        """
+        completed = 0
+        children = []
+        for _ in range(max(batch_size, 1)):
+            # Expand this node and choose a random child
+            leaf = self.select()
+            if not leaf.children:
+                leaf.expand_mcts()
+            child_node = leaf.random_child()
+            # Leaves without valid moves end the simulation
+            if child_node is None:
+                completed += 1
+                continue
+            child_node.add_virtual_loss(rollouts)
+            children.append(child_node)
+        return children, completed
+
+    def _play_rollouts(self, children, count):
+        """
+        Play count random games from each child with batch_rollout. Doesn't
+        touch the tree, so it can run without holding self.lock.
+        :return: numpy array: shape (len(children), count) results
+        """
+        return batch_rollout(
+            np.repeat([child.state.bitboards[0] for child in children], count),
+            np.repeat([child.state.bitboards[1] for child in children], count),
+            np.repeat([child.state.next_player for child in children], count),
+            len(children) * count,
+        ).reshape(len(children), count)
+
+    def _backup_rollouts(self, children, results):
+        """Revert the virtual loss of rollout children and backpropagate."""
+        for child_node, child_results in zip(children, results):
+            child_node.revert_virtual_loss(len(child_results))
+            child_node.backpropagate_results(child_results)
+
+    def run_batched_simulations(self, num_simulations, model, batch_size):
+        """
+        Runs simulations using the model, evaluating up to batch_size leaves
+        with each forward pass.
+        :param num_simulations: int: the number of mcts simulations to run
+        :param model: string: model filename
+        :param batch_size: int: maximum number of leaves per forward pass
+        """
+        completed = 0
+        while completed < num_simulations:
+            completed += self.simulate_batch(
+                model, min(batch_size, num_simulations - completed)
+            )
+
+    def simulate_batch(self, model, batch_size):
+        """
+        Runs up to batch_size simulations using the model with one forward
+        pass. Virtual loss is applied to each selected path so that the
+        following selections in the batch reach other leaves.
+        :param model: string: model filename
+        :param batch_size: int: maximum number of leaves per forward pass
+        :return: int: number of simulations completed.
+        """
+        leaves, completed = self._select_leaves(batch_size)
+        if not leaves:
+            return completed
+
+        values, policies = evaluate_model_at_gamestates(
+            [leaf.state for leaf in leaves], model
+        )
+        self._backup_leaves(leaves, values, policies)
+        return completed + len(leaves)
+
+    def _select_leaves(self, batch_size):
+        """
+        Select up to batch_size leaves for evaluation, applying virtual loss
+        to their paths. Leaves whose evaluation is in the transposition table
+        are expanded right away.
+        :return: list, int: leaves to evaluate, simulations already completed.
+        """
+        completed = 0
+        leaves = []
+        while len(leaves) + completed < batch_size:
+            leaf = self.select()
+            # Virtual loss doesn't guarantee a new leaf. Evaluate what we
+            # have rather than expanding the same leaf twice.
+            if leaf in self.pending:
+                break
+            # Transpositions already in the table don't need the model
+            cached = self.table.lookup(leaf.state) \
+                if self.table is not None else None
+            if cached is not None:
+                leaf.expand_with_policy(cached[1])
+                leaf.backpropagate(cached[0])
+                completed += 1
+                continue
+            leaf.add_virtual_loss(VIRTUAL_LOSS)
+            self.pending.add(leaf)
+            leaves.append(leaf)
+        return leaves, completed
+
+    def _backup_leaves(self, leaves, values, policies):
+        """Expand evaluated leaves and backpropagate their values."""
+        for leaf, value, policy in zip(leaves, values, policies):
+            leaf.revert_virtual_loss(VIRTUAL_LOSS)
+            self.pending.discard(leaf)
+            if self.table is not None:
+                self.table.store(leaf.state, value, policy)
+            # Assign priors to this leaf's children and backpropagate the
+            # expected value from this node.
+            leaf.expand_with_policy(policy)
+            leaf.backpropagate(value)
+
+    def run_parallel_simulations(self, budget, model, batch_size=1):
+        """
+        Search with self.threads worker threads sharing this tree.
+
+        Workers hold self.lock only to select leaves and to update statistics.
+        Rollouts and forward passes run outside the lock, with virtual loss
+        on their paths steering the other workers elsewhere. Torch releases
+        the GIL during forward passes. Rollouts are played by batch_rollout,
+        rollouts_per_leaf games from each of up to batch_size leaves per
+        worker turn, and NumPy releases the GIL while it steps the games.
+        :param budget: SearchBudget: shared by all workers.
+        :param model: string: model filename, or None to use vanilla mcts
+        :param batch_size: int: maximum leaves per forward pass or per batch
+               of rollouts per worker.
+        """
+        workers = [
+            threading.Thread(target=self._parallel_worker,
+                             args=(budget, model, max(batch_size, 1)))
+            for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def _parallel_worker(self, budget, model, batch_size):
+        while True:
+            with self.lock:
+                if budget.exhausted() or (
+                        self.root.children and
+                        budget.decided(self.root.child_visit_count)):
+                    return
+
+                if model is None:
+                    size, count = self._rollout_batch_size(budget, batch_size)
+                    children, completed = self._select_rollout_children(
+                        size, count)
+                    budget.add(completed + len(children) * count)
+                    if not children:
+                        continue
+                else:
+                    size = int(min(batch_size, max(budget.remaining(), 1)))
+                    leaves, completed = self._select_leaves(size)
+                    budget.add(completed + len(leaves))
+                    if not leaves:
+                        if not completed:
+                            self.updated.wait(PENDING_WAIT)
+                        continue
+
+            if model is None:
+                results = self._play_rollouts(children, count)
+                with self.lock:
+                    self._backup_rollouts(children, results)
+            else:
+                values, policies = evaluate_model_at_gamestates(
+                    [leaf.state for leaf in leaves], model
+                )
+                with self.lock:
+                    self._backup_leaves(leaves, values, policies)
+                    self.updated.notify_all()
+
     def select(self):
         """
         Select node to expand.
@@ -83,6 +374,6 @@ class Tree:
 
         # Select promising children using UCB until we reach a leaf node.
         while current_node.children:
-            current_node = current_node.promising_child()
+            current_node = current_node.promising_child(self.c, self.fpu)
 
         return current_node
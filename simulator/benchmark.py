@@ -0,0 +1,256 @@
+"""
+Benchmarks for the engine, the search and self-play.
+
+Every benchmark runs on the same seeded positions (opening, midgame and
+endgame) and reports the median of several repeats. Results are written as
+JSON so runs can be compared across commits:
+
+    $ python simulator/benchmark.py -o baseline.json
+    $ python simulator/benchmark.py --model saved_othello_model.10 --games 2
+
+Without --model, search and forward pass timings use an untrained model of
+the production size, whose weights don't affect speed.
+"""
+import io
+import os
+import json
+import time
+import random
+import platform
+import contextlib
+import statistics
+import subprocess
+import tempfile
+
+import click
+import numpy as np
+import torch
+
+from lib.ml.othello_model import OthelloModel
+from lib.ml.run import EVALUATION_CACHE, NUM_BLOCKS, NUM_FILTERS, \
+    evaluate_planes
+from lib.montecarlo.batch_rollout import batch_rollout
+from lib.montecarlo.endgame import empties
+from lib.montecarlo.game import GameState, Move, initial_state
+from lib.montecarlo.nodes import Node
+from lib.montecarlo.rollout import random_rollout
+from lib.montecarlo.tree import Tree
+from simulator.run import Simulator, seed_rngs
+
+SEED = 0
+REPEATS = 5
+# Number of random moves played from the initial board for each position
+POSITION_PLIES = {"opening": 0, "midgame": 24, "endgame": 46}
+BATCH_SIZES = (1, 8, 32, 128)
+
+
+def benchmark_positions(seed=SEED):
+    """
+    Get the positions every benchmark runs on.
+    :param seed: int: seed for the random moves leading to each position.
+    :return: dict: name -> GameState
+    """
+    positions = {}
+    for name, plies in POSITION_PLIES.items():
+        rng = random.Random(seed)
+        state = initial_state()
+        for _ in range(plies):
+            moves = state.get_legal_moves()
+            state = state.move(rng.choice(moves) if moves
+                               else Move(None, None, state.next_player))
+        positions[name] = state
+    return positions
+
+
+def median_rate(function, count, repeats=REPEATS):
+    """
+    Time a function and convert to a rate.
+    :param function: function: does `count` operations per call.
+    :param count: int: operations per call.
+    :param repeats: int: number of timed calls.
+    :return: float: median operations per second.
+    """
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        rates.append(count / (time.perf_counter() - start))
+    return statistics.median(rates)
+
+
+def fresh_state(state):
+    # States cache their legal moves, so time copies that haven't
+    return GameState(state.next_player, bitboards=state.bitboards,
+                     zobrist=state.zobrist)
+
+
+def benchmark_movegen(state, count=2000):
+    """
+    :return: dict: get_legal_moves and move calls per second.
+    """
+    move = state.get_legal_moves()[0]
+
+    legal_rates = []
+    for _ in range(REPEATS):
+        copies = [fresh_state(state) for _ in range(count)]
+        start = time.perf_counter()
+        for copy in copies:
+            copy.get_legal_moves()
+        legal_rates.append(count / (time.perf_counter() - start))
+
+    def play():
+        for _ in range(count):
+            state.move(move)
+
+    return {
+        "get_legal_moves_per_sec": statistics.median(legal_rates),
+        "move_per_sec": median_rate(play, count),
+    }
+
+
+def benchmark_rollouts(state, count=200, batch=256):
+    """
+    :return: dict: rollouts per second, one at a time and in batches.
+    """
+    p1_bits, p2_bits = state.bitboards
+    rng = random.Random(SEED)
+    np_rng = np.random.RandomState(SEED)
+
+    def scalar():
+        for _ in range(count):
+            random_rollout(p1_bits, p2_bits, state.next_player, rng)
+
+    def batched():
+        batch_rollout(p1_bits, p2_bits, state.next_player, batch, np_rng)
+
+    return {
+        "rollouts_per_sec": median_rate(scalar, count),
+        "batch_rollouts_per_sec": median_rate(batched, batch),
+        "batch_rollout_size": batch,
+    }
+
+
+def benchmark_search(state, model, num_simulations):
+    """
+    :param model: string: model filename, or None for vanilla mcts.
+    :return: dict: simulations per second for Tree.best_move.
+    """
+    def search():
+        EVALUATION_CACHE.clear()
+        # Simulate directly so early stopping doesn't change the work done
+        tree = Tree(Node(fresh_state(state)))
+        for _ in range(num_simulations):
+            tree.simulate(model)
+
+    return {"simulations_per_sec": median_rate(search, num_simulations, 3)}
+
+
+def benchmark_forward(model, batch_sizes=BATCH_SIZES):
+    """
+    :return: dict: batch size -> median seconds per forward pass.
+    """
+    rng = np.random.RandomState(SEED)
+    latencies = {}
+    for batch_size in batch_sizes:
+        planes = rng.randint(0, 2, size=(batch_size, 2, 8, 8))
+        # Warm up, the first pass allocates
+        evaluate_planes(planes, model)
+        latencies[str(batch_size)] = 1 / median_rate(
+            lambda: evaluate_planes(planes, model), 1
+        )
+    return latencies
+
+
+def benchmark_games(player1_type, player2_type, games):
+    """
+    :return: dict: Simulator games per hour.
+    """
+    start = time.perf_counter()
+    for i in range(games):
+        seed_rngs(SEED + i)
+        # play_game prints the final board, keep stdout for the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            Simulator(player1_type, player2_type).play_game()
+    return {
+        "players": [player1_type, player2_type],
+        "games": games,
+        "games_per_hour": games * 3600 / (time.perf_counter() - start),
+    }
+
+
+def environment():
+    """
+    :return: dict: what the results were measured on.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "seed": SEED,
+    }
+
+
+def run_benchmarks(model, simulations, games, player_types):
+    """
+    Run every benchmark.
+    :param model: string: model filename, see lib.ml.run.get_model.
+    :param simulations: int: simulations per timed search.
+    :param games: int: games for the games/hour benchmark, 0 to skip it.
+    :param player_types: tuple: player types for the games, see Simulator.
+    :return: dict: JSON serializable results.
+    """
+    seed_rngs(SEED)
+    results = {"environment": environment(), "positions": {}}
+    for name, state in benchmark_positions().items():
+        results["positions"][name] = {
+            "empties": empties(state),
+            "movegen": benchmark_movegen(state),
+            "rollouts": benchmark_rollouts(state),
+            "mcts": benchmark_search(state, None, simulations),
+            "model_search": benchmark_search(state, model, simulations),
+        }
+    results["forward_latency_sec"] = benchmark_forward(model)
+    if games:
+        results["self_play"] = benchmark_games(*player_types, games)
+    return results
+
+
+@click.command()
+@click.option("-m", "--model", default=None,
+              help="Model to time. An untrained model is used by default.")
+@click.option("-n", "--simulations", default=200, show_default=True,
+              help="Simulations per timed search.")
+@click.option("-g", "--games", default=1, show_default=True,
+              help="Games for the games/hour benchmark. 0 skips it.")
+@click.option("-p", "--players", nargs=2, default=("mcts", "random"),
+              show_default=True, help="Player types for the games.")
+@click.option("-o", "--output", default=None,
+              help="Write results to this file instead of stdout.")
+def main(model, simulations, games, players, output):
+    with tempfile.TemporaryDirectory() as directory:
+        if model is None:
+            model = os.path.join(directory, "untrained_model")
+            torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+        results = run_benchmarks(model, simulations, games, players)
+
+    text = json.dumps(results, indent=2)
+    if output is None:
+        print(text)
+    else:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,176 @@
 """Othello player types."""
+import time
 import random
 
 from lib.montecarlo.tree import Tree
 from lib.montecarlo.nodes import Node
+from lib.montecarlo.array_tree import ArrayTree
+from lib.montecarlo.endgame import ENDGAME_EMPTIES, EndgameSolver, empties, \
+    score_to_winloss
+from lib.montecarlo.transposition import TranspositionTable
+
+# Number of leaves ModelPlayer evaluates per forward pass.
+BATCH_SIZE = 16
+# Maximum simulations per move.
+MODEL_SIMULATIONS = 500
+MCTS_SIMULATIONS = 1300
+# Leaves MCTSPlayer expands per batch of rollouts, and random games played
+# from each of them. Each game counts as one of its simulations.
+MCTS_BATCH_SIZE = 16
+ROLLOUTS_PER_LEAF = 4
+
+
+def reuse_subtree(previous, board):
+    """
+    Get a search root for board, keeping the statistics gathered below the
+    node chosen on the previous turn when the game entered that subtree.
+    :param previous: Node: node chosen last turn, or None.
+    :param board: GameState: represents the state of the game
+    :return: Node: detached subtree root, or a fresh root if this position
+             wasn't explored.
+    """
+    if previous is not None:
+        # The opponent's reply is one of the children of our last move
+        node = previous.find_descendant(board, max_depth=1)
+        if node is not None:
+            node.detach()
+            return node
+    return Node(state=board)
+
+
+def reuse_array_subtree(previous, board, table=None):
+    """
+    Same as reuse_subtree, for players searching with an ArrayTree.
+    :param previous: tuple: (ArrayTree, id of the node chosen last turn), or None.
+    :param board: GameState: represents the state of the game
+    :param table: TranspositionTable: passed to a fresh tree.
+    :return: ArrayTree: compacted subtree, or a fresh tree if this position
+             wasn't explored.
+    """
+    if previous is not None:
+        tree, node = previous
+        child = tree.find_child(node, board)
+        if child is not None:
+            return tree.subtree(child)
+    return ArrayTree(board, table)
+
+
+def search(player, board, num_simulations, model, batch_size=1, table=None,
+           rollouts_per_leaf=1):
+    """
+    Run a search for a model or mcts player, reusing the subtree chosen on the
+    player's previous turn.
+    :param player: ModelPlayer or MCTSPlayer: player searching. Its
+           last_node and compact attributes are read and updated. When it has
+           a time_manager, the search also stops when the move's share of
+           the clock runs out.
+    :return: Move, list: chosen move and number of visits for each square.
+             None, None when there is no legal move.
+    """
+    time_budget = None
+    if player.time_manager is not None:
+        time_budget = player.time_manager.budget(board)
+    start = time.monotonic()
+
+    if player.compact:
+        tree = reuse_array_subtree(player.last_node, board, table)
+        best, all_move_visits = tree.best_move(num_simulations, model,
+                                               batch_size, time_budget)
+        player.last_node = None if best is None else (tree, best)
+        move = None if best is None else tree.transition_move(best)
+    else:
+        root = reuse_subtree(player.last_node, board)
+        mcts = Tree(root, table, threads=player.threads,
+                    rollouts_per_leaf=rollouts_per_leaf)
+
+        best_node, all_move_visits = mcts.best_move(num_simulations, model,
+                                                    batch_size, time_budget)
+        player.last_node = best_node
+        move = None if best_node is None else best_node.transition_move
+
+    if player.time_manager is not None:
+        player.time_manager.spend(time.monotonic() - start)
+    if move is None:
+        return None, None
+    return move, all_move_visits
+
+
+def solve_endgame(player, board):
+    """
+    Solve the position exactly once few enough squares are empty.
+    :param player: ModelPlayer or MCTSPlayer: player searching. Its
+           endgame_empties and solver attributes are read, solved_value and
+           last_node are updated.
+    :param board: GameState: represents the state of the game
+    :return: Move, list: chosen move and a visit count of 1 on its square.
+             None, None when the position is not solved or there is no legal
+             move.
+    """
+    player.solved_value = None
+    if player.endgame_empties is None or empties(board) > player.endgame_empties:
+        return None, None
+
+    move, score = player.solver.solve(board, exact=False)
+    player.solved_value = score_to_winloss(score)
+    # Search trees from before the endgame are not reused
+    player.last_node = None
+    if move is None:
+        return None, None
+
+    all_move_visits = [0] * 64
+    all_move_visits[move.row * 8 + move.col] = 1
+    return move, all_move_visits
 
 
 class RandomPlayer:
     """A player that uses random selection of legal moves."""
     def __init__(self, player_num):
         self.player_num = player_num
+        self.solved_value = None
 
     def get_move(self, board):
         legal = board.get_player_legal_moves(self.player_num)
+        if not legal:
+            return None, None
         move = random.choice(legal)
         return [move.row, move.col], None
 
 
 class ModelPlayer:
     """A player that uses a machine learning model."""
-    def __init__(self, player_num, model):
+    def __init__(self, player_num, model, batch_size=BATCH_SIZE, compact=False,
+                 endgame_empties=ENDGAME_EMPTIES,
+                 num_simulations=MODEL_SIMULATIONS, time_manager=None,
+                 threads=1):
+        """
+        :param compact: bool: search with an array backed ArrayTree instead of
+               Node objects.
+        :param endgame_empties: int: solve positions exactly instead of
+               searching once at most this many squares are empty. None
+               always searches.
+        :param num_simulations: int: maximum simulations per move, or None to
+               search for the time_manager's budget only.
+        :param time_manager: TimeManager: game clock to split between moves,
+               or None to search without a time limit.
+        :param threads: int: threads searching each move's tree together.
+               Not used with compact trees.
+        """
         self.player_num = player_num
         self.model = model
+        self.batch_size = batch_size
+        self.compact = compact
+        self.num_simulations = num_simulations
+        self.time_manager = time_manager
+        self.threads = threads
+        self.endgame_empties = endgame_empties
+        self.solver = EndgameSolver()
+        # Result of the last solved position for the player who created it,
+        # see score_to_winloss. None when the last move was searched.
+        self.solved_value = None
+        # Node chosen on our last turn. Its subtree is reused next turn.
+        self.last_node = None
+        # Model evaluations shared by transpositions, kept for the whole game
+        self.table = TranspositionTable()
 
     def get_move(self, board):
         """
@@ -28,35 +178,63 @@ class ModelPlayer:
         :param board:
         :return:
         """
-        root = Node(state=board)
-        mcts = Tree(root)
-
-        best_node, all_move_visits = mcts.best_move(500, self.model)
-        if best_node is None:
+        move, all_move_visits = solve_endgame(self, board)
+        if self.solved_value is None:
+            move, all_move_visits = search(self, board, self.num_simulations,
+                                           self.model, self.batch_size,
+                                           self.table)
+        if move is None:
             return None, None
 
-        move = best_node.transition_move
         return [move.row, move.col], all_move_visits
 
 
 class MCTSPlayer:
     """A player that uses a vanilla Monte Carlo Tree Search."""
-    def __init__(self, player_num):
+    def __init__(self, player_num, compact=False,
+                 endgame_empties=ENDGAME_EMPTIES,
+                 num_simulations=MCTS_SIMULATIONS, time_manager=None,
+                 threads=1, batch_size=MCTS_BATCH_SIZE,
+                 rollouts_per_leaf=ROLLOUTS_PER_LEAF):
+        """
+        :param compact: bool: search with an array backed ArrayTree instead of
+               Node objects.
+        :param endgame_empties: int: solve positions exactly instead of
+               searching once at most this many squares are empty. None
+               always searches.
+        :param num_simulations: int: see ModelPlayer.
+        :param time_manager: TimeManager: see ModelPlayer.
+        :param threads: int: see ModelPlayer.
+        :param batch_size: int: leaves expanded per batch of rollouts.
+        :param rollouts_per_leaf: int: random games played from each leaf.
+               Not used with compact trees.
+        """
         self.player_num = player_num
+        self.compact = compact
+        self.num_simulations = num_simulations
+        self.time_manager = time_manager
+        self.threads = threads
+        self.batch_size = batch_size
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.endgame_empties = endgame_empties
+        self.solver = EndgameSolver()
+        # Result of the last solved position, see ModelPlayer.
+        self.solved_value = None
+        # Node chosen on our last turn. Its subtree is reused next turn.
+        self.last_node = None
 
-    @staticmethod
-    def get_move(board):
+    def get_move(self, board):
         """
         Get's the player's chosen move and a list of move visits from mcts
         :param board: GameState: represents the state of the game
         :return: list, list: row and column, number of visits for each square
         """
-        root = Node(state=board)
-        mcts = Tree(root)
-
-        best_node, all_move_visits = mcts.best_move(1300, None)
-        if best_node is None:
+        move, all_move_visits = solve_endgame(self, board)
+        if self.solved_value is None:
+            move, all_move_visits = search(self, board, self.num_simulations,
+                                           None, self.batch_size, None,
+                                           self.rollouts_per_leaf)
+        if move is None:
             return None, None
 
-        move = best_node.transition_move
         return [move.row, move.col], all_move_visits
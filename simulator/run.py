@@ -1,47 +1,59 @@
 import os
-import json
 import time
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import click
+import numpy as np
+import torch
 
 from simulator.util import print_board
+from lib.ml.run import get_model
+from lib.ml.records import append_records
+from lib.ml.inference_server import connect, is_server_address
 from lib.montecarlo.util import other_player
-from lib.montecarlo.game import GameState, Move
-from simulator.player import RandomPlayer, MCTSPlayer, ModelPlayer
+from lib.montecarlo.game import Move, initial_state
+from simulator.player import RandomPlayer, MCTSPlayer, ModelPlayer, BATCH_SIZE
+
+# Number of games played per training data file.
+GAMES = 20
+
+
+def make_player(player_num, player_type, batch_size=BATCH_SIZE, compact=False):
+    """
+    Create a player.
+    :param player_num: int: 1 or 2
+    :param player_type: string: see Simulator.
+    :param batch_size: int: leaves evaluated per forward pass by model players.
+    :param compact: bool: model and mcts players search with ArrayTree.
+    :return: RandomPlayer, MCTSPlayer or ModelPlayer
+    """
+    if player_type == "random":
+        return RandomPlayer(player_num)
+    if player_type == "mcts":
+        return MCTSPlayer(player_num, compact)
+    if is_server_address(player_type):
+        return ModelPlayer(player_num, connect(player_type), batch_size, compact)
+    return ModelPlayer(player_num, player_type, batch_size, compact)
 
 
 class Simulator:
-    def __init__(self, player1_type, player2_type):
+    def __init__(self, player1_type, player2_type, batch_size=BATCH_SIZE,
+                 compact=False):
         """
         Initialize the game simulator.
         :param player1_type: string: name of this player's ml model, "random",
-               or mcts to use vanilla mcts
+               mcts to use vanilla mcts, or "unix:<socket>" to use the model of
+               an inference server
         :param player2_type: string: name of this player's ml model, "random",
-               or mcts to use vanilla mcts
-        """
-        initial_board = [
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 1, 2, 0, 0, 0],
-            [0, 0, 0, 2, 1, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0]
-        ]
-        self.board = GameState(1, initial_board)
-        if player1_type == "random":
-            self.p1 = RandomPlayer(1)
-        elif player1_type == "mcts":
-            self.p1 = MCTSPlayer(1)
-        else:
-            self.p1 = ModelPlayer(1, player1_type)
-
-        if player2_type == "random":
-            self.p2 = RandomPlayer(2)
-        elif player2_type == "mcts":
-            self.p2 = MCTSPlayer(2)
-        else:
-            self.p2 = ModelPlayer(2, player2_type)
+               mcts to use vanilla mcts, or "unix:<socket>" to use the model of
+               an inference server
+        :param batch_size: int: leaves evaluated per forward pass by model players.
+        :param compact: bool: model and mcts players search with ArrayTree.
+        """
+        self.board = initial_state()
+        self.p1 = make_player(1, player1_type, batch_size, compact)
+        self.p2 = make_player(2, player2_type, batch_size, compact)
 
         self.turn = 1
 
@@ -58,58 +70,58 @@ class Simulator:
         move = Move(row, col, player)
         self.board = self.board.move(move)
 
-    def store_game_state(self, counts):
+    def store_game_state(self, counts, solved_value=None):
         """
         Adds a single game state to the list of game states for this game.
         :param counts: list: number of times each square was visited by mcts
+        :param solved_value: float: exact win/loss value of this state from
+               the endgame solver, or None to use the game result.
         """
         if not counts:
             print("Cannot store training data with invalid y_policy")
             return
-        self.all_game_states.append([self.board, counts])
+        self.all_game_states.append([self.board, counts, solved_value])
 
     def store_game_result(self, result):
         """
-        Adds the result to each training example for this game.
+        Adds the result to each training example for this game. Solved
+        states keep their exact value.
         :param result: int: win/loss value for the game.
         """
         for state in self.all_game_states:
+            if state[2] is not None:
+                continue
 
             # Other player created this state, other player won
             if other_player(state[0].next_player) == result:
-                state.append(1)
+                state[2] = 1
             # This player created this state, other player won
             elif state[0].next_player == result:
-                state.append(0)
+                state[2] = 0
             else:
-                state.append(0.5)
+                state[2] = 0.5
 
-    def export_game_data(self, path):
+    def game_data(self):
         """
-        Appends game data to a json file.
-        :param path: string: path to json file.
+        Training examples for this game.
+        :return: list: one dict per stored game state.
         """
-        game_meta = [
+        return [
             {
                 "created_by": other_player(state[0].next_player),
-                "board": state[0].board,
+                "bitboards": list(state[0].bitboards),
                 "move_visits": state[1],
                 "winloss": state[2]
             }
             for state in self.all_game_states
         ]
 
-        try:
-            with open(path) as infile:
-                data = json.load(infile)
-                data.extend(game_meta)
-                print("TRAINING SET SIZE: {}".format(len(data)))
-
-            with open(path, 'w') as outfile:
-                json.dump(data, outfile)
-        except:
-            with open(path, 'w+') as outfile:
-                json.dump(game_meta, outfile)
+    def export_game_data(self, path):
+        """
+        Appends game data to a training data file.
+        :param path: string: path to .jsonl file.
+        """
+        append_records(path, self.game_data())
 
     def play_game(self, verbose=False, train=False):
         """
@@ -130,7 +142,8 @@ class Simulator:
                 else:
                     if train:
                         # Save current state for training
-                        self.store_game_state(all_move_visits)
+                        self.store_game_state(all_move_visits,
+                                              self.p1.solved_value)
                     self.update_board(move[0], move[1], 1)
                     if verbose:
                         print("Player 1 played at [{}, {}]".format(move[0], move[1]))
@@ -147,7 +160,8 @@ class Simulator:
                 else:
                     if train:
                         # Save current state for training
-                        self.store_game_state(all_move_visits)
+                        self.store_game_state(all_move_visits,
+                                              self.p2.solved_value)
                     self.update_board(move[0], move[1], 2)
                     if verbose:
                         print("Player 2 played at [{}, {}]".format(move[0], move[1]))
@@ -159,35 +173,161 @@ class Simulator:
         return result, self.board.board
 
 
-def run_create_training_data(player1_type, player2_type, verbose):
+def training_data_path():
+    """
+    Get a new timestamped training data path in lib/ml/training/
+    :return: string
     """
-    Play 20 games and write training data to a json file in lib/ml/training/
+    timestamp = time.time()
+    filename = "training{}.jsonl".format(timestamp)
+    return os.path.join(
+        os.path.dirname(os.path.dirname(__file__)),
+        "lib", "ml", "training",
+        filename)
+
+
+def run_create_training_data(player1_type, player2_type, verbose,
+                             batch_size=BATCH_SIZE, games=GAMES, workers=1,
+                             seed=None, compact=False):
+    """
+    Play games and append training data to a file in lib/ml/training/
     :param player1_type: string: name of this player's ml model, "random",
            or None to use vanilla mcts
     :param player2_type: string: name of this player's ml model, "random",
            or None to use vanilla mcts
     :param verbose: bool: prints more output.
+    :param batch_size: int: leaves evaluated per forward pass by model players.
+    :param games: int: number of games to play.
+    :param workers: int: number of processes playing games. With more than one
+           worker, games are played in a process pool and written to the
+           training file by this process only.
+    :param seed: int: base RNG seed. Game i is seeded with seed + i. A random
+           base is used when not given.
+    :param compact: bool: model and mcts players search with ArrayTree.
     :return:
     """
-    timestamp = time.time()
-    filename = "training{}.json".format(timestamp)
-    path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)),
-        "lib", "ml", "training",
-        filename)
+    path = training_data_path()
+
+    if workers > 1:
+        run_parallel_training_data(player1_type, player2_type, verbose,
+                                   batch_size, games, workers, seed, path,
+                                   compact)
+        return
+
+    if seed is None:
+        seed = int.from_bytes(os.urandom(4), "little")
 
-    for _ in range(0, 20):
-        sim = Simulator(player1_type=player1_type, player2_type=player2_type)
-        result, final_board = sim.play_game(train=True, verbose=verbose)
+    stats = GameStats(games)
+    for i in range(0, games):
+        # Same per game seeds as the parallel path, so a game can be replayed
+        # whatever the number of workers
+        game_meta, result, seconds = _play_training_game(
+            player1_type, player2_type, verbose, batch_size, seed + i, compact)
+        append_records(path, game_meta)
+        stats.add(result, len(game_meta), seconds)
 
-        sim.store_game_result(result)
-        sim.export_game_data(path)
 
-        print("Winner: Player {}".format(result))
-        print_board(final_board)
+class GameStats:
+    """Prints each finished game and the throughput of the run so far."""
+    def __init__(self, games):
+        """
+        :param games: int: number of games in the run.
+        """
+        self.games = games
+        self.start = time.time()
+        self.finished = 0
+        self.positions = 0
+        self.game_seconds = 0
+
+    def add(self, result, positions, seconds):
+        """
+        Record a finished game.
+        :param result: int: game result.
+        :param positions: int: training examples from the game.
+        :param seconds: float: time taken to play the game.
+        """
+        self.finished += 1
+        self.positions += positions
+        self.game_seconds += seconds
+        elapsed = time.time() - self.start
+        print("Game {}/{}: Winner: Player {}, {} positions in {:.1f}s".format(
+            self.finished, self.games, result, positions, seconds))
+        print("{:.1f} games/hour, {:.1f} positions/s, {:.1f}s per game".format(
+            self.finished * 3600 / elapsed, self.positions / elapsed,
+            self.game_seconds / self.finished))
+
+
+def seed_rngs(seed):
+    """
+    Seed every RNG used by the players.
+    :param seed: int
+    """
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+
+
+def _init_worker(player1_type, player2_type):
+    """
+    Process pool initializer. Loads models once per worker process.
+    :param player1_type: string: player 1 type, see Simulator.
+    :param player2_type: string: player 2 type, see Simulator.
+    """
+    # Each worker gets one core, otherwise torch threads oversubscribe the box.
+    torch.set_num_threads(1)
+    seed_rngs(int.from_bytes(os.urandom(4), "little"))
+    for player_type in (player1_type, player2_type):
+        if player_type not in ("random", "mcts") and \
+                not is_server_address(player_type):
+            get_model(player_type)
+
+
+def _play_training_game(player1_type, player2_type, verbose, batch_size, seed,
+                        compact):
+    """
+    Play a single training game, in this process or in a worker process.
+    :param seed: int: RNG seed for this game.
+    :return: list, int, float: training examples, game result, seconds played.
+    """
+    seed_rngs(seed)
+    start = time.time()
+
+    sim = Simulator(player1_type=player1_type, player2_type=player2_type,
+                    batch_size=batch_size, compact=compact)
+    result, _ = sim.play_game(train=True, verbose=verbose)
+    sim.store_game_result(result)
+
+    return sim.game_data(), result, time.time() - start
+
+
+def run_parallel_training_data(player1_type, player2_type, verbose,
+                               batch_size, games, workers, seed, path,
+                               compact=False):
+    """
+    Play games across a process pool and write training data to path.
+    Only this process writes to the training file.
+    See run_create_training_data for parameters.
+    """
+    if seed is None:
+        seed = int.from_bytes(os.urandom(4), "little")
+
+    stats = GameStats(games)
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(player1_type, player2_type)) as pool:
+        futures = [
+            pool.submit(_play_training_game, player1_type, player2_type,
+                        verbose, batch_size, seed + i, compact)
+            for i in range(games)
+        ]
+
+        for future in as_completed(futures):
+            game_meta, result, seconds = future.result()
+            append_records(path, game_meta)
+            stats.add(result, len(game_meta), seconds)
 
 
-def run_single_game(player1_type, player2_type, verbose):
+def run_single_game(player1_type, player2_type, verbose, batch_size=BATCH_SIZE,
+                    compact=False):
     """
     Runs a single game and prints game output to stdout.
     :param player1_type: string: name of this player's ml model, "random",
@@ -195,8 +335,11 @@ def run_single_game(player1_type, player2_type, verbose):
     :param player2_type: string: name of this player's ml model, "random",
            or None to use vanilla mcts
     :param verbose: bool: prints more output.
+    :param batch_size: int: leaves evaluated per forward pass by model players.
+    :param compact: bool: model and mcts players search with ArrayTree.
     """
-    sim = Simulator(player1_type=player1_type, player2_type=player2_type)
+    sim = Simulator(player1_type=player1_type, player2_type=player2_type,
+                    batch_size=batch_size, compact=compact)
     result, final_board = sim.play_game(train=False, verbose=verbose)
     print("Winner: Player {}".format(result))
     print_board(final_board)
@@ -205,15 +348,27 @@ def run_single_game(player1_type, player2_type, verbose):
 @click.command()
 @click.option("-v", "--verbose", is_flag=True, help="Print more output.")
 @click.option("-t", "--train", is_flag=True, help="Generate training data.")
+@click.option("-b", "--batch-size", default=BATCH_SIZE, show_default=True,
+              help="Leaves evaluated per forward pass by model players.")
+@click.option("-g", "--games", default=GAMES, show_default=True,
+              help="Number of games to play when generating training data.")
+@click.option("-w", "--workers", default=1, show_default=True,
+              help="Number of processes playing games when generating training data.")
+@click.option("-s", "--seed", type=int, default=None,
+              help="Base RNG seed for generated games.")
+@click.option("-c", "--compact", is_flag=True,
+              help="Search with array backed trees.")
 @click.argument("p1_type")
 @click.argument("p2_type")
-def main(verbose, train, p1_type, p2_type):
+def main(verbose, train, batch_size, games, workers, seed, compact, p1_type,
+         p2_type):
 
     if train:
-        run_create_training_data(p1_type, p2_type, verbose)
+        run_create_training_data(p1_type, p2_type, verbose, batch_size,
+                                 games, workers, seed, compact)
 
     else:
-        run_single_game(p1_type, p2_type, verbose)
+        run_single_game(p1_type, p2_type, verbose, batch_size, compact)
 
 
 if __name__ == '__main__':
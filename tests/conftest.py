@@ -0,0 +1,9 @@
+import pytest
+
+from lib.montecarlo.game import initial_state
+
+
+@pytest.fixture
+def start_state():
+    """The standard start position, see lib.montecarlo.game.initial_state."""
+    return initial_state()
@@ -0,0 +1,97 @@
+import random
+
+import numpy as np
+import torch
+
+from lib.ml.othello_model import OthelloModel
+from lib.ml.run import EVALUATION_CACHE, NUM_BLOCKS, NUM_FILTERS
+from lib.montecarlo.array_tree import NO_MOVE, ArrayTree
+from lib.montecarlo.nodes import Node
+from lib.montecarlo.tree import Tree
+
+
+def assert_same_statistics(node, array_tree, array_node):
+    assert array_tree.visit_count[array_node] == node.visit_count
+    assert np.isclose(array_tree.win_score[array_node], node.win_score)
+    assert array_tree.state(array_node) == node.state
+
+    children = array_tree.children(array_node)
+    assert len(children) == len(node.children)
+    for child, array_child in zip(node.children, children):
+        assert array_tree.parent[array_child] == array_node
+        assert array_tree.transition_move(array_child) == child.transition_move
+        assert_same_statistics(child, array_tree, array_child)
+
+
+def test_rollout_search_matches_node_tree(start_state):
+    random.seed(0)
+    tree = Tree(Node(start_state))
+    for _ in range(200):
+        tree.simulate(None)
+
+    random.seed(0)
+    array_tree = ArrayTree(start_state)
+    for _ in range(200):
+        array_tree._simulate_rollout()
+
+    assert_same_statistics(tree.root, array_tree, 0)
+
+
+def test_model_search_matches_node_tree(tmp_path, start_state):
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.manual_seed(0)
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+
+    EVALUATION_CACHE.clear()
+    tree = Tree(Node(start_state))
+    for _ in range(40):
+        tree.simulate(model)
+
+    array_tree = ArrayTree(start_state)
+    for _ in range(40):
+        array_tree._simulate_model_batch(model, 1)
+    assert_same_statistics(tree.root, array_tree, 0)
+
+    # Batches of leaves leave no virtual loss behind
+    array_tree = ArrayTree(start_state)
+    completed = sum(array_tree._simulate_model_batch(model, 8)
+                    for _ in range(10))
+    assert array_tree.visit_count[0] == completed
+    assert not array_tree.virtual_loss[:array_tree.size].any()
+    EVALUATION_CACHE.clear()
+
+
+def test_subtree_keeps_descendant_statistics(start_state):
+    random.seed(1)
+    array_tree = ArrayTree(start_state, capacity=4)
+    for _ in range(300):
+        array_tree._simulate_rollout()
+    # The arrays grew past their initial capacity
+    assert array_tree.size > 4
+
+    child = max(array_tree.children(0),
+                key=lambda node: array_tree.visit_count[node])
+    state = array_tree.state(child)
+    assert array_tree.find_child(0, state) == child
+    assert array_tree.find_child(child, state) is None
+
+    subtree = array_tree.subtree(child)
+    assert subtree.parent[0] == NO_MOVE
+    assert subtree.transition_move(0) is None
+    assert subtree.state(0) == state
+
+    def compare(old, new):
+        assert subtree.visit_count[new] == array_tree.visit_count[old]
+        assert subtree.win_score[new] == array_tree.win_score[old]
+        old_children = array_tree.children(old)
+        new_children = subtree.children(new)
+        assert len(old_children) == len(new_children)
+        for old_child, new_child in zip(old_children, new_children):
+            assert subtree.parent[new_child] == new
+            assert subtree.transition_move(new_child) == \
+                array_tree.transition_move(old_child)
+            # States not stored yet are rebuilt from the new root
+            assert subtree.state(new_child) == array_tree.state(old_child)
+            compare(old_child, new_child)
+
+    compare(child, 0)
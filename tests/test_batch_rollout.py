@@ -0,0 +1,68 @@
+import random
+
+import numpy as np
+
+from lib.montecarlo.batch_rollout import batch_flips, batch_legal_moves, \
+    batch_popcount, batch_rollout
+from lib.montecarlo.bitboard import flips, iter_squares, legal_moves, popcount
+from lib.montecarlo.game import Move, initial_state
+from lib.montecarlo.nodes import Node
+from lib.montecarlo.tree import Tree
+
+
+def random_game_states(seed):
+    rng = random.Random(seed)
+    state = initial_state()
+    states = []
+    while not state.game_over():
+        states.append(state)
+        moves = state.get_legal_moves()
+        state = state.move(rng.choice(moves) if moves
+                           else Move(None, None, state.next_player))
+    return states
+
+
+def test_vectorized_engine_matches_bitboards():
+    states = random_game_states(0) + random_game_states(1)
+    own = np.array([state.bitboards[state.next_player - 1] for state in states],
+                   dtype=np.uint64)
+    opp = np.array([state.bitboards[2 - state.next_player] for state in states],
+                   dtype=np.uint64)
+
+    moves = batch_legal_moves(own, opp)
+    rng = random.Random(2)
+    placed = []
+    for i in range(len(states)):
+        assert int(moves[i]) == legal_moves(int(own[i]), int(opp[i]))
+        squares = list(iter_squares(int(moves[i])))
+        placed.append(1 << rng.choice(squares) if squares else 0)
+
+    flipped = batch_flips(own, opp, np.array(placed, dtype=np.uint64))
+    for i in range(len(states)):
+        assert int(flipped[i]) == flips(int(own[i]), int(opp[i]), placed[i])
+    assert batch_popcount(own).tolist() == [popcount(int(bits)) for bits in own]
+
+
+def test_batch_rollout_results():
+    state = random_game_states(3)[50]
+    results = batch_rollout(state.bitboards[0], state.bitboards[1],
+                            state.next_player, 200, np.random.RandomState(0))
+    assert results.shape == (200,)
+    assert set(results.tolist()) <= {0, 1, 2}
+
+    # A finished game has the same result every time
+    final = random_game_states(4)[-1]
+    final = final.move(final.get_legal_moves()[0])
+    results = batch_rollout(final.bitboards[0], final.bitboards[1],
+                            final.next_player, 5)
+    assert results.tolist() == [final.game_result()] * 5
+
+
+def test_tree_plays_several_rollouts_per_leaf(start_state):
+    tree = Tree(Node(start_state), rollouts_per_leaf=4)
+    node, all_move_visits = tree.best_move(64, None, batch_size=4)
+
+    assert node in tree.root.children
+    # Every expanded leaf was played out 4 times
+    assert tree.root.visit_count % 4 == 0
+    assert sum(all_move_visits) == tree.root.visit_count
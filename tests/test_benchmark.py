@@ -0,0 +1,21 @@
+from simulator.benchmark import benchmark_movegen, benchmark_positions, \
+    benchmark_search
+from lib.montecarlo.endgame import empties
+
+
+def test_positions_are_reproducible():
+    first = benchmark_positions()
+    second = benchmark_positions()
+    assert list(first) == ["opening", "midgame", "endgame"]
+    for name in first:
+        assert first[name] == second[name]
+    assert empties(first["opening"]) > empties(first["midgame"]) > \
+        empties(first["endgame"])
+
+
+def test_benchmarks_report_rates():
+    state = benchmark_positions()["midgame"]
+    movegen = benchmark_movegen(state, count=10)
+    assert movegen["get_legal_moves_per_sec"] > 0
+    assert movegen["move_per_sec"] > 0
+    assert benchmark_search(state, None, 10)["simulations_per_sec"] > 0
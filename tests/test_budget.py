@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+
+from lib.montecarlo.budget import SearchBudget, TimeManager
+from lib.montecarlo.game import GameState
+from lib.montecarlo.nodes import Node
+from lib.montecarlo.tree import Tree
+
+
+def test_budget_stops_when_leader_is_decided():
+    budget = SearchBudget(num_simulations=100)
+    budget.add(90)
+    # 10 simulations left can't close a gap of 11
+    assert budget.decided(np.array([60, 19, 11]))
+    assert not budget.decided(np.array([50, 40, 0]))
+    budget.add(10)
+    assert budget.exhausted()
+
+
+def test_search_stops_early(start_state):
+    tree = Tree(Node(start_state))
+    node, all_move_visits = tree.best_move(200, None)
+    assert node is not None
+    assert sum(all_move_visits) <= 200
+
+    # Searching with a time budget only
+    tree = Tree(Node(start_state))
+    start = time.monotonic()
+    node, all_move_visits = tree.best_move(None, None, time_budget=0.2)
+    assert node is not None
+    assert time.monotonic() - start < 1
+
+
+def test_last_rollout_batch_fits_the_budget(start_state):
+    tree = Tree(Node(start_state), rollouts_per_leaf=4)
+    budget = SearchBudget(num_simulations=10, early_stop=False)
+    while not budget.exhausted():
+        budget.add(tree.simulate_rollout_batch(
+            *tree._rollout_batch_size(budget, 1)))
+    # Two leaves of 4 rollouts, then one of 2
+    assert budget.completed == 10
+    assert tree.root.visit_count == 10
+
+
+def test_reused_subtree_is_searched(start_state):
+    root = Node(start_state)
+    root.expand_mcts()
+    for _ in range(50):
+        root.children[0].backpropagate(1)
+    # The lead already can't be overtaken in 10 simulations
+    assert SearchBudget(num_simulations=10).remaining() < 50
+
+    Tree(root).best_move(10, None)
+    assert root.visit_count > 50
+
+
+def test_forced_move_returns_immediately():
+    # Player 1's only legal move is [0, 2]
+    board = [[0] * 8 for _ in range(8)]
+    board[0][0] = 1
+    board[0][1] = 2
+    state = GameState(1, board)
+    assert len(state.get_legal_moves()) == 1
+
+    node, all_move_visits = Tree(Node(state)).best_move(1300, None)
+    assert (node.transition_move.row, node.transition_move.col) == (0, 2)
+    assert sum(all_move_visits) == 1
+
+
+def test_time_manager_splits_the_clock(start_state):
+    clock = TimeManager(30, reserve=0)
+    state = start_state
+    budget = clock.budget(state)
+    # 60 empty squares, 30 moves left for each player
+    assert budget == 1
+    clock.spend(10)
+    assert clock.remaining == 20
+    assert clock.budget(state) < budget
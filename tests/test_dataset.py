@@ -0,0 +1,29 @@
+import numpy as np
+
+from lib.ml.dataset import records_to_arrays
+from lib.ml.encoding import bitboards_to_planes
+
+
+def test_bitboards_to_planes():
+    # Player 1 on [3, 3] and [4, 4], player 2 on [3, 4] and [4, 3]
+    boards = np.array([[0x0000001008000000, 0x0000000810000000]],
+                      dtype=np.uint64)
+    planes = bitboards_to_planes(boards)
+
+    assert planes.shape == (1, 2, 8, 8)
+    assert planes.sum() == 4
+    assert planes[0, 0, 3, 3] == 1 and planes[0, 0, 4, 4] == 1
+    assert planes[0, 1, 3, 4] == 1 and planes[0, 1, 4, 3] == 1
+
+
+def test_records_order_boards_by_creator():
+    visits = list(range(64))
+    boards, move_visits, winloss = records_to_arrays([
+        {"created_by": 1, "bitboards": [1, 2], "move_visits": visits, "winloss": 1},
+        {"created_by": 2, "bitboards": [1, 2], "move_visits": visits, "winloss": 0},
+    ])
+
+    # Creator's pieces are always the first board
+    assert boards.tolist() == [[1, 2], [2, 1]]
+    assert winloss.tolist() == [1, 0]
+    assert move_visits[1].tolist() == visits
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+
+from lib.ml.encoding import PlaneBuffer, creator_bitboards
+from lib.ml.eval_cache import canonical_form
+from lib.ml.symmetry import transform
+from lib.montecarlo.game import GameState, initial_state
+
+
+def positions():
+    root = initial_state()
+    states = [root]
+    for move in root.get_legal_moves():
+        child = root.move(move)
+        states += [child] + [child.move(reply)
+                             for reply in child.get_legal_moves()]
+    return states
+
+
+def list_planes(state):
+    """Encode the 2D list board, to check the bitboard encoding against."""
+    board = np.asarray(state.board)
+    creator = 2 if state.next_player == 1 else 1
+    return np.stack([board == creator,
+                     board == state.next_player]).astype(np.float32)
+
+
+def encode_states(buffer, states):
+    return buffer.encode([creator_bitboards(state) for state in states])
+
+
+def test_bitboard_and_list_encodings_agree():
+    states = positions()
+    planes = encode_states(PlaneBuffer(), states)
+    for state, state_planes in zip(states, planes):
+        assert np.array_equal(state_planes,
+                              list_planes(state))
+
+
+def test_canonical_bitboards_encode_the_canonical_orientation():
+    for state in positions():
+        boards, k = canonical_form(state)
+        p1_bits, p2_bits = boards
+        canonical = GameState(state.next_player, bitboards=(p1_bits, p2_bits))
+        assert np.array_equal(
+            PlaneBuffer().encode([creator_bitboards(canonical)])[0],
+            transform(list_planes(state), k))
+
+
+def test_buffer_is_reused_per_thread():
+    buffer = PlaneBuffer()
+    states = positions()
+    first = encode_states(buffer, states[:3])
+    second = encode_states(buffer, states[3:5])
+    assert np.shares_memory(first, second)
+    assert encode_states(buffer, states).shape == (len(states), 2, 8, 8)
+
+    # Other threads get their own buffer
+    other = []
+    thread = threading.Thread(
+        target=lambda: other.append(encode_states(buffer, states[:3])))
+    thread.start()
+    thread.join()
+    assert not np.shares_memory(other[0], buffer.get(1))
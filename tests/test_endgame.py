@@ -0,0 +1,70 @@
+import random
+
+from lib.montecarlo.bitboard import flips, legal_moves, popcount
+from lib.montecarlo.endgame import EndgameSolver, empties
+from lib.montecarlo.game import Move, initial_state
+from simulator.player import MCTSPlayer
+
+
+def minimax(own, opp, passed=False):
+    """Final disc difference for the player to move, without pruning."""
+    moves = legal_moves(own, opp)
+    if not moves:
+        if passed:
+            return popcount(own) - popcount(opp)
+        return -minimax(opp, own, True)
+    best = -65
+    while moves:
+        move = moves & -moves
+        moves ^= move
+        flipped = flips(own, opp, move)
+        best = max(best, -minimax(opp ^ flipped, own | move | flipped))
+    return best
+
+
+def random_position(num_empties, seed):
+    rng = random.Random(seed)
+    state = initial_state()
+    while empties(state) > num_empties and not state.game_over():
+        moves = state.get_legal_moves()
+        state = state.move(rng.choice(moves) if moves
+                           else Move(None, None, state.next_player))
+    return state
+
+
+def test_solver_matches_minimax():
+    for seed in range(10):
+        state = random_position(7, seed)
+        p1_bits, p2_bits = state.bitboards
+        own, opp = (p1_bits, p2_bits) if state.next_player == 1 \
+            else (p2_bits, p1_bits)
+        expected = minimax(own, opp)
+
+        move, score = EndgameSolver().solve(state)
+        assert score == expected
+
+        # The chosen move keeps the same result
+        if move is not None:
+            child = state.move(move)
+            _, child_score = EndgameSolver().solve(child)
+            if child.next_player == state.next_player:
+                assert child_score == expected
+            else:
+                assert -child_score == expected
+
+        # Win/loss/draw search agrees on the sign
+        _, sign = EndgameSolver().solve(state, exact=False)
+        assert (sign > 0) == (expected > 0)
+        assert (sign < 0) == (expected < 0)
+
+
+def test_player_solves_endgame():
+    state = random_position(10, 1)
+    player = MCTSPlayer(state.next_player)
+
+    move, all_move_visits = player.get_move(state)
+
+    assert player.solved_value in (0, 0.5, 1)
+    assert sum(all_move_visits) == 1
+    assert all_move_visits[move[0] * 8 + move[1]] == 1
+    assert state.move_is_legal(Move(move[0], move[1], state.next_player))
@@ -0,0 +1,124 @@
+import threading
+
+import numpy as np
+import torch
+
+from lib.ml.eval_cache import EvaluationCache, canonical_form
+from lib.ml.othello_model import OthelloModel
+from lib.ml.run import EVALUATION_CACHE, NUM_BLOCKS, NUM_FILTERS, \
+    evaluate_model_at_gamestates
+from lib.ml.symmetry import inverse, transform
+from lib.montecarlo.game import Move
+
+
+def test_symmetric_positions_share_an_entry(start_state):
+    state = start_state
+    # The four opening moves are rotations and reflections of each other
+    children = [state.move(move) for move in state.get_legal_moves()]
+    assert len({canonical_form(child)[0] for child in children}) == 1
+
+    first = children[0]
+    policy = np.arange(64.0).reshape(8, 8)
+
+    cache = EvaluationCache()
+    cache.store("model", first, 0.25, policy)
+    for child in children[1:]:
+        value, child_policy = cache.lookup("model", child)
+        assert value == 0.25
+        # The policy is mapped into the child's own orientation
+        _, k_first = canonical_form(first)
+        _, k_child = canonical_form(child)
+        expected = transform(transform(policy, k_first), inverse(k_child))
+        assert np.array_equal(child_policy, expected)
+
+    assert cache.lookup("other model", children[1]) is None
+    assert cache.lookup("model", state) is None
+    assert cache.hits == 3
+    assert cache.hit_rate() == 0.6
+
+
+def test_policy_follows_the_move(start_state):
+    state = start_state
+    children = [state.move(move) for move in state.get_legal_moves()]
+
+    # All weight on one legal move of the first child
+    first = children[0]
+    move = first.get_legal_moves()[0]
+    policy = np.zeros((8, 8))
+    policy[move.row][move.col] = 1.0
+
+    cache = EvaluationCache()
+    cache.store("model", first, 0.0, policy)
+    for child in children:
+        _, child_policy = cache.lookup("model", child)
+        row, col = np.unravel_index(np.argmax(child_policy), (8, 8))
+        assert child.move_is_legal(Move(row, col, child.next_player))
+
+
+def test_model_evaluations_are_cached(tmp_path, start_state):
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+
+    state = start_state
+    children = [state.move(move) for move in state.get_legal_moves()]
+
+    EVALUATION_CACHE.clear()
+    values, policies = evaluate_model_at_gamestates(children[:1], model)
+    assert EVALUATION_CACHE.misses == 1
+
+    cached_values, cached_policies = evaluate_model_at_gamestates(children, model)
+    assert EVALUATION_CACHE.hits == len(children)
+    assert np.allclose(cached_values, values[0])
+    assert np.allclose(cached_policies[0], policies[0])
+    # The other children get the same policy, rotated or reflected
+    for policy in cached_policies[1:]:
+        assert np.allclose(np.sort(policy, axis=None),
+                           np.sort(policies[0], axis=None))
+
+
+def test_positions_are_canonicalized_once(tmp_path, monkeypatch,
+                                          start_state):
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+
+    calls = []
+
+    def counting_canonical_form(state):
+        calls.append(state)
+        return canonical_form(state)
+
+    monkeypatch.setattr("lib.ml.run.canonical_form", counting_canonical_form)
+    monkeypatch.setattr("lib.ml.eval_cache.canonical_form",
+                        counting_canonical_form)
+
+    state = start_state
+    children = [state.move(move) for move in state.get_legal_moves()]
+
+    EVALUATION_CACHE.clear()
+    # Misses are looked up, evaluated and stored with one canonical form
+    evaluate_model_at_gamestates(children, model)
+    assert EVALUATION_CACHE.misses == len(children)
+    assert len(calls) == len(children)
+
+
+def test_cache_is_shared_between_threads(start_state):
+    state = start_state
+    states = [state] + [state.move(move) for move in state.get_legal_moves()]
+    policy = np.zeros((8, 8))
+    cache = EvaluationCache(max_entries=2)
+
+    def worker():
+        for _ in range(500):
+            for child in states:
+                if cache.lookup("model", child) is None:
+                    cache.store("model", child, 0.5, policy)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Every lookup was counted, and evictions never raced
+    assert cache.hits + cache.misses == 4 * 500 * len(states)
+    assert len(cache) <= 2
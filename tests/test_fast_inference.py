@@ -0,0 +1,59 @@
+import torch
+
+from lib.ml.fast_inference import InferenceModel, fold_batchnorm, \
+    optimize_for_inference
+from lib.ml.othello_model import OthelloModel
+
+
+def trained_model():
+    # BatchNorm statistics away from their initial values, so folding is
+    # tested with a non-trivial normalization
+    torch.manual_seed(0)
+    model = OthelloModel(16, 2)
+    for block in model.residual_blocks:
+        for norm in (block.norm1, block.norm2):
+            norm.running_mean.uniform_(-0.5, 0.5)
+            norm.running_var.uniform_(0.5, 2)
+            norm.weight.data.uniform_(0.5, 1.5)
+            norm.bias.data.uniform_(-0.2, 0.2)
+    return model.eval()
+
+
+def random_planes(count):
+    squares = torch.randint(0, 3, (count, 8, 8))
+    return torch.stack([squares == 1, squares == 2], dim=1).float()
+
+
+def test_fold_batchnorm():
+    block = trained_model().residual_blocks[0]
+    x = torch.randn(4, 16, 8, 8)
+    folded = fold_batchnorm(block.conv1, block.norm1)
+    with torch.no_grad():
+        assert torch.allclose(folded(x), block.norm1(block.conv1(x)),
+                              atol=1e-5)
+
+
+def test_optimized_models_match_float32():
+    model = trained_model()
+    x_input = random_planes(16)
+    with torch.no_grad():
+        value, log_policy = model(x_input)
+        assert torch.equal(InferenceModel(model, fold=False,
+                                          channels_last=False)(x_input)[0],
+                           value)
+        fast = optimize_for_inference(model)
+        fast_value, fast_log_policy = fast(x_input)
+        assert torch.allclose(fast_value, value, atol=1e-5)
+        assert torch.allclose(fast_log_policy, log_policy, atol=1e-4)
+
+        # The traced graph isn't tied to the batch size it was traced with
+        single_value, _ = fast(x_input[:1])
+        assert torch.allclose(single_value, fast_value[:1], atol=1e-5)
+
+        for options in (dict(quantize=True), dict(dtype=torch.bfloat16)):
+            approx_value, approx_log_policy = optimize_for_inference(
+                model, **options)(x_input)
+            assert approx_value.dtype == torch.float32
+            assert torch.allclose(approx_value, value, atol=0.02)
+            assert torch.allclose(approx_log_policy.exp(), log_policy.exp(),
+                                  atol=0.02)
@@ -105,3 +105,29 @@ def test_make_move():
 
     assert new_state.next_player == 2
     assert new_state.board == correct
+
+
+def test_game_result():
+    board_state = [
+        [1, 1, 1, 1, 1, 1, 1, 1],
+        [1, 1, 1, 1, 1, 1, 1, 1],
+        [1, 1, 1, 1, 1, 1, 1, 1],
+        [1, 1, 1, 1, 2, 2, 2, 2],
+        [2, 2, 2, 2, 2, 2, 2, 2],
+        [2, 2, 2, 2, 2, 2, 2, 2],
+        [2, 2, 2, 2, 2, 2, 2, 2],
+        [2, 2, 2, 2, 2, 2, 2, 2]
+    ]
+    game_state = GameState(1, board_state)
+
+    # Board is full, neither player can move
+    assert not game_state.get_legal_moves(1)
+    assert not game_state.get_legal_moves(2)
+    assert game_state.game_over()
+    assert game_state.game_result() == 2
+    assert game_state.count(1) == 28
+    assert game_state.count(2) == 36
+
+    # Board view is rebuilt from the bitboards
+    assert game_state.board == board_state
+    assert GameState(2, bitboards=game_state.bitboards).board == board_state
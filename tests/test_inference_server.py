@@ -0,0 +1,111 @@
+import os
+import stat
+import threading
+from multiprocessing import AuthenticationError
+
+import numpy as np
+import pytest
+import torch
+
+from lib.ml.othello_model import OthelloModel
+from lib.ml.run import NUM_BLOCKS, NUM_FILTERS, evaluate_model_at_gamestates
+import lib.ml.inference_server as inference_server
+from lib.ml.inference_server import AUTHKEY_ENV, InferenceClient, \
+    InferenceError, InferenceServer, connect, get_authkey
+
+
+def test_server_batches_requests_from_clients(tmp_path, monkeypatch,
+                                              start_state):
+    monkeypatch.setenv(AUTHKEY_ENV, "test key")
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+
+    root = start_state
+    states = [root.move(move) for move in root.get_legal_moves()]
+
+    server = InferenceServer(model, str(tmp_path / "othello.sock"),
+                             max_latency=0.05)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.ready.wait(5)
+
+    # Connections without the key are refused
+    with pytest.raises(AuthenticationError):
+        InferenceClient(server.address, authkey=b"wrong key")
+
+    # One connection per process and server
+    client = connect("unix:" + server.address)
+    assert connect("unix:" + server.address) is client
+    clients = [client, client, InferenceClient(server.address)]
+    results = [None] * len(clients)
+
+    def evaluate(i):
+        results[i] = evaluate_model_at_gamestates(states, clients[i])
+
+    threads = [threading.Thread(target=evaluate, args=(i,))
+               for i in range(len(clients))]
+    for worker in threads:
+        worker.start()
+    for worker in threads:
+        worker.join(5)
+
+    _, local_policies = evaluate_model_at_gamestates(states, model)
+    for values, policies in results:
+        assert values.shape == (len(states),)
+        assert np.allclose(policies, local_policies, atol=1e-6)
+    # Requests from all clients were evaluated in fewer forward passes
+    assert server.batches < len(clients)
+
+    for client in clients[1:]:
+        client.close()
+    server.close()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_authkey_file_is_private(tmp_path, monkeypatch):
+    monkeypatch.delenv(AUTHKEY_ENV, raising=False)
+    path = str(tmp_path / "key")
+    key = get_authkey(path)
+    assert len(key) == 32
+    assert get_authkey(path) == key
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_server_survives_failed_requests(tmp_path, monkeypatch):
+    monkeypatch.setenv(AUTHKEY_ENV, "test key")
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+
+    server = InferenceServer(model, str(tmp_path / "othello.sock"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.ready.wait(5)
+    client = InferenceClient(server.address)
+    planes = np.zeros((3, 2, 8, 8), dtype=np.uint8)
+
+    # Malformed requests are refused before they are queued
+    with pytest.raises(InferenceError):
+        client.evaluate(np.zeros((3, 2, 4, 4)))
+    with client.lock:
+        client.conn.send(planes.astype(np.float64))
+        assert isinstance(client.conn.recv(), InferenceError)
+
+    # A failed forward pass fails its batch, not the server
+    evaluate_planes = inference_server.evaluate_planes
+
+    def fail_once(x_input, model):
+        monkeypatch.setattr(inference_server, "evaluate_planes",
+                            evaluate_planes)
+        raise OSError("checkpoint is being rewritten")
+    monkeypatch.setattr(inference_server, "evaluate_planes", fail_once)
+    with pytest.raises(InferenceError):
+        client.evaluate(planes)
+
+    values, policies = client.evaluate(planes)
+    assert values.shape == (3,) and policies.shape == (3, 8, 8)
+
+    client.close()
+    server.close()
+    thread.join(5)
+    assert not thread.is_alive()
@@ -0,0 +1,64 @@
+import os
+
+from lib.ml.model_cache import ModelCache
+
+
+def test_cache_reuses_and_reloads(tmp_path):
+    loaded = []
+
+    def loader(path):
+        loaded.append(path)
+        return object()
+
+    path = str(tmp_path / "saved_othello_model.10")
+    with open(path, "w") as outfile:
+        outfile.write("weights")
+
+    cache = ModelCache(loader)
+    model = cache.get(path)
+    assert cache.get(path) is model
+    assert len(loaded) == 1
+
+    # Rewriting the checkpoint reloads the model
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert cache.get(path) is not model
+    assert len(loaded) == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ModelCache(lambda path: object(), max_models=2)
+
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / "saved_othello_model.{}".format(i))
+        with open(path, "w") as outfile:
+            outfile.write("weights")
+        paths.append(path)
+
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+
+    assert len(cache) == 2
+    assert paths[0] in cache
+    assert paths[1] not in cache
+    assert paths[2] in cache
+
+
+def test_cache_uses_the_callers_mtime(tmp_path, monkeypatch):
+    path = str(tmp_path / "saved_othello_model.10")
+    with open(path, "w") as outfile:
+        outfile.write("weights")
+    mtime = os.path.getmtime(path)
+
+    cache = ModelCache(lambda path: object())
+    model = cache.get(path, mtime)
+
+    # A modification time read by the caller isn't read again
+    def getmtime(path):
+        raise AssertionError("checkpoint read twice")
+    monkeypatch.setattr(os.path, "getmtime", getmtime)
+    assert cache.get(path, mtime) is model
+    assert cache.get(path, mtime + 10) is not model
@@ -66,3 +66,62 @@ def test_backprop():
 
     print(f"N1 visits: {n1.visit_count}, N1 wins: {n1.win_score}")
     print(f"N2 visits: {n2.visit_count}, N2 wins: {n2.win_score}")
+
+
+def test_find_descendant():
+    initial_board = [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 1, 2, 0, 0, 0],
+        [0, 0, 0, 2, 1, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0]
+    ]
+    root = Node(GameState(1, initial_board))
+    root.expand_mcts()
+    child = root.children[0]
+    child.expand_mcts()
+
+    # Same position reached by replaying the moves from a fresh state
+    state = GameState(1, initial_board)
+    state = state.move(child.transition_move)
+    state = state.move(child.children[-1].transition_move)
+
+    assert root.find_descendant(state) is child.children[-1]
+    assert root.find_descendant(state, max_depth=1) is None
+    assert child.find_descendant(state, max_depth=1) is child.children[-1]
+
+
+def test_promising_child_first_play_urgency():
+    initial_board = [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 1, 2, 0, 0, 0],
+        [0, 0, 0, 2, 1, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0]
+    ]
+    root = Node(GameState(1, initial_board))
+    root.expand_mcts()
+    visited = root.children[2]
+
+    # Player 1 wins every visit to one child, the rest are unvisited
+    visited.backpropagate(1)
+    visited.backpropagate(1)
+    assert root.visit_count == 2
+    assert root.child_visit_count.tolist() == [0, 0, 2, 0]
+    assert visited.win_score == 2
+
+    assert root.promising_child() is visited
+    # Unvisited children are preferred when assumed to be better than 1
+    assert root.promising_child(fpu=1.5) is root.children[0]
+
+    # Detached nodes keep their statistics
+    visited.detach()
+    assert visited.parent is None
+    assert visited.visit_count == 2
+    assert visited.win_score == 2
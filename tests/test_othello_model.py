@@ -0,0 +1,52 @@
+import numpy as np
+import torch
+
+from lib.ml.othello_model import OthelloModel
+from lib.ml.run import EVALUATION_CACHE, NUM_BLOCKS, NUM_FILTERS, \
+    evaluate_model_at_gamestates
+
+
+def random_planes(count):
+    squares = torch.randint(0, 3, (count, 8, 8))
+    return torch.stack([squares == 1, squares == 2], dim=1).float()
+
+
+def test_eval_mode_is_deterministic():
+    torch.manual_seed(0)
+    model = OthelloModel(NUM_FILTERS, NUM_BLOCKS).eval()
+    x_input = random_planes(8)
+
+    with torch.no_grad():
+        value, log_policy = model(x_input)
+        again_value, again_log_policy = model(x_input)
+        assert torch.equal(value, again_value)
+        assert torch.equal(log_policy, again_log_policy)
+
+        # Batched and single positions only differ by float rounding
+        for i in range(len(x_input)):
+            single_value, single_log_policy = model(x_input[i:i + 1])
+            assert torch.allclose(single_value, value[i:i + 1], atol=1e-6)
+            assert torch.allclose(single_log_policy, log_policy[i:i + 1],
+                                  atol=1e-5)
+
+    # Dropout is still used while training
+    model.train()
+    with torch.no_grad():
+        assert not torch.equal(model(x_input)[0], model(x_input)[0])
+
+
+def test_search_evaluations_are_deterministic(tmp_path, start_state):
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+
+    root = start_state
+    states = [root] + [root.move(move) for move in root.get_legal_moves()]
+
+    EVALUATION_CACHE.clear()
+    values, policies = evaluate_model_at_gamestates(states, model)
+    EVALUATION_CACHE.clear()
+    for i, state in enumerate(states):
+        value, policy = evaluate_model_at_gamestates([state], model)
+        assert np.allclose(value, values[i], atol=1e-6)
+        assert np.allclose(policy, policies[i], atol=1e-6)
+    EVALUATION_CACHE.clear()
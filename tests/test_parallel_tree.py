@@ -0,0 +1,49 @@
+import torch
+
+from lib.ml.othello_model import OthelloModel
+from lib.ml.run import NUM_BLOCKS, NUM_FILTERS
+from lib.montecarlo.budget import SearchBudget
+from lib.montecarlo.nodes import Node
+from lib.montecarlo.tree import Tree
+
+
+def assert_no_virtual_loss(node):
+    if node.children:
+        assert not node.child_virtual_loss.any()
+        for child in node.children:
+            assert_no_virtual_loss(child)
+
+
+def test_threads_share_one_tree(tmp_path, start_state):
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+
+    tree = Tree(Node(start_state), threads=4)
+    budget = SearchBudget(120, early_stop=False)
+    tree.run_parallel_simulations(budget, model, batch_size=4)
+
+    assert budget.completed == 120
+    assert tree.root.visit_count == 120
+    assert not tree.pending
+    assert_no_virtual_loss(tree.root)
+
+
+def test_threads_with_rollouts(start_state):
+    tree = Tree(Node(start_state), threads=3)
+    node, all_move_visits = tree.best_move(60, None)
+
+    assert node in tree.root.children
+    assert sum(all_move_visits) == tree.root.visit_count
+    assert_no_virtual_loss(tree.root)
+
+
+def test_threads_play_batched_rollouts(start_state):
+    tree = Tree(Node(start_state), threads=3, rollouts_per_leaf=4)
+    budget = SearchBudget(120, early_stop=False)
+    tree.run_parallel_simulations(budget, None, batch_size=5)
+
+    assert budget.completed == 120
+    # Every leaf played rollouts_per_leaf games
+    assert tree.root.visit_count == 120
+    assert all(child.visit_count % 4 == 0 for child in tree.root.children)
+    assert_no_virtual_loss(tree.root)
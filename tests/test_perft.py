@@ -0,0 +1,29 @@
+from lib.montecarlo.perft import ENGINES, START_PERFT, divide, perft, \
+    random_position
+
+
+def test_start_position(start_state):
+    board = start_state.board
+    for depth in range(7):
+        assert perft(board, 1, depth) == START_PERFT[depth]
+    assert perft(board, 1, 5, "gamestate") == START_PERFT[5]
+
+
+def test_engines_agree():
+    # Seeds 0-2 are midgame positions, seed 294 starts with a pass
+    for plies, seed in ((20, 0), (30, 1), (40, 2), (52, 294)):
+        board, next_player = random_position(plies, seed)
+        counts = {perft(board, next_player, 4, engine) for engine in ENGINES}
+        assert len(counts) == 1
+
+
+def test_pass_counts_as_a_move():
+    # Player 1 can't move, player 2 takes [0, 2] and wipes player 1 out
+    board = [[0] * 8 for _ in range(8)]
+    board[0][0] = 2
+    board[0][1] = 1
+    for engine in ENGINES:
+        assert [perft(board, 1, depth, engine) for depth in range(5)] == \
+            [1, 1, 1, 1, 1]
+    assert divide(board, 1, 2) == {(None, None): 1}
+    assert divide(board, 2, 2) == {(0, 2): 1}
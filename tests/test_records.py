@@ -0,0 +1,49 @@
+import json
+
+from lib.ml.records import append_records, read_records
+from lib.montecarlo.game import initial_state
+
+
+def make_record(winloss):
+    return {
+        "created_by": 1,
+        "bitboards": [0x0000001008000000, 0x0000000810000000],
+        "move_visits": [0] * 64,
+        "winloss": winloss
+    }
+
+
+def test_append_and_read(tmp_path):
+    path = str(tmp_path / "training.jsonl")
+
+    append_records(path, [make_record(1), make_record(0)])
+    append_records(path, [make_record(0.5)])
+
+    records = read_records(path)
+    assert [record["winloss"] for record in records] == [1, 0, 0.5]
+    assert records[0] == make_record(1)
+
+
+def test_partial_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / "training.jsonl")
+
+    append_records(path, [make_record(1)])
+    # Simulate a writer killed mid-line
+    with open(path, "a") as outfile:
+        outfile.write(json.dumps(make_record(0))[:20])
+
+    assert read_records(path) == [make_record(1)]
+
+
+def test_read_legacy_json(tmp_path):
+    path = str(tmp_path / "training.json")
+    board = initial_state().board
+    with open(path, "w") as outfile:
+        json.dump([{
+            "created_by": 1,
+            "board": board,
+            "move_visits": [0] * 64,
+            "winloss": 1
+        }], outfile)
+
+    assert read_records(path) == [make_record(1)]
@@ -0,0 +1,55 @@
+from lib.ml.records import append_records
+from lib.ml.replay_buffer import ReplayBuffer, replay_loader
+
+
+def make_records(winloss, count):
+    return [{"created_by": 1, "bitboards": [1, 2], "move_visits": [0] * 64,
+             "winloss": winloss}] * count
+
+
+def test_ingests_only_new_records(tmp_path):
+    path = str(tmp_path / "training.jsonl")
+    buffer = ReplayBuffer(str(tmp_path / "replay"), capacity=10)
+
+    append_records(path, make_records(1, 3))
+    assert buffer.ingest([path]) == 3
+    assert buffer.ingest([path]) == 0
+
+    append_records(path, make_records(0, 2))
+    # A partial line is left for the next ingest
+    with open(path, "a") as outfile:
+        outfile.write('{"created_by": 1, "bitb')
+    assert buffer.ingest([path]) == 2
+    assert buffer.generation == 2
+
+    # Reopening picks up where the last ingest stopped
+    buffer = ReplayBuffer(str(tmp_path / "replay"))
+    assert len(buffer) == 5
+    assert buffer.ingest([path]) == 0
+    assert sorted(buffer.columns["winloss"][:5].tolist()) == [0, 0, 1, 1, 1]
+
+
+def test_ring_overwrites_oldest(tmp_path):
+    buffer = ReplayBuffer(str(tmp_path / "replay"), capacity=4)
+    buffer.add(make_records(1, 3))
+    buffer.add(make_records(0, 3))
+
+    assert len(buffer) == 4
+    assert buffer.columns["winloss"].tolist() == [0, 0, 1, 0]
+    assert buffer.columns["generation"].tolist() == [2, 2, 1, 2]
+
+
+def test_recency_weighted_sampling(tmp_path):
+    buffer = ReplayBuffer(str(tmp_path / "replay"), capacity=100)
+    buffer.add(make_records(1, 50))
+    buffer.add(make_records(0, 50))
+
+    uniform = buffer.columns["winloss"][buffer.sample(10000)]
+    assert 0.45 < uniform.mean() < 0.55
+    recent = buffer.columns["winloss"][buffer.sample(10000, recency=0.1)]
+    assert recent.mean() < 0.15
+
+    batches = list(replay_loader(buffer, 20, batch_size=8, num_workers=0))
+    assert len(batches) == 2
+    planes, (values, policies) = batches[0]
+    assert planes.shape == (8, 2, 8, 8) and policies.shape == (8, 64)
@@ -0,0 +1,35 @@
+import random
+
+from lib.montecarlo.game import Move
+from lib.montecarlo.rollout import gamestate_rollout, random_rollout, \
+    rollouts_per_second
+
+
+def test_bitboard_and_gamestate_rollouts_agree(start_state):
+    states = [start_state] + [start_state.move(move)
+                              for move in start_state.get_legal_moves()]
+    for state in states:
+        for seed in range(20):
+            # Both pick from the legal moves in the same order
+            assert random_rollout(*state.bitboards, state.next_player,
+                                  random.Random(seed)) == \
+                gamestate_rollout(state, random.Random(seed))
+
+
+def test_finished_game_returns_its_result(start_state):
+    state = start_state
+    rng = random.Random(0)
+    while not state.game_over():
+        moves = state.get_legal_moves()
+        state = state.move(rng.choice(moves) if moves
+                           else Move(None, None, state.next_player))
+
+    assert random_rollout(*state.bitboards, state.next_player) == \
+        state.game_result()
+    assert gamestate_rollout(state) == state.game_result()
+
+
+def test_rollouts_per_second(start_state):
+    assert rollouts_per_second(start_state, num_rollouts=10) > 0
+    assert rollouts_per_second(start_state, num_rollouts=10,
+                               rollout=gamestate_rollout) > 0
@@ -0,0 +1,17 @@
+import simulator.run
+from lib.ml.records import read_records
+from simulator.run import run_create_training_data
+
+
+def test_workers_play_the_same_seeded_games(tmp_path, monkeypatch):
+    records = {}
+    for workers in (1, 2):
+        path = str(tmp_path / "training{}.jsonl".format(workers))
+        monkeypatch.setattr(simulator.run, "training_data_path", lambda: path)
+        run_create_training_data("mcts", "random", False, games=2,
+                                 workers=workers, seed=7)
+        records[workers] = read_records(path)
+
+    assert records[1]
+    # Workers may finish in either order
+    assert sorted(records[1], key=repr) == sorted(records[2], key=repr)
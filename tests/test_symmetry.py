@@ -0,0 +1,48 @@
+import numpy as np
+
+from lib.ml.symmetry import SYMMETRIES, all_symmetries, inverse, \
+    symmetric_evaluate, transform, transform_examples
+
+
+def test_inverse_undoes_transform():
+    boards = np.arange(2 * 2 * 64).reshape(2, 2, 8, 8)
+    orientations = set()
+    for k in range(SYMMETRIES):
+        assert np.array_equal(transform(transform(boards, k), inverse(k)), boards)
+        orientations.add(transform(boards, k).tobytes())
+    # Every symmetry gives a different orientation
+    assert len(orientations) == SYMMETRIES
+
+
+def test_examples_keep_moves_on_their_squares():
+    boards = np.zeros((SYMMETRIES, 2, 8, 8))
+    policies = np.zeros((SYMMETRIES, 64))
+    # Piece and most visited move both on [2, 3]
+    boards[:, 0, 2, 3] = 1
+    policies[:, 2 * 8 + 3] = 10
+
+    out_boards, out_policies = transform_examples(boards, policies,
+                                                  np.arange(SYMMETRIES))
+    for board, policy in zip(out_boards, out_policies):
+        assert np.array_equal(board[0].reshape(64) * 10, policy)
+
+    expanded = all_symmetries(boards[:1], np.array([1.0]), policies[:1])
+    assert expanded[0].shape == (SYMMETRIES, 2, 8, 8)
+    assert expanded[1].tolist() == [1.0] * SYMMETRIES
+    assert np.array_equal(expanded[0][:, 0].reshape(-1, 64) * 10, expanded[2])
+
+
+def test_symmetric_evaluate_maps_policies_back():
+    planes = np.random.randint(0, 2, size=(3, 2, 8, 8))
+    calls = []
+
+    def evaluate(batch):
+        # A "model" whose policy is its first input plane
+        calls.append(len(batch))
+        return batch.sum(axis=(1, 2, 3)), batch[:, 0].astype(float)
+
+    values, policies = symmetric_evaluate(planes, evaluate, 4)
+
+    assert calls == [12]
+    assert np.allclose(values, planes.sum(axis=(1, 2, 3)))
+    assert np.allclose(policies, planes[:, 0])
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from lib.ml.run import load_model
+from lib.ml.trainer import KEEP_VERSIONS, Trainer
+
+
+def make_batches(count, size=4):
+    rng = np.random.RandomState(0)
+    policies = np.full((size, 64), 1 / 64, dtype=np.float32)
+    return [
+        (rng.randint(0, 2, size=(size, 2, 8, 8)).astype(np.float32),
+         (rng.rand(size).astype(np.float32), policies))
+        for _ in range(count)
+    ]
+
+
+def test_trainer_resumes_model_and_optimizer(tmp_path):
+    directory = str(tmp_path / "checkpoints")
+    trainer = Trainer(directory)
+    # Steps cycle over the batches
+    trainer.train_steps(make_batches(2), 3)
+    assert trainer.step == 3
+    trainer.save()
+
+    resumed = Trainer(directory)
+    assert resumed.step == 3
+    for name, weights in trainer.model.state_dict().items():
+        assert torch.equal(weights, resumed.model.state_dict()[name])
+    # Optimizer moments are restored, not reset
+    state = resumed.optimizer.state_dict()["state"]
+    assert state and all(entry["step"] == 3 for entry in state.values())
+
+
+def test_publish_keeps_newest_versions(tmp_path):
+    directory = str(tmp_path / "checkpoints")
+    trainer = Trainer(directory)
+    for _ in range(KEEP_VERSIONS + 2):
+        trainer.step += 1
+        trainer.publish()
+
+    names = sorted(os.listdir(directory))
+    assert "saved_othello_model.latest" in names
+    assert "saved_othello_model.1" not in names
+    assert "saved_othello_model.{}".format(KEEP_VERSIONS + 2) in names
+    assert not any(name.endswith(".tmp") for name in names)
+
+    # Published weights load like any other model
+    latest = load_model(trainer.model_path("latest")).state_dict()
+    for name, weights in trainer.model.state_dict().items():
+        assert torch.equal(weights, latest[name])
+
+
+def test_trainer_rejects_empty_intervals(tmp_path):
+    trainer = Trainer(str(tmp_path / "checkpoints"))
+    # A loader with no batches can't make progress
+    with pytest.raises(ValueError):
+        trainer.train_steps([], 3)
+    assert trainer.step == 0
+    with pytest.raises(ValueError):
+        trainer.run(None, publish_every=0)
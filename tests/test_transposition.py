@@ -0,0 +1,36 @@
+from lib.montecarlo.game import Move
+from lib.montecarlo.bitboard import zobrist_hash
+from lib.montecarlo.transposition import TranspositionTable
+
+
+def test_transpositions_share_hash(start_state):
+    state = start_state
+
+    # Two move orders reaching the same position
+    first = state.move(Move(2, 4, 1)).move(Move(2, 5, 2)).move(Move(3, 5, 1))
+    second = state.move(Move(3, 5, 1)).move(Move(2, 5, 2)).move(Move(2, 4, 1))
+
+    assert first.bitboards == second.bitboards
+    assert first.zobrist == second.zobrist
+    assert first.zobrist == zobrist_hash(*first.bitboards, first.next_player)
+
+    # Same pieces with the other player to move hash differently
+    passed = first.move(Move(None, None, 2))
+    assert passed.zobrist != first.zobrist
+
+
+def test_table_replaces_least_recently_used(start_state):
+    state = start_state
+    children = [state.move(move) for move in state.get_legal_moves()]
+
+    table = TranspositionTable(max_entries=2)
+    table.store(children[0], 0.1, "policy 0")
+    table.store(children[1], 0.2, "policy 1")
+    assert table.lookup(children[0]) == (0.1, "policy 0")
+    table.store(children[2], 0.3, "policy 2")
+
+    assert len(table) == 2
+    assert table.lookup(children[1]) is None
+    assert table.lookup(children[2]) == (0.3, "policy 2")
+    assert table.hits == 2
+    assert table.misses == 1
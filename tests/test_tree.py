@@ -0,0 +1,49 @@
+import torch
+
+from lib.ml.othello_model import OthelloModel
+from lib.ml.run import EVALUATION_CACHE, NUM_BLOCKS, NUM_FILTERS
+from lib.montecarlo.nodes import Node
+from lib.montecarlo.tree import Tree
+
+
+def virtual_loss(node):
+    """Total virtual loss left anywhere under node."""
+    return node.virtual_loss + sum(virtual_loss(child)
+                                   for child in node.children)
+
+
+def test_simulate_batch(tmp_path, start_state):
+    model = str(tmp_path / "saved_othello_model.1")
+    torch.save(OthelloModel(NUM_FILTERS, NUM_BLOCKS).state_dict(), model)
+    EVALUATION_CACHE.clear()
+
+    tree = Tree(Node(start_state))
+    selected = []
+    select_leaves = tree._select_leaves
+
+    def record(batch_size):
+        leaves, completed = select_leaves(batch_size)
+        selected.append(leaves)
+        return leaves, completed
+    tree._select_leaves = record
+
+    sizes = []
+    for _ in range(20):
+        visits = tree.root.visit_count
+        completed = tree.simulate_batch(model, 8)
+        sizes.append(completed)
+
+        # Visits increase by exactly the simulations completed
+        assert tree.root.visit_count == visits + completed
+        # Evaluated leaves are no longer pending and their virtual loss is
+        # reverted along the whole path
+        assert not tree.pending
+        assert virtual_loss(tree.root) == 0
+        # No leaf is expanded twice within a batch
+        leaves = selected[-1]
+        assert len({id(leaf) for leaf in leaves}) == len(leaves)
+
+    # Once the tree is wide enough every batch is full
+    assert 0 < min(sizes) and max(sizes) <= 8
+    assert sizes[-5:] == [8] * 5
+    EVALUATION_CACHE.clear()